@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# scripts/bench_chunker.py
+"""
+Бенчмарк разбиения: RecursiveCharacterTextSplitter против TokenChunker
+
+Синтетический текст в формате PDFProcessor (заголовок, маркеры
+`--- СТРАНИЦА N ---`, абзацы разной длины на русском и английском).
+Сравниваются время разбиения и разброс размеров частей в токенах.
+
+    python scripts/bench_chunker.py --megabytes 8
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import tiktoken
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.app.services.chunker import TokenChunker  # noqa: E402
+from src.app.services.ingest_embedder import EMBEDDING_ENCODING  # noqa: E402
+
+WORDS = (
+    "договор сторона обязательство оплата поставка срок условия ответственность "
+    "документ приложение пункт раздел порядок исполнение требование уведомление "
+    "contract party payment delivery term liability notice section clause annex"
+).split()
+
+
+def synthetic_text(megabytes: float, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = ["# Синтетический документ"]
+    size = 0
+    page = 0
+    while size < megabytes * 1024 * 1024:
+        page += 1
+        parts.append(f"\n\n--- СТРАНИЦА {page} ---\n\n")
+        for _ in range(rng.randint(3, 8)):
+            sentences = [
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 25))).capitalize() + "."
+                for _ in range(rng.randint(1, 12))
+            ]
+            paragraph = " ".join(sentences)
+            parts.append(paragraph + "\n\n")
+            size += len(paragraph.encode("utf-8"))
+    return "".join(parts)
+
+
+def describe(name: str, seconds: float, texts, encoding, megabytes: float):
+    tokens = [len(t) for t in encoding.encode_ordinary_batch(texts)]
+    print(f"{name:<12}{seconds:>9.2f}{megabytes / seconds:>9.1f}{len(texts):>9}"
+          f"{min(tokens):>7}{statistics.mean(tokens):>8.0f}{max(tokens):>7}"
+          f"{statistics.pstdev(tokens):>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--megabytes", type=float, default=8.0, help="объем текста")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="символов (RecursiveCharacterTextSplitter)")
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--chunk-tokens", type=int, default=300, help="токенов (TokenChunker)")
+    parser.add_argument("--overlap-tokens", type=int, default=50)
+    args = parser.parse_args()
+
+    text = synthetic_text(args.megabytes)
+    megabytes = len(text.encode("utf-8")) / 1024 / 1024
+    encoding = tiktoken.get_encoding(EMBEDDING_ENCODING)
+    print(f"📊 Текст {megabytes:.1f} МБ, {text.count('--- СТРАНИЦА')} страниц")
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        length_function=len,
+    )
+    started = time.perf_counter()
+    recursive_chunks = splitter.split_text(text)
+    recursive_s = time.perf_counter() - started
+    # Ingest после сплиттера по символам считает токены каждой части для пакетирования
+    started = time.perf_counter()
+    for chunk in recursive_chunks:
+        encoding.encode(chunk, disallowed_special=())
+    counting_s = time.perf_counter() - started
+
+    chunker = TokenChunker(args.chunk_tokens, args.overlap_tokens, encoding=encoding)
+    started = time.perf_counter()
+    token_chunks = chunker.split_text(text)
+    token_s = time.perf_counter() - started
+
+    # Время TokenChunker уже включает подсчет токенов: "+ токены" - сплиттер по
+    # символам вместе с подсчетом, который ingest делает для пакетирования
+    print(f"{'сплиттер':<12}{'время, с':>9}{'МБ/с':>9}{'частей':>9}"
+          f"{'min':>7}{'mean':>8}{'max':>7}{'stdev':>8}  (токенов в части)")
+    describe("recursive", recursive_s, recursive_chunks, encoding, megabytes)
+    describe("+ токены", recursive_s + counting_s, recursive_chunks, encoding, megabytes)
+    describe("tokens", token_s, [t for t, _, _ in token_chunks], encoding, megabytes)
+
+
+if __name__ == "__main__":
+    main()
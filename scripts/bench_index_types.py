@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# scripts/bench_index_types.py
+"""
+Бенчмарк типов FAISS индексов: recall@k относительно flat, латентность и память
+
+Синтетический корпус - смесь гауссовых кластеров (похоже на эмбеддинги
+тематически сгруппированных чанков). Индексы строятся теми же функциями,
+что и в scripts/ingest.py, с параметрами поиска как в приложении.
+
+    python scripts/bench_index_types.py --corpus 100000 --dim 384
+"""
+
+import argparse
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.app.services.index_types import (  # noqa: E402
+    INDEX_TYPES,
+    apply_search_params,
+    build_index,
+    resolve_params,
+)
+
+
+def synthetic_corpus(size: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=size)
+    data = centers[labels] + 0.35 * rng.normal(size=(size, dim)).astype(np.float32)
+    return np.ascontiguousarray(data, dtype=np.float32)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def index_memory_mb(index: faiss.Index) -> float:
+    return len(faiss.serialize_index(index)) / 1024 / 1024
+
+
+def bench(index_type: str, params, corpus, queries, truth, k: int):
+    index = build_index(index_type, corpus.shape[1], params)
+
+    started = time.perf_counter()
+    if not index.is_trained:
+        index.train(corpus)
+    index.add(corpus)
+    build_s = time.perf_counter() - started
+    apply_search_params(index, {"index_type": index_type, "index_params": params})
+
+    # Латентность одиночных запросов, как их делает приложение
+    latencies = []
+    found = []
+    for query in queries:
+        started = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - started)
+        found.append(ids[0])
+    latencies.sort()
+
+    return {
+        "type": index_type,
+        "build_s": build_s,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "recall": recall_at_k(np.array(found), truth),
+        "memory_mb": index_memory_mb(index),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", type=int, default=100_000, help="число чанков")
+    parser.add_argument("--dim", type=int, default=384, help="размерность (ada-002: 1536)")
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--nlist", type=int)
+    parser.add_argument("--nprobe", type=int)
+    parser.add_argument("--pq-m", type=int)
+    parser.add_argument("--pq-bits", type=int)
+    parser.add_argument("--hnsw-m", type=int)
+    parser.add_argument("--ef-construction", type=int)
+    parser.add_argument("--ef-search", type=int)
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)  # честное сравнение одиночных запросов
+    print(f"📊 Корпус {args.corpus} x {args.dim}, {args.queries} запросов, k={args.k}")
+
+    corpus = synthetic_corpus(args.corpus, args.dim, args.clusters)
+    queries = corpus[np.random.default_rng(1).choice(len(corpus), args.queries, replace=False)]
+    queries = queries + 0.1 * np.random.default_rng(2).normal(size=queries.shape).astype(np.float32)
+
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(corpus)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"{'тип':<10}{'recall@k':>10}{'p50, мс':>10}{'p99, мс':>10}{'память, МБ':>12}{'сборка, с':>11}")
+    for index_type in args.types:
+        params = resolve_params(index_type, vars(args))
+        result = bench(index_type, params, corpus, queries, truth, args.k)
+        print(f"{result['type']:<10}{result['recall']:>10.3f}{result['p50_ms']:>10.3f}"
+              f"{result['p99_ms']:>10.3f}{result['memory_mb']:>12.1f}{result['build_s']:>11.1f}")
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Пиковый RSS процесса: {peak_mb:.0f} МБ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# scripts/bench_query_batching.py
+"""
+Бенчмарк пакетной обработки запросов к индексу (query_index_async)
+
+Сравнивает p50/p99 латентность и число запросов к API эмбеддингов при
+одновременной нагрузке: каждый запрос отдельно против MicroBatcher.
+Задержка API эмбеддингов моделируется, поэтому ключ OpenAI не нужен.
+
+    python scripts/bench_query_batching.py --concurrency 64 --requests 1000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+from langchain_community.docstore.in_memory import InMemoryDocstore  # noqa: E402
+from langchain_community.vectorstores import FAISS  # noqa: E402
+from langchain_core.documents import Document  # noqa: E402
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from src.app.services.batching import MicroBatcher  # noqa: E402
+from src.app.services.faiss_index import search_batch  # noqa: E402
+
+
+class SimulatedEmbeddings(Embeddings):
+    """Эмбеддинги с задержкой, похожей на HTTP запрос к OpenAI"""
+
+    def __init__(self, dim: int, base_latency: float, per_text_latency: float):
+        self.dim = dim
+        self.base_latency = base_latency
+        self.per_text_latency = per_text_latency
+        self.api_calls = 0
+
+    def _vector(self, text: str):
+        rng = np.random.default_rng(abs(hash(text)) % (2 ** 32))
+        return rng.random(self.dim, dtype=np.float32).tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+    async def aembed_documents(self, texts):
+        self.api_calls += 1
+        await asyncio.sleep(self.base_latency + self.per_text_latency * len(texts))
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+
+def build_store(embedder: SimulatedEmbeddings, size: int) -> FAISS:
+    vectors = np.random.default_rng(0).random((size, embedder.dim), dtype=np.float32)
+    index = faiss.IndexFlatL2(embedder.dim)
+    index.add(vectors)
+    ids = {i: str(i) for i in range(size)}
+    docstore = InMemoryDocstore({str(i): Document(page_content=f"chunk {i}") for i in range(size)})
+    return FAISS(embedder, index, docstore, ids)
+
+
+async def run_load(search, concurrency: int, total: int, k: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await search(f"вопрос пользователя {i}", k)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return latencies, time.perf_counter() - started
+
+
+def report(name: str, latencies, wall: float, api_calls: int):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{name:<12} p50={p50:8.1f} мс  p99={p99:8.1f} мс  "
+          f"{len(latencies) / wall:8.1f} зап/с  запросов к API: {api_calls}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--corpus", type=int, default=20000, help="число чанков в индексе")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--api-latency-ms", type=float, default=60.0)
+    parser.add_argument("--per-text-ms", type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(f"📊 Корпус {args.corpus} x {args.dim}, {args.requests} запросов, "
+          f"параллельно {args.concurrency}")
+
+    # Без пакетов: отдельный запрос эмбеддинга и отдельный поиск на каждый вопрос
+    embedder = SimulatedEmbeddings(args.dim, args.api_latency_ms / 1000, args.per_text_ms / 1000)
+    store = build_store(embedder, args.corpus)
+
+    async def single(query, k):
+        vector = await embedder.aembed_query(query)
+        return await asyncio.to_thread(store.similarity_search_with_score_by_vector, vector, k)
+
+    latencies, wall = await run_load(single, args.concurrency, args.requests, args.k)
+    report("без пакетов", latencies, wall, embedder.api_calls)
+
+    # С пакетами: MicroBatcher + search_batch, как в query_index_async
+    embedder.api_calls = 0
+    batcher = MicroBatcher(
+        lambda items: search_batch(lambda: store, embedder, items),
+        window=args.window_ms / 1000,
+        max_batch_size=args.max_batch,
+    )
+
+    async def batched(query, k):
+        return await batcher.submit((query, k))
+
+    latencies, wall = await run_load(batched, args.concurrency, args.requests, args.k)
+    report("пакеты", latencies, wall, embedder.api_calls)
+    print(f"   средний размер пакета: {batcher.stats()['avg_batch_size']:.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
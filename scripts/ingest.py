@@ -1,41 +1,71 @@
 #!/usr/bin/env python3
 # scripts/ingest.py
 
+import argparse
+import asyncio
+import cProfile
 import os
+import sys
 from pathlib import Path
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
 from dotenv import load_dotenv
 
-def load_documents(folder_path: Path):
-    """Загружает документы из папки"""
-    docs = []
-    supported_extensions = {'.pdf', '.txt', '.md'}
-    
-    print(f"🔍 Сканируем папку: {folder_path}")
-    
-    for file in folder_path.glob("*"):
-        if file.suffix.lower() in supported_extensions:
-            print(f"📄 Обрабатываем: {file.name}")
-            try:
-                if file.suffix.lower() == ".pdf":
-                    loader = PyPDFLoader(str(file))
-                else:
-                    loader = TextLoader(str(file), encoding="utf-8")
-                file_docs = loader.load()
-                docs.extend(file_docs)
-                print(f"  ✅ Загружено {len(file_docs)} частей")
-            except Exception as e:
-                print(f"  ❌ Ошибка загрузки {file.name}: {e}")
-                continue
-        else:
-            print(f"  ⏩ Пропускаем {file.name} (неподдерживаемый формат)")
-    
-    return docs
+# Позволяет запускать скрипт как `python scripts/ingest.py` из корня проекта
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.app.services.index_types import INDEX_TYPES, build_index, resolve_params, train_size
+from src.app.services.ingest_embedder import ConcurrentEmbedder, EmbeddingFailed
+from src.app.services.ingest_manifest import Manifest, file_sha256, scan_documents
+from src.app.services.chunker import DEFAULT_CHUNK_TOKENS, DEFAULT_OVERLAP_TOKENS, TokenChunker
+from src.app.services.document_loader import PDF_LOADER, load_document
+from src.app.services.ingest_metrics import REPORTS_DIR, IngestMetrics
+from src.app.services.ingest_pipeline import IngestPipeline, ParallelLoader, drop_sources
+
+# Размер части и перекрытие в токенах модели эмбеддингов
+CHUNK_TOKENS = DEFAULT_CHUNK_TOKENS
+CHUNK_OVERLAP_TOKENS = DEFAULT_OVERLAP_TOKENS
+
+SUPPORTED_EXTENSIONS = {'.pdf', '.txt', '.md'}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Создание FAISS индекса для документов")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                        help="тип FAISS индекса (по умолчанию точный flat)")
+    parser.add_argument("--nlist", type=int, help="IVF: число кластеров")
+    parser.add_argument("--nprobe", type=int, help="IVF: сколько кластеров просматривать при поиске")
+    parser.add_argument("--pq-m", type=int, help="IVF-PQ: число подвекторов")
+    parser.add_argument("--pq-bits", type=int, help="IVF-PQ: бит на подвектор")
+    parser.add_argument("--hnsw-m", type=int, help="HNSW: число связей на узел")
+    parser.add_argument("--ef-construction", type=int, help="HNSW: ширина поиска при построении")
+    parser.add_argument("--ef-search", type=int, help="HNSW: ширина поиска при запросе")
+    parser.add_argument("--full", action="store_true",
+                        help="пересобрать индекс целиком, игнорируя манифест")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="сколько запросов эмбеддингов держать одновременно")
+    parser.add_argument("--batch-tokens", type=int, default=20_000,
+                        help="максимум токенов в одном запросе эмбеддингов")
+    parser.add_argument("--rpm", type=int, default=3000, help="лимит запросов в минуту")
+    parser.add_argument("--tpm", type=int, default=1_000_000, help="лимит токенов в минуту")
+    parser.add_argument("--max-retries", type=int, default=5,
+                        help="повторов неудачного пакета до остановки ingest")
+    parser.add_argument("--buffer-size", type=int, default=4,
+                        help="сколько готовых пакетов держать между загрузкой и эмбеддингом")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="процессов для разбора PDF (по умолчанию - число ядер)")
+    parser.add_argument("--checkpoint-every", type=int, default=50,
+                        help="сохранять контрольную точку каждые N пакетов (0 - не сохранять)")
+    parser.add_argument("--resume", action="store_true",
+                        help="продолжить прерванный запуск с последней контрольной точки")
+    parser.add_argument("--report", type=Path,
+                        help="куда записать JSON отчет по стадиям (по умолчанию data/faiss_index/reports/<версия>.json)")
+    parser.add_argument("--profile", action="store_true",
+                        help="снять cProfile основного потока рядом с отчетом (<версия>.prof)")
+    return parser.parse_args(argv)
 
 def main():
+    """Код выхода: 0 - индекс собран или актуален, 1 - ошибка, 130 - прервано"""
+    args = parse_args()
+    index_params = resolve_params(args.index_type, vars(args))
+
     print("🚀 СОЗДАНИЕ FAISS ИНДЕКСА ДЛЯ ДОКУМЕНТОВ")
     print("="*50)
     
@@ -48,7 +78,7 @@ def main():
         print("❌ OPENAI_API_KEY не найден в переменных окружения")
         print("💡 Убедитесь, что файл .env содержит:")
         print("   OPENAI_API_KEY=ваш_ключ_здесь")
-        return
+        return 1
     
     print(f"✅ API ключ найден: {api_key[:15]}...")
     
@@ -58,77 +88,278 @@ def main():
         print(f"❌ Папка {docs_folder} не существует")
         print(f"💡 Создайте папку и поместите туда ваши PDF/TXT файлы:")
         print(f"   mkdir -p {docs_folder}")
-        return
+        return 1
     
-    # Загружаем документы
-    docs = load_documents(docs_folder)
+    index_path = Path("data/faiss_index")
+    from src.app.services.embeddings import EMBEDDING_MODEL, create_embeddings
+    from src.app.core.config import settings
+    from src.app.services.index_store import (
+        MANIFEST_FILE,
+        IndexWriter,
+        checkpoint_path,
+        find_checkpoint,
+        gc_versions,
+        is_mmap_index,
+        new_version_path,
+        publish_version,
+        remove_checkpoint,
+        resolve_index,
+    )
+    
+    # Настройки, при изменении которых старые векторы нельзя переиспользовать
+    ingest_settings = {
+        "embedding_model": EMBEDDING_MODEL,
+        "index_type": args.index_type,
+        "index_params": index_params,
+        "chunker": "tokens",
+        "chunk_tokens": CHUNK_TOKENS,
+        "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS,
+        "pdf_loader": PDF_LOADER,
+        "dedup": "sha256",
+    }
+    
+    # Сравниваем файлы с манифестом прошлого запуска
+    print(f"🔍 Сканируем папку: {docs_folder}")
+    files = scan_documents(docs_folder, SUPPORTED_EXTENSIONS)
+    hashes = {name: file_sha256(path) for name, path in files.items()}
+    
+    # Продолжаем с контрольной точки прерванного запуска или от опубликованного индекса.
+    # Контрольная точка - обычный индекс с манифестом, где недописанные файлы
+    # записаны без хэша, поэтому дальше работает та же инкрементальная логика
+    base_path = resolve_index(index_path)
+    checkpoint = find_checkpoint(index_path) if args.resume else None
+    if checkpoint is not None:
+        print(f"⏯️ Продолжаем с контрольной точки: {checkpoint}")
+        base_path = checkpoint
+    else:
+        if args.resume:
+            print("ℹ️ Контрольная точка не найдена - начинаем с опубликованного индекса")
+        remove_checkpoint(index_path)
+    
+    previous = None if args.full and checkpoint is None else Manifest.load(base_path / MANIFEST_FILE)
+    if previous is not None and (previous.settings != ingest_settings or not is_mmap_index(base_path)):
+        print("⚠️ Настройки индекса изменились - пересобираем целиком")
+        previous = None
+    
+    manifest = Manifest(
+        ingest_settings,
+        dict(previous.files) if previous else {},
+        dict(previous.hashes) if previous else {},
+    )
+    diff = manifest.diff(hashes)
+    to_process = diff["added"] + diff["changed"]
+    # Общая с другими файлами часть удаляется, только когда на нее не ссылается ни один оставшийся файл
+    kept_ids = set(manifest.chunk_ids(diff["unchanged"]))
+    outdated_ids = set(manifest.chunk_ids(diff["changed"] + diff["removed"]))
+    to_remove = sorted(outdated_ids - kept_ids)
+    shared_ids = sorted(outdated_ids & kept_ids)
+    reused = len(kept_ids)
     
-    if not docs:
+    print(f"📋 Новых файлов: {len(diff['added'])}, измененных: {len(diff['changed'])}, "
+          f"удаленных: {len(diff['removed'])}, без изменений: {len(diff['unchanged'])}")
+    
+    if previous is not None and checkpoint is None and not to_process and not diff["removed"]:
+        print("✅ Индекс актуален, изменений нет")
+        return
+    
+    if previous is None and not files:
         print("❌ Документы не найдены")
         print(f"💡 Поместите PDF или TXT файлы в папку {docs_folder}")
-        return
+        return 1
     
-    print(f"\n📚 Найдено документов: {len(docs)}")
+    # Создаем embeddings (с кэшем: неизмененные части не эмбеддятся повторно)
+    print("🔧 Инициализируем OpenAI Embeddings...")
+    embeddings = create_embeddings(api_key)
+    
+    # Открываем прошлый индекс (удаляя векторы измененных и удаленных файлов) или создаем новый.
+    # Результат пишется в новую версию: читатели текущей не видят недописанных файлов
+    version_path = new_version_path(index_path)
+    report_path = args.report or index_path / REPORTS_DIR / f"{version_path.name}.json"
+    metrics = IngestMetrics()
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    writer = None
+    if previous is not None:
+        print(f"🔄 Обновляем FAISS индекс: удаляем {len(to_remove)} векторов...")
+        with metrics.stage("open", items=len(to_remove)):
+            writer = IndexWriter.update(
+                base_path,
+                remove=to_remove,
+                target=version_path,
+                checkpoint_dir=checkpoint_path(index_path),
+            )
+        outdated_sources = [str(docs_folder / name) for name in diff["changed"] + diff["removed"]]
+        drop_sources(writer, shared_ids, outdated_sources)
+    else:
+        print(f"🔄 Создаем FAISS индекс ({args.index_type}, параметры: {index_params})...")
+    for name in diff["changed"] + diff["removed"]:
+        manifest.forget(name)
     
-    # Разбиваем на части
-    print("✂️ Разбиваем документы на части...")
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, 
-        chunk_overlap=200,
-        length_function=len,
+    embedder = ConcurrentEmbedder(
+        embeddings,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        max_retries=args.max_retries,
     )
-    texts = splitter.split_documents(docs)
-    print(f"📝 Создано частей: {len(texts)}")
+    splitter = TokenChunker(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
     
-    # Создаем embeddings
-    print("🔧 Инициализируем OpenAI Embeddings...")
-    embeddings = OpenAIEmbeddings(
-        openai_api_key=api_key,
-        model="text-embedding-ada-002"
+    def save_checkpoint(writer, completed):
+        # Недописанные файлы - без хэша: при продолжении их части удалятся и файл обработается заново
+        state = Manifest(ingest_settings, dict(manifest.files), dict(manifest.hashes))
+        completed = set(completed)
+        for name, ids in pipeline.added_ids.items():
+            if ids or name in completed:
+                state.record(
+                    name,
+                    hashes[name] if name in completed else None,
+                    list(ids),
+                    {chunk_id: pipeline.chunk_hashes[chunk_id] for chunk_id in ids},
+                )
+        if not writer.checkpoint(ingest_settings, manifest=state.to_dict()):
+            return False
+        print(f"  💾 Контрольная точка: {len(completed)} файлов, {writer.count} векторов")
+        return True
+    
+    loader = ParallelLoader(args.workers)
+    pipeline = IngestPipeline(
+        load_document,
+        splitter.split_documents,
+        embedder,
+        batch_tokens=args.batch_tokens,
+        buffer_size=args.buffer_size,
+        checkpoint=save_checkpoint if args.checkpoint_every > 0 else None,
+        checkpoint_every=args.checkpoint_every,
+        loader=loader,
+        metrics=metrics,
     )
     
-    # Создаем FAISS индекс по частям
-    print("🔄 Создаем FAISS индекс...")
-    index_path = Path("data/faiss_index")
+    def write_report(status):
+        # Отчет пишется и при ошибке: по нему видно, на какой стадии застрял запуск
+        if profiler is not None:
+            profiler.disable()
+        metrics.write(
+            report_path,
+            status=status,
+            index_version=version_path.name,
+            settings=ingest_settings,
+            files={key: len(value) for key, value in diff.items()},
+            vectors=writer.count if writer is not None else 0,
+            pipeline=pipeline.stats,
+            loader=dict(loader.stats, workers=loader.workers),
+            embedder=dict(embedder.stats, concurrency=args.concurrency),
+            embedding_cache=embeddings.stats(),
+            failed=pipeline.failed,
+        )
+        print(f"📈 Отчет по стадиям: {report_path}")
+        if profiler is not None:
+            profiler.dump_stats(report_path.with_suffix(".prof"))
+            print(f"🔬 Профиль: {report_path.with_suffix('.prof')} (python -m pstats)")
+    
+    def create_writer(dim):
+        return IndexWriter(
+            version_path,
+            build_index(args.index_type, dim, index_params),
+            train_size=train_size(args.index_type, index_params),
+            checkpoint_dir=checkpoint_path(index_path),
+        )
+    
+    # Загрузка, разбиение, эмбеддинг и запись в индекс идут потоком и одновременно
+    print(f"⚡ Конвейер: разбор в {loader.workers} процессах, до {args.concurrency} запросов эмбеддингов одновременно, "
+          f"до {args.batch_tokens} токенов в запросе")
+    try:
+        writer = asyncio.run(
+            pipeline.run(
+                {name: files[name] for name in to_process},
+                writer,
+                create_writer,
+                known=manifest.content_index(),
+            )
+        )
+    except EmbeddingFailed as e:
+        print(f"❌ {e}")
+        write_report("failed")
+        print("💡 Продолжите с контрольной точки: python scripts/ingest.py --resume")
+        return 1
+    except ValueError as e:
+        # Например, векторов не хватает для обучения IVF индекса
+        print(f"❌ {e}")
+        write_report("failed")
+        return 1
+    except KeyboardInterrupt:
+        print("\n⏹️ Прервано")
+        write_report("interrupted")
+        print("💡 Продолжите с контрольной точки: python scripts/ingest.py --resume")
+        return 130
+    except Exception as e:
+        # Неожиданная ошибка: отчет и код выхода важнее трассировки
+        print(f"❌ Ошибка индексации: {type(e).__name__}: {e}")
+        write_report("failed")
+        print("💡 Продолжите с контрольной точки: python scripts/ingest.py --resume")
+        return 1
     
-    batch_size = 50  # Уменьшенный размер батча для стабильности
-    vectorstore = None
-    
-    total_batches = (len(texts) + batch_size - 1) // batch_size
-    
-    for i in range(0, len(texts), batch_size):
-        batch_num = i // batch_size + 1
-        batch = texts[i:i+batch_size]
-        
-        print(f"  📦 Обрабатываем батч {batch_num}/{total_batches} ({len(batch)} частей)...")
-        
-        try:
-            if vectorstore is None:
-                vectorstore = FAISS.from_documents(batch, embeddings)
-                print(f"    ✅ Создан базовый индекс")
-            else:
-                vectorstore.add_documents(batch)
-                print(f"    ✅ Добавлен батч в индекс")
-                
-        except Exception as e:
-            print(f"    ❌ Ошибка обработки батча {batch_num}: {e}")
-            continue
-    
-    if vectorstore is None:
+    if writer is None:
         print("❌ Не удалось создать векторное хранилище")
-        return
+        return 1
+    
+    added_ids = pipeline.added_ids
+    failed = pipeline.failed
+    
+    # Непрочитанные файлы не получают хэш - следующий запуск обработает их заново
+    for name in to_process:
+        manifest.record(
+            name,
+            None if name in failed else hashes[name],
+            added_ids[name],
+            {chunk_id: pipeline.chunk_hashes[chunk_id] for chunk_id in added_ids[name]},
+        )
     
-    # Сохраняем индекс
+    # Сохраняем индекс в mmap формате (без pickle docstore) в новый каталог версии
     print("💾 Сохраняем FAISS индекс...")
-    index_path.mkdir(parents=True, exist_ok=True)
-    vectorstore.save_local(str(index_path))
+    try:
+        with metrics.stage("save", items=writer.count):
+            writer.commit(ingest_settings, manifest=manifest.to_dict())
+    except ValueError as e:
+        writer.abort()
+        print(f"❌ {e}")
+        write_report("failed")
+        return 1
+    # Переключаем CURRENT: работающее приложение подхватит версию без перезапуска
+    publish_version(index_path, version_path)
+    remove_checkpoint(index_path)
+    removed_versions = gc_versions(index_path, settings.faiss_version_grace_seconds)
     
+    added = pipeline.stats["chunks"] - pipeline.stats["duplicates"]
     print(f"\n🎉 УСПЕШНО ЗАВЕРШЕНО!")
     print(f"📊 Статистика:")
-    print(f"  • Документов обработано: {len(docs)}")
-    print(f"  • Частей создано: {len(texts)}")
-    print(f"  • Индекс сохранен в: {index_path}")
+    print(f"  • Файлов обработано: {pipeline.stats['files']}")
+    load_stats = loader.stats
+    if load_stats["seconds"] > 0:
+        print(f"  • Разбор: {load_stats['pages']} страниц, {load_stats['bytes'] / 1024 / 1024:.1f} МБ "
+              f"за {load_stats['seconds']:.1f} с ({load_stats['pages'] / load_stats['seconds']:.0f} стр/с, "
+              f"{load_stats['cpu_seconds']:.1f} с CPU в {loader.workers} процессах)")
+    if pipeline.stats["chunks"]:
+        duplicates = pipeline.stats["duplicates"]
+        print(f"  • Дубликатов: {duplicates} из {pipeline.stats['chunks']} частей "
+              f"({duplicates / pipeline.stats['chunks']:.1%}) - не эмбеддились и не хранятся повторно")
+    print(f"  • Частей добавлено: {added}")
+    print(f"  • Частей удалено: {len(to_remove)}")
+    print(f"  • Частей переиспользовано: {reused}")
+    print(f"  • Векторов в индексе: {writer.count}")
+    print(f"  • Индекс сохранен в: {version_path}")
+    if removed_versions:
+        print(f"  • Удалено старых версий: {len(removed_versions)}")
+    if failed:
+        print(f"  ⚠️ Файлов с ошибками (будут повторены): {len(failed)}")
+    if pipeline.stats["checkpoints"]:
+        print(f"  • Контрольных точек: {pipeline.stats['checkpoints']}")
+    print(f"  • Запросов эмбеддингов: {embedder.stats['requests']}, повторов: {embedder.stats['retries']}")
+    cache_stats = embeddings.stats()
+    print(f"  • Кэш эмбеддингов: {cache_stats['hits'] + cache_stats['disk_hits']} попаданий, "
+          f"{cache_stats['misses']} промахов")
+    write_report("ok")
     print(f"\n💡 Теперь можно запускать приложение: uvicorn src.app.main:app --reload")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
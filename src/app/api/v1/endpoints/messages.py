@@ -1,5 +1,9 @@
 # src/app/api/v1/endpoints/messages.py
+import asyncio
+import json
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -7,8 +11,9 @@ from typing import List, Optional, Dict, Any
 
 from src.app.db.models import Message
 from src.app.db.session import SessionLocal
-from src.app.services.faiss_index import query_index
+from src.app.services.faiss_index import query_index_async
 from src.app.core.config import settings
+from src.app.core.logger import logger
 
 class MessageRequest(BaseModel):
     thread_id: str
@@ -28,6 +33,9 @@ class MessageReply(BaseModel):
 
 router = APIRouter()
 
+# Как часто слать комментарий в SSE, пока ассистент не прислал новый текст
+SSE_HEARTBEAT_SECONDS = 15.0
+
 async def get_session():
     async with SessionLocal() as session:
         yield session
@@ -48,7 +56,7 @@ async def post_message(req: MessageRequest, session: AsyncSession = Depends(get_
 
     try:
         # Ищем релевантные документы
-        relevant_docs = query_index(req.message, k=5)
+        relevant_docs = await query_index_async(req.message, k=5)
         
         # Фильтруем только самые релевантные (score < 1.0 обычно означает хорошее совпадение)
         good_docs = [doc for doc in relevant_docs if doc['score'] < 1.2]
@@ -89,21 +97,22 @@ async def post_message(req: MessageRequest, session: AsyncSession = Depends(get_
         
         if not assistant_response["success"]:
             raise HTTPException(
-                status_code=500,
+                status_code=assistant_response.get("status_code", 500),
                 detail=assistant_response["error"]
             )
             
         reply_text = assistant_response["content"]
         
-        # Сохраняем ответ
-        assistant_msg = Message(
-            thread_id=req.thread_id, 
-            role="assistant", 
-            content=reply_text, 
-            timestamp=datetime.utcnow()
-        )
-        session.add(assistant_msg)
-        await session.commit()
+        # Сохраняем ответ (на объединенные в один run сообщения - один раз)
+        if not assistant_response.get("duplicate_reply"):
+            assistant_msg = Message(
+                thread_id=req.thread_id,
+                role="assistant",
+                content=reply_text,
+                timestamp=datetime.utcnow()
+            )
+            session.add(assistant_msg)
+            await session.commit()
 
         # Подготавливаем отладочную информацию
         debug_info = None
@@ -124,7 +133,10 @@ async def post_message(req: MessageRequest, session: AsyncSession = Depends(get_
                 ],
                 "full_context": context,
                 "model_used": assistant_response.get("model", "gpt-4o"),
-                "tokens_used": assistant_response.get("usage", {}).get("total_tokens", 0)
+                "tokens_used": (
+                    assistant_response.get("usage", {}).get("total_tokens", 0)
+                ),
+                "run_timings": assistant_response.get("timings")
             }
 
         return MessageReply(
@@ -134,6 +146,8 @@ async def post_message(req: MessageRequest, session: AsyncSession = Depends(get_
             debug_info=debug_info
         )
         
+    except HTTPException:
+        raise
     except FileNotFoundError:
         raise HTTPException(
             status_code=503, 
@@ -144,3 +158,88 @@ async def post_message(req: MessageRequest, session: AsyncSession = Depends(get_
             status_code=500, 
             detail=f"Ошибка обработки запроса: {str(e)}"
         )
+
+
+def sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/stream")
+async def post_message_stream(
+    req: MessageRequest, session: AsyncSession = Depends(get_session)
+):
+    """
+    То же, что POST /, но ответ приходит Server-Sent Events по мере генерации
+
+    - event: delta - очередной фрагмент текста ({"text": ...})
+    - event: done - ответ целиком ({"reply", "sources_used", "timings"})
+    - event: error - ошибка ({"detail": ...})
+
+    Полный ответ сохраняется в историю после завершения потока.
+    """
+    from src.app.services.assistant_service import cf_anatolik_service
+
+    # Сохраняем входящее сообщение
+    session.add(Message(
+        thread_id=req.thread_id,
+        role="user",
+        content=req.message,
+        timestamp=datetime.utcnow()
+    ))
+    await session.commit()
+
+    async def events():
+        # Источники из локального индекса ищем одновременно с генерацией ответа.
+        # Задача создается здесь, а не до ответа: если клиент отключится раньше,
+        # чем начнется тело, генератор не запустится и задача не появится
+        sources = asyncio.create_task(query_index_async(req.message, k=5))
+        try:
+            async for event in cf_anatolik_service.stream_assistant(
+                req.message, req.thread_id, heartbeat=SSE_HEARTBEAT_SECONDS
+            ):
+                if event is None:
+                    # Комментарий не дает прокси закрыть соединение, пока run в очереди
+                    yield ": ping\n\n"
+                elif event["event"] == "delta":
+                    yield sse("delta", {"text": event["text"]})
+                elif not event["success"]:
+                    yield sse("error", {
+                        "detail": event["error"],
+                        "status_code": event.get("status_code", 500),
+                    })
+                else:
+                    # Сессия запроса к этому моменту уже закрыта -
+                    # ответ сохраняем в своей
+                    if not event.get("duplicate_reply"):
+                        async with SessionLocal() as reply_session:
+                            reply_session.add(Message(
+                                thread_id=req.thread_id,
+                                role="assistant",
+                                content=event["content"],
+                                timestamp=datetime.utcnow()
+                            ))
+                            await reply_session.commit()
+                    try:
+                        found = await sources
+                        sources_used = len([doc for doc in found if doc['score'] < 1.2])
+                    except Exception as e:
+                        # Ответ уже получен - без локального индекса
+                        # просто не считаем источники
+                        logger.warning(f"Не удалось найти источники в индексе: {e}")
+                        sources_used = 0
+                    yield sse("done", {
+                        "reply": event["content"],
+                        "sources_used": sources_used,
+                        "timings": event.get("timings")
+                    })
+        except Exception as e:
+            yield sse("error", {"detail": f"Ошибка обработки запроса: {str(e)}"})
+        finally:
+            sources.cancel()
+            await asyncio.gather(sources, return_exceptions=True)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,21 +1,35 @@
 # src/app/api/v1/endpoints/upload.py
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pathlib import Path
 import tempfile
 import os
+import json
+import hashlib
 from typing import Dict, Any, Optional, List
-import aiofiles
 import uuid
 from datetime import datetime
 from pydantic import BaseModel
 
-from src.app.services.pdf_processor import PDFProcessor
+from src.app.services.pdf_processor import PDFProcessor, process_pdf_file
+from src.app.services.pdf_pool import pdf_pool
 from src.app.services.openai_vector_service import OpenAIVectorStoreService
+from src.app.services.upload_jobs import QueueFull, UploadJob, upload_jobs
+from src.app.services.upload_registry import upload_registry
+from src.app.services.upload_storage import (
+    MAX_BATCH_FILES,
+    UploadRejected,
+    UploadTooLarge,
+    spool_upload,
+)
+from src.app.core.config import settings
 from src.app.core.logger import logger
 
 router = APIRouter()
 
+# Как часто слать комментарий в SSE, пока у задачи нет новых событий
+SSE_HEARTBEAT_SECONDS = 15.0
+
 class UploadResponse(BaseModel):
     success: bool
     message: str
@@ -30,9 +44,19 @@ class PDFUploadService:
         self.vector_service = OpenAIVectorStoreService()
         self.upload_dir = Path("data/uploads")
         self.upload_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = settings.upload_max_mb * 1024 * 1024
+        self.chunk_size = settings.upload_chunk_kb * 1024
     
     async def process_pdf_upload(self, file: UploadFile, process_async: bool = False) -> Dict[str, Any]:
         """Обрабатывает загруженный PDF файл"""
+        saved = await self.receive_upload(file)
+        return await self.process_saved_upload(**saved)
+
+    async def receive_upload(self, file: UploadFile) -> Dict[str, Any]:
+        """Проверяет и сохраняет загрузку на диск
+
+        Разбор и загрузка в OpenAI - process_saved_upload.
+        """
         
         # Проверяем тип файла
         if not file.filename.lower().endswith('.pdf'):
@@ -43,26 +67,56 @@ class PDFUploadService:
         safe_filename = f"{file_id}_{file.filename}"
         file_path = self.upload_dir / safe_filename
         
+        # Копируем загрузку на диск блоками, проверяя размер и сигнатуру PDF
+        # и считая SHA-256 для реестра загрузок по ходу
+        hasher = hashlib.sha256()
         try:
-            # Сохраняем загруженный файл
-            async with aiofiles.open(file_path, 'wb') as f:
-                content = await file.read()
-                await f.write(content)
-            
-            logger.info(f"Файл сохранен: {file_path} ({len(content)} bytes)")
+            file_size = await spool_upload(
+                file, file_path, self.max_bytes, self.chunk_size, hasher=hasher
+            )
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except UploadRejected as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        logger.info(f"Файл сохранен: {file_path} ({file_size} bytes)")
+        return {
+            "filename": file.filename,
+            "file_id": file_id,
+            "file_path": file_path,
+            "file_size": file_size,
+            "sha256": hasher.hexdigest(),
+        }
+
+    async def process_saved_upload(
+        self,
+        filename: str,
+        file_id: str,
+        file_path: Path,
+        file_size: int,
+        sha256: Optional[str] = None,
+        job: Optional[UploadJob] = None,
+    ) -> Dict[str, Any]:
+        """Разбирает сохраненный PDF и загружает текст в Vector Store
+
+        Стадии отмечаются в задаче job, если она передана.
+        """
+        progress = job.advance if job is not None else (lambda stage, **data: None)
+
+        try:
+            # Проверяем, получаем информацию и конвертируем PDF в текст
+            # (PDFProcessor.analyze, одно открытие файла) в процессе из пула,
+            # чтобы разбор не блокировал event loop
+            logger.info(f"Начинаем конвертацию PDF: {filename}")
+            parsed = await pdf_pool.run(process_pdf_file, str(file_path))
             
-            # Проверяем валидность PDF
-            validation = self.pdf_processor.validate_pdf(str(file_path))
+            validation = parsed["validation"]
             if not validation["valid"]:
                 os.unlink(file_path)  # Удаляем невалидный файл
                 raise HTTPException(status_code=422, detail=validation["error"])
             
-            # Получаем информацию о PDF
-            pdf_info = self.pdf_processor.get_pdf_info(str(file_path))
-            
-            # Конвертируем PDF в текст
-            logger.info(f"Начинаем конвертацию PDF: {file.filename}")
-            conversion_result = self.pdf_processor.extract_text_from_pdf(str(file_path))
+            pdf_info = parsed["pdf_info"]
+            conversion_result = parsed["conversion"]
             
             if not conversion_result["success"]:
                 os.unlink(file_path)
@@ -79,13 +133,19 @@ class PDFUploadService:
                 )
             
             logger.info(f"Текст извлечен: {conversion_result['char_count']} символов, {conversion_result['pages_with_content']} страниц с контентом")
+            progress(
+                "parsed",
+                total_pages=conversion_result["metadata"]["total_pages"],
+                char_count=conversion_result["char_count"],
+            )
             
             # Подготавливаем метаданные
             metadata = {
-                "original_filename": file.filename,
+                "original_filename": filename,
                 "file_id": file_id,
                 "upload_date": datetime.utcnow().isoformat(),
-                "file_size_bytes": len(content),
+                "file_size_bytes": file_size,
+                "sha256": sha256,
                 "pdf_info": pdf_info,
                 "extraction_stats": {
                     "total_pages": conversion_result["metadata"]["total_pages"],
@@ -97,11 +157,12 @@ class PDFUploadService:
             }
             
             # Загружаем в OpenAI Vector Store
-            logger.info(f"Загружаем в Vector Store: {file.filename}")
+            logger.info(f"Загружаем в Vector Store: {filename}")
             vector_result = await self.vector_service.upload_text_as_file(
                 text_content=conversion_result["text"],
-                filename=file.filename,
-                metadata=metadata
+                filename=filename,
+                metadata=metadata,
+                on_progress=progress
             )
             
             # Удаляем временный файл (оставляем только в OpenAI)
@@ -114,12 +175,12 @@ class PDFUploadService:
             return {
                 "success": vector_result["success"],
                 "file_id": file_id,
-                "original_filename": file.filename,
+                "original_filename": filename,
                 "processing_stats": {
                     "total_pages": conversion_result["metadata"]["total_pages"],
                     "pages_with_content": conversion_result["pages_with_content"],
                     "char_count": conversion_result["char_count"],
-                    "file_size_bytes": len(content),
+                    "file_size_bytes": file_size,
                     "chunks_created": vector_result.get("total_chunks", 0)
                 },
                 "vector_store_result": vector_result,
@@ -136,7 +197,7 @@ class PDFUploadService:
             except:
                 pass
             
-            logger.error(f"Ошибка обработки файла {file.filename}: {e}")
+            logger.error(f"Ошибка обработки файла {filename}: {e}")
             raise HTTPException(
                 status_code=500,
                 detail=f"Внутренняя ошибка при обработке файла: {str(e)}"
@@ -145,6 +206,115 @@ class PDFUploadService:
 # Создаем экземпляр сервиса
 upload_service = PDFUploadService()
 
+
+async def submit_upload(saved: Dict[str, Any]) -> UploadJob:
+    """Ставит сохраненный файл в очередь обработки; 503, если очередь заполнена
+
+    Файл, уже загруженный в этот Vector Store, не обрабатывается повторно:
+    возвращается завершенная задача с прошлым результатом, а одновременные
+    загрузки одного файла получают одну общую задачу.
+    """
+    key = (saved["sha256"], upload_service.vector_service.vector_store_id)
+
+    def shared_job() -> Optional[UploadJob]:
+        job = upload_registry.in_flight.get(key)
+        if job is not None:
+            saved["file_path"].unlink(missing_ok=True)
+            logger.info(f"Файл {saved['filename']} уже обрабатывается задачей {job.id}")
+        return job
+
+    job = shared_job()
+    if job is not None:
+        return job
+    cached = await upload_registry.lookup(*key)
+    # Пока шел запрос к БД, тот же файл мог встать в очередь
+    job = shared_job()
+    if job is not None:
+        return job
+    if cached is not None:
+        # Повтор засчитывается только здесь, когда прошлый результат действительно отдан
+        await upload_registry.record_hit(*key)
+        saved["file_path"].unlink(missing_ok=True)
+        logger.info(
+            f"Файл {saved['filename']} уже загружен ранее ({saved['sha256'][:12]}) - "
+            f"пропускаем обработку"
+        )
+        # Те же байты могли прийти под другим именем - имя и ID берем из этого
+        # запроса, а не у первого загрузившего
+        result = {
+            **cached,
+            "original_filename": saved["filename"],
+            "file_id": saved["file_id"],
+            "duplicate": True,
+        }
+        return upload_jobs.add_finished(
+            result,
+            filename=saved["filename"],
+            file_id=saved["file_id"],
+            file_size_bytes=saved["file_size"],
+            duplicate=True,
+        )
+
+    async def handler(job: UploadJob) -> Dict[str, Any]:
+        try:
+            result = await upload_service.process_saved_upload(**saved, job=job)
+            if not result["success"]:
+                raise RuntimeError(
+                    result["vector_store_result"].get("error", "Unknown error")
+                )
+            try:
+                await upload_registry.save(
+                    *key, saved["filename"], saved["file_size"], result
+                )
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить файл в реестр загрузок: {e}")
+            return result
+        finally:
+            upload_registry.in_flight.pop(key, None)
+
+    try:
+        job = upload_jobs.submit(
+            handler,
+            filename=saved["filename"],
+            file_id=saved["file_id"],
+            file_size_bytes=saved["file_size"],
+        )
+    except QueueFull as e:
+        saved["file_path"].unlink(missing_ok=True)
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": "10"}
+        )
+
+    upload_registry.in_flight[key] = job
+    job.advance(
+        "received", filename=saved["filename"], file_size_bytes=saved["file_size"]
+    )
+    logger.info(f"Задача {job.id} поставлена в очередь: {saved['filename']}")
+    return job
+
+
+def job_response(job: UploadJob) -> UploadResponse:
+    """Результат завершенной задачи в формате синхронных эндпоинтов"""
+    if job.error_code is not None:
+        raise HTTPException(status_code=job.error_code, detail=job.error)
+    if job.error is not None:
+        return UploadResponse(
+            success=False,
+            message="Ошибка загрузки в Vector Store",
+            error=job.error
+        )
+    result = job.result
+    return UploadResponse(
+        success=True,
+        message=(
+            f"Файл '{result['original_filename']}' успешно обработан "
+            f"и загружен в Vector Store"
+        ),
+        file_id=result["file_id"],
+        processing_stats=result["processing_stats"],
+        vector_store_result=result["vector_store_result"]
+    )
+
 @router.post("/pdf", response_model=UploadResponse)
 async def upload_pdf(
     file: UploadFile = File(..., description="PDF файл для загрузки"),
@@ -156,6 +326,8 @@ async def upload_pdf(
     - Принимает PDF файл
     - Конвертирует в текст
     - Загружает как единый файл в Vector Store для поиска
+
+    Ждет окончания обработки; чтобы не держать запрос, используйте POST /pdf/jobs
     """
     
     if not file.filename:
@@ -164,22 +336,9 @@ async def upload_pdf(
     logger.info(f"Получен запрос на загрузку: {file.filename}")
     
     try:
-        result = await upload_service.process_pdf_upload(file)
-        
-        if result["success"]:
-            return UploadResponse(
-                success=True,
-                message=f"Файл '{file.filename}' успешно обработан и загружен в Vector Store",
-                file_id=result["file_id"],
-                processing_stats=result["processing_stats"],
-                vector_store_result=result["vector_store_result"]
-            )
-        else:
-            return UploadResponse(
-                success=False,
-                message="Ошибка загрузки в Vector Store",
-                error=result["vector_store_result"].get("error", "Unknown error")
-            )
+        job = await submit_upload(await upload_service.receive_upload(file))
+        await upload_jobs.wait(job)
+        return job_response(job)
             
     except HTTPException:
         raise
@@ -190,6 +349,60 @@ async def upload_pdf(
             detail=f"Неожиданная ошибка: {str(e)}"
         )
 
+
+@router.post("/pdf/jobs", status_code=202)
+async def create_upload_job(
+    file: UploadFile = File(..., description="PDF файл для загрузки")
+):
+    """
+    Загрузка PDF файла фоновой задачей
+
+    - Сохраняет файл и сразу возвращает job_id
+    - Разбор и загрузка в Vector Store идут в очереди
+    - Ход обработки: GET /jobs/{job_id} или SSE GET /jobs/{job_id}/events
+    """
+
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="Имя файла не указано")
+
+    logger.info(f"Получен запрос на фоновую загрузку: {file.filename}")
+    job = await submit_upload(await upload_service.receive_upload(file))
+    return job.to_dict()
+
+
+@router.get("/jobs/{job_id}")
+async def get_upload_job(job_id: str):
+    """Статус и результат задачи загрузки"""
+    job = upload_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job.to_dict()
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_upload_job(job_id: str):
+    """Server-Sent Events со стадиями задачи: received, parsed, uploaded, indexed"""
+    job = upload_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+
+    async def events():
+        async for event in job.watch(heartbeat=SSE_HEARTBEAT_SECONDS):
+            if event is None:
+                # Комментарий не дает прокси закрыть соединение без событий
+                yield ": ping\n\n"
+                continue
+            if job.finished and event is job.events[-1]:
+                event = {**event, "job": job.to_dict()}
+            data = json.dumps(event, ensure_ascii=False)
+            yield f"event: {event['event']}\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/pdf/batch", response_model=List[UploadResponse])
 async def upload_pdf_batch(
     files: List[UploadFile] = File(..., description="PDF файлы для загрузки (до 10 файлов)"),
@@ -204,10 +417,10 @@ async def upload_pdf_batch(
     """
     
     # Проверяем количество файлов
-    if len(files) > 10:
+    if len(files) > MAX_BATCH_FILES:
         raise HTTPException(
             status_code=400, 
-            detail=f"Максимум 10 файлов за раз. Получено: {len(files)}"
+            detail=f"Максимум {MAX_BATCH_FILES} файлов за раз. Получено: {len(files)}"
         )
     
     if not files:
@@ -234,24 +447,17 @@ async def upload_pdf_batch(
         """Обрабатывает один файл и возвращает результат"""
         try:
             logger.info(f"🔄 Начинаем обработку: {file.filename}")
-            result = await upload_service.process_pdf_upload(file)
+            job = await submit_upload(await upload_service.receive_upload(file))
+            await upload_jobs.wait(job)
+            response = job_response(job)
             
-            if result["success"]:
+            if response.success:
                 logger.info(f"✅ Завершена обработка: {file.filename}")
-                return UploadResponse(
-                    success=True,
-                    message=f"Файл '{file.filename}' успешно обработан",
-                    file_id=result["file_id"],
-                    processing_stats=result["processing_stats"],
-                    vector_store_result=result["vector_store_result"]
-                )
+                response.message = f"Файл '{file.filename}' успешно обработан"
             else:
                 logger.error(f"❌ Ошибка обработки: {file.filename}")
-                return UploadResponse(
-                    success=False,
-                    message=f"Ошибка загрузки файла '{file.filename}'",
-                    error=result["vector_store_result"].get("error", "Unknown error")
-                )
+                response.message = f"Ошибка загрузки файла '{file.filename}'"
+            return response
                 
         except Exception as e:
             logger.error(f"❌ Исключение при обработке {file.filename}: {e}")
@@ -285,7 +491,7 @@ async def upload_pdf_batch(
 async def get_upload_info():
     """Получить информацию о Vector Store"""
     try:
-        info = upload_service.vector_service.get_vector_store_info()
+        info = await upload_service.vector_service.get_vector_store_info()
         return info
     except Exception as e:
         raise HTTPException(
@@ -297,7 +503,7 @@ async def get_upload_info():
 async def search_in_uploads(query: str = Form(..., description="Поисковый запрос")):
     """Поиск в загруженных документах через Vector Store"""
     try:
-        result = upload_service.vector_service.search_in_vector_store(query)
+        result = await upload_service.vector_service.search_in_vector_store(query)
         return result
     except Exception as e:
         raise HTTPException(
@@ -309,8 +515,11 @@ async def search_in_uploads(query: str = Form(..., description="Поисковы
 async def delete_uploaded_file(file_id: str):
     """Удалить файл из Vector Store"""
     try:
-        success = upload_service.vector_service.delete_file_from_vector_store(file_id)
+        vector_service = upload_service.vector_service
+        success = await vector_service.delete_file_from_vector_store(file_id)
         if success:
+            # Повторная загрузка этого PDF снова пройдет полную обработку
+            await upload_registry.forget(file_id)
             return {"success": True, "message": f"Файл {file_id} удален"}
         else:
             raise HTTPException(status_code=404, detail="Файл не найден или ошибка удаления")
@@ -10,6 +10,55 @@ class Settings(BaseSettings):
     max_assistant_tokens: int = 1000
     vector_store_id: str = ""  # ← ДОБАВИТЬ ЭТУ СТРОКУ
 
+    # Общий клиент OpenAI
+    openai_timeout: float = 60.0  # таймаут запроса (сек)
+    openai_connect_timeout: float = 5.0  # таймаут установки соединения (сек)
+    openai_max_connections: int = 100  # одновременных соединений с API
+    # соединений, которые держать открытыми между запросами
+    openai_max_keepalive_connections: int = 20
+    # сколько (сек) держать неиспользуемое соединение
+    openai_keepalive_expiry: float = 30.0
+    openai_max_retries: int = 2  # повторов при сетевых ошибках и 429/5xx
+    openai_http2: bool = True  # HTTP/2, если установлен пакет h2
+
+    # Ожидание завершения run ассистента
+    # получать статус run событиями потока (иначе - опросом)
+    assistant_stream: bool = True
+    assistant_poll_initial: float = 0.25  # первая пауза между опросами (сек)
+    assistant_poll_max: float = 2.0  # максимальная пауза между опросами (сек)
+    assistant_poll_backoff: float = 1.5  # во сколько раз растет пауза после опроса
+    # соответствий thread клиента -> thread OpenAI в памяти
+    thread_cache_size: int = 10000
+    # сообщений, ждущих run в одном thread (дальше - 429)
+    assistant_thread_queue_size: int = 5
+
+    # Локальный FAISS индекс
+    # как часто (сек) проверять файлы индекса на изменения
+    faiss_reload_interval: float = 5.0
+    # через сколько (сек) после замены удалять старую версию индекса
+    faiss_version_grace_seconds: float = 600.0
+
+    # Кэш эмбеддингов
+    # записей в LRU кэше в памяти (float32: ~6 КБ на вектор, 10000 - ~60 МБ)
+    embedding_cache_size: int = 10000
+    # путь к SQLite кэшу, например data/embedding_cache.sqlite3 (пусто - выключен)
+    embedding_cache_path: str = ""
+
+    # Пакетная обработка одновременных запросов к индексу
+    query_batch_window_ms: float = 5.0  # окно сбора запросов в пакет
+    query_batch_max_size: int = 32  # максимум запросов в одном пакете
+
+    # Загрузка PDF
+    upload_max_mb: int = 200  # максимальный размер одного файла
+    upload_chunk_kb: int = 1024  # размер блока при копировании загрузки на диск
+    pdf_workers: int = 0  # процессов для разбора PDF (0 - по числу ядер)
+    # перезапускать процесс пула после N файлов (0 - не перезапускать)
+    pdf_worker_max_tasks: int = 50
+    # сколько загрузок обрабатывать одновременно (0 - по числу процессов pdf_pool)
+    upload_job_workers: int = 0
+    upload_job_queue_size: int = 20  # максимум задач в очереди (дальше - 503)
+    upload_job_ttl_seconds: float = 3600.0  # сколько хранить статус завершенной задачи
+
     class Config:
         env_file = ".env"
 
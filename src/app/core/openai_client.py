@@ -0,0 +1,81 @@
+# src/app/core/openai_client.py
+"""
+Общий асинхронный клиент OpenAI
+
+Один AsyncOpenAI на процесс с настроенным пулом keep-alive соединений
+(и HTTP/2, если установлен пакет h2): запросы сервисов не блокируют event
+loop и переиспользуют соединения. Клиент создается при старте приложения
+(или при первом обращении) и закрывается при остановке, поэтому сервисы
+берут его через get_openai_client() при каждом вызове, а не сохраняют.
+"""
+
+import importlib.util
+from typing import Any, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from src.app.core.config import settings
+from src.app.core.logger import logger
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_client: Optional[AsyncOpenAI] = None
+
+
+def create_openai_client(api_key: Optional[str] = None) -> AsyncOpenAI:
+    """Новый AsyncOpenAI с пулом соединений и таймаутами из настроек"""
+    timeout = httpx.Timeout(
+        settings.openai_timeout, connect=settings.openai_connect_timeout
+    )
+    http_client = httpx.AsyncClient(
+        http2=settings.openai_http2 and HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=settings.openai_max_connections,
+            max_keepalive_connections=settings.openai_max_keepalive_connections,
+            keepalive_expiry=settings.openai_keepalive_expiry,
+        ),
+        timeout=timeout,
+    )
+    return AsyncOpenAI(
+        api_key=api_key or settings.openai_api_key,
+        http_client=http_client,
+        timeout=timeout,
+        max_retries=settings.openai_max_retries,
+    )
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Общий клиент процесса; создается при первом обращении"""
+    global _client
+    if _client is None:
+        _client = create_openai_client()
+        logger.info(
+            f"OpenAI client created: "
+            f"http2={settings.openai_http2 and HTTP2_AVAILABLE}, "
+            f"max_connections={settings.openai_max_connections}"
+        )
+    return _client
+
+
+async def close_openai_client():
+    """Закрывает общий клиент и его соединения (при остановке приложения)"""
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.close()
+        logger.info("OpenAI client closed")
+
+
+class SharedResource:
+    """Ресурс общего клиента (например, "embeddings"), берется при каждом обращении
+
+    Нужен библиотекам, которые сохраняют клиент у себя (OpenAIEmbeddings): после
+    пересоздания общего клиента они не останутся с закрытым.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(getattr(get_openai_client(), self.name), attr)
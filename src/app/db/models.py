@@ -1,5 +1,5 @@
 # src/app/db/models.py
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, JSON, UniqueConstraint
 from datetime import datetime
 from src.app.db.base import Base
 
@@ -10,4 +10,33 @@ class Message(Base):
     thread_id = Column(String, index=True)
     role = Column(String)
     content = Column(String)
-    timestamp = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+
+class UploadedFile(Base):
+    """Реестр загруженных PDF: SHA-256 содержимого -> результат и файл в OpenAI"""
+    __tablename__ = "uploaded_files"
+    __table_args__ = (UniqueConstraint("sha256", "vector_store_id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), index=True)
+    vector_store_id = Column(String)
+    original_filename = Column(String)
+    file_size = Column(Integer)
+    openai_file_id = Column(String, index=True)
+    vector_store_file_id = Column(String)
+    result = Column(JSON)
+    upload_count = Column(Integer, default=1)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_uploaded_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ChatThread(Base):
+    """Thread клиента (thread_id из запросов) -> thread в OpenAI, где идет разговор"""
+    __tablename__ = "chat_threads"
+    __table_args__ = (UniqueConstraint("local_thread_id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    local_thread_id = Column(String, index=True)
+    openai_thread_id = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -7,12 +7,28 @@ import asyncio
 
 from src.app.core.config import settings
 from src.app.core.logger import logger
+from src.app.core.middleware import BodySizeLimitMiddleware
+from src.app.core.openai_client import close_openai_client, get_openai_client
 from src.app.db.base import Base
 from src.app.db.session import engine
 from src.app.api.v1.api import api_router
+from src.app.services.pdf_pool import pdf_pool
+from src.app.services.upload_jobs import upload_jobs
+from src.app.services.upload_storage import MAX_BATCH_FILES, multipart_limit
 
 app = FastAPI(title="AI Agent")
 
+# Слишком большие загрузки отклоняются до того, как сервер примет тело целиком
+upload_max_bytes = settings.upload_max_mb * 1024 * 1024
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={
+        "/api/v1/upload/pdf": multipart_limit(upload_max_bytes),
+        "/api/v1/upload/pdf/jobs": multipart_limit(upload_max_bytes),
+        "/api/v1/upload/pdf/batch": multipart_limit(upload_max_bytes, MAX_BATCH_FILES),
+    },
+)
+
 # Статика и шаблоны
 app.mount("/static", StaticFiles(directory="src/app/templates"), name="static")
 templates = Jinja2Templates(directory="src/app/templates")
@@ -23,6 +39,19 @@ async def on_startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     logger.info("Database initialized")
+    # Общий AsyncOpenAI с пулом соединений для всех сервисов
+    get_openai_client()
+    # Пул процессов для разбора PDF: загрузки не блокируют обработку чатов
+    pdf_pool.start()
+    # Очередь фоновых загрузок: запросы на загрузку не ждут разбора и OpenAI
+    upload_jobs.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await upload_jobs.stop()
+    pdf_pool.shutdown()
+    await close_openai_client()
 
 app.include_router(api_router, prefix="/api/v1")
 
@@ -1,75 +1,232 @@
 # src/app/services/assistant_service.py
-import time
 import asyncio
-from typing import Optional, Dict, Any
-from openai import OpenAI
+from typing import Optional, Dict, Any, AsyncIterator, Awaitable, Callable, List
+from openai import AsyncOpenAI, NotFoundError
 from src.app.core.config import settings
 from src.app.core.logger import logger
+from src.app.core.openai_client import get_openai_client
+from src.app.services.run_waiter import run_waiter
+from src.app.services.thread_registry import SHARED_THREAD_IDS, thread_registry
+
+
+class ThreadBusy(RuntimeError):
+    """В очереди thread уже слишком много сообщений - клиенту стоит повторить позже"""
+
+
+class _Turn:
+    """Сообщение, которое ждет run в своем thread"""
+
+    def __init__(self, message: str, on_delta: Optional[Callable[[str], Any]]):
+        self.message = message
+        self.on_delta = on_delta
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class ThreadRunQueue:
+    """
+    Очередь run по thread: в одном thread OpenAI допускает только один активный run
+
+    Пока идет run, новые сообщения этого thread ждут; следующий run получает
+    их все сразу, и ответ достается каждому из них. Thread обрабатываются
+    независимо - очередь одного не задерживает другие.
+    """
+
+    def __init__(self, max_pending: int = 5):
+        self.max_pending = max(1, max_pending)
+        self._pending: Dict[str, List[_Turn]] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self.stats = {"runs": 0, "merged": 0, "rejected": 0}
+
+    async def submit(
+        self,
+        thread_id: str,
+        message: str,
+        on_delta: Optional[Callable[[str], Any]],
+        execute: Callable[[List[str], Callable[[str], None]], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Ждет run, в который попадет сообщение; ThreadBusy, если очередь заполнена"""
+        pending = self._pending.setdefault(thread_id, [])
+        waiting = sum(1 for turn in pending if not turn.future.done())
+        if waiting >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise ThreadBusy(
+                f"В thread {thread_id} уже ждут ответа {waiting} сообщений"
+            )
+        turn = _Turn(message, on_delta)
+        pending.append(turn)
+        if thread_id not in self._workers:
+            self._workers[thread_id] = asyncio.ensure_future(
+                self._drain(thread_id, execute)
+            )
+        return await turn.future
+
+    def busy(self, thread_id: str) -> bool:
+        return thread_id in self._workers
+
+    async def _drain(self, thread_id: str, execute):
+        try:
+            while self._pending.get(thread_id):
+                # Отмененные (клиент ушел до начала run) не отправляем
+                batch = [
+                    turn for turn in self._pending.pop(thread_id)
+                    if not turn.future.done()
+                ]
+                if not batch:
+                    continue
+                if len(batch) > 1:
+                    self.stats["merged"] += len(batch) - 1
+                    logger.info(
+                        f"Thread {thread_id}: {len(batch)} сообщений "
+                        f"объединены в один run"
+                    )
+
+                def on_delta(text: str):
+                    for turn in batch:
+                        if turn.on_delta is not None and not turn.future.done():
+                            turn.on_delta(text)
+
+                run = asyncio.ensure_future(
+                    execute([turn.message for turn in batch], on_delta)
+                )
+
+                def abandon(_):
+                    # Ответ больше никто не ждет - run отменяется
+                    if all(turn.future.cancelled() for turn in batch):
+                        run.cancel()
+
+                for turn in batch:
+                    turn.future.add_done_callback(abandon)
+                (result,) = await asyncio.gather(run, return_exceptions=True)
+                self.stats["runs"] += 1
+
+                for n, turn in enumerate(batch):
+                    if turn.future.done():
+                        continue
+                    if isinstance(result, BaseException):
+                        turn.future.set_exception(result)
+                    else:
+                        # Ответ сохраняется в историю один раз - с последним сообщением
+                        turn.future.set_result(
+                            {**result, "duplicate_reply": n < len(batch) - 1}
+                        )
+        finally:
+            self._workers.pop(thread_id, None)
+
 
 class CFAnatolikService:
     """Сервис для работы с ассистентом CF Anatolik через Assistants API"""
     
     def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
         self.assistant_id = settings.assistant_id
         self.timeout = settings.assistant_timeout
+        self.thread_queues = ThreadRunQueue(settings.assistant_thread_queue_size)
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """Общий асинхронный клиент приложения"""
+        return get_openai_client()
         
-    async def ask_assistant(self, message: str, thread_id: Optional[str] = None) -> Dict[str, Any]:
+    async def ask_assistant(
+        self,
+        message: str,
+        thread_id: Optional[str] = None,
+        on_delta: Optional[Callable[[str], Any]] = None
+    ) -> Dict[str, Any]:
         """
         Отправляет вопрос ассистенту CF Anatolik и возвращает ответ
         
         Args:
             message: Сообщение пользователя
-            thread_id: ID существующего потока (если None, создается новый)
+            thread_id: ID thread клиента (если None, создается новый thread
+                без привязки)
+            on_delta: Получает фрагменты текста ответа по мере генерации
             
         Returns:
             Dict с ответом ассистента и метаданными
         """
+        if not thread_id or thread_id in SHARED_THREAD_IDS:
+            # Общий ID не сводит разных клиентов в один thread и одну очередь
+            return await self._ask([message], None, on_delta)
+
+        # Run в thread идут по одному; ждущие сообщения уходят следующим run вместе
+        try:
+            return await self.thread_queues.submit(
+                thread_id,
+                message,
+                on_delta,
+                lambda messages, batch_on_delta: self._ask(
+                    messages, thread_id, batch_on_delta
+                ),
+            )
+        except ThreadBusy as e:
+            logger.warning(str(e))
+            return {
+                "success": False,
+                "error": str(e),
+                "status_code": 429,
+                "thread_id": thread_id
+            }
+
+    async def _ask(
+        self,
+        messages: List[str],
+        thread_id: Optional[str],
+        on_delta: Optional[Callable[[str], Any]]
+    ) -> Dict[str, Any]:
+        """Добавляет сообщения в thread и получает ответ одним run"""
         try:
-            # Создаем или используем существующий thread
+            # Thread OpenAI, привязанный к thread клиента, или новый
             if thread_id:
-                thread = self._get_or_create_thread(thread_id)
+                openai_thread_id = await self._get_or_create_thread(thread_id)
             else:
-                thread = self.client.beta.threads.create()
-                logger.info(f"Создан новый thread: {thread.id}")
+                openai_thread_id = await self._create_thread()
             
-            # Добавляем сообщение пользователя в thread
-            self.client.beta.threads.messages.create(
-                thread_id=thread.id,
-                role="user",
-                content=message
-            )
+            # Добавляем сообщения пользователя в thread
+            try:
+                await self._add_messages(openai_thread_id, messages)
+            except NotFoundError:
+                if not thread_id:
+                    raise
+                # Thread удален в OpenAI - привязываем к thread клиента новый
+                logger.warning(
+                    f"Thread OpenAI {openai_thread_id} для {thread_id} не найден, "
+                    f"создаем новый"
+                )
+                await thread_registry.forget(thread_id)
+                openai_thread_id = await self._get_or_create_thread(thread_id)
+                await self._add_messages(openai_thread_id, messages)
             
-            # Запускаем ассистента
-            run = self.client.beta.threads.runs.create(
-                thread_id=thread.id,
-                assistant_id=self.assistant_id
+            # Запускаем ассистента и ждем завершения выполнения
+            logger.info(
+                f"Запускаем ассистента {self.assistant_id} "
+                f"для thread {openai_thread_id}"
             )
-            
-            logger.info(f"Запущен ассистент {self.assistant_id} для thread {thread.id}")
-            
-            # Ждем завершения выполнения
-            completed_run = await self._wait_for_completion(thread.id, run.id)
+            wait = await run_waiter.run(
+                openai_thread_id, self.assistant_id, self.timeout, on_delta=on_delta
+            )
+            completed_run = wait.run
             
             if completed_run.status == "completed":
                 # Получаем последнее сообщение ассистента
-                messages = self.client.beta.threads.messages.list(
-                    thread_id=thread.id,
+                reply = await self.client.beta.threads.messages.list(
+                    thread_id=openai_thread_id,
                     limit=1
                 )
                 
-                if messages.data:
-                    assistant_message = messages.data[0]
+                if reply.data:
+                    assistant_message = reply.data[0]
                     content = assistant_message.content[0].text.value
                     
                     return {
                         "success": True,
                         "content": content,
-                        "thread_id": thread.id,
+                        "thread_id": openai_thread_id,
                         "run_id": completed_run.id,
                         "usage": getattr(completed_run, 'usage', None),
                         "model": getattr(completed_run, 'model', 'gpt-4o'),
-                        "annotations": self._extract_annotations(assistant_message)
+                        "annotations": self._extract_annotations(assistant_message),
+                        "timings": wait.timings(),
+                        "merged_messages": len(messages)
                     }
                 else:
                     raise Exception("Не удалось получить ответ от ассистента")
@@ -81,7 +238,7 @@ class CFAnatolikService:
                     "success": False,
                     "error": f"Ассистент завершил работу со статусом: {completed_run.status}",
                     "details": error_details,
-                    "thread_id": thread.id
+                    "thread_id": openai_thread_id
                 }
                 
         except Exception as e:
@@ -92,47 +249,73 @@ class CFAnatolikService:
                 "thread_id": thread_id
             }
     
-    async def _wait_for_completion(self, thread_id: str, run_id: str):
-        """Асинхронно ждет завершения выполнения ассистента"""
-        max_attempts = self.timeout
+    async def stream_assistant(
+        self,
+        message: str,
+        thread_id: Optional[str] = None,
+        heartbeat: Optional[float] = None
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Ответ ассистента по частям: {"event": "delta", "text": ...} по мере
+        генерации, затем {"event": "done", **ответ ask_assistant}.
+        None - за heartbeat секунд не пришло ни одного фрагмента.
         
-        for attempt in range(max_attempts):
-            await asyncio.sleep(1)  # Ждем 1 секунду между проверками
+        Если получатель перестал читать, run отменяется.
+        """
+        deltas: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(
+            self.ask_assistant(message, thread_id, on_delta=deltas.put_nowait)
+        )
+        try:
+            while True:
+                getter = asyncio.ensure_future(deltas.get())
+                done, _ = await asyncio.wait(
+                    {getter, task},
+                    timeout=heartbeat,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if getter in done:
+                    yield {"event": "delta", "text": getter.result()}
+                    continue
+                getter.cancel()
+                if task in done:
+                    break
+                yield None
             
-            run = self.client.beta.threads.runs.retrieve(
-                thread_id=thread_id,
-                run_id=run_id
+            while not deltas.empty():
+                yield {"event": "delta", "text": deltas.get_nowait()}
+            yield {"event": "done", **task.result()}
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+    async def _add_messages(self, openai_thread_id: str, messages: List[str]):
+        for message in messages:
+            await self.client.beta.threads.messages.create(
+                thread_id=openai_thread_id,
+                role="user",
+                content=message
             )
-            
-            logger.debug(f"Статус выполнения: {run.status} (попытка {attempt + 1})")
-            
-            if run.status in ["completed", "failed", "cancelled", "expired"]:
-                return run
-            elif run.status == "requires_action":
-                # Если ассистент требует действий (например, вызов функций)
-                logger.info("Ассистент требует дополнительных действий")
-                # Здесь можно добавить обработку required_action
-                continue
-                
-        # Если превышен таймаут
-        raise TimeoutError(f"Ассистент не ответил в течение {self.timeout} секунд")
     
-    def _get_or_create_thread(self, thread_id: str):
-        """Получает существующий thread или создает новый"""
-        max_retries = 3
-        for attempt in range(max_retries):
-            try:
-                # Пытаемся получить существующий thread
-                thread = self.client.beta.threads.retrieve(thread_id)
-                return thread
-            except Exception as e:
-                if attempt == max_retries - 1:
-                    logger.warning(f"Не удалось получить thread {thread_id} после {max_retries} попыток: {str(e)}")
-                    # Если thread не найден, создаем новый
-                    logger.info(f"Thread {thread_id} не найден, создаем новый")
-                    return self.client.beta.threads.create()
-                logger.debug(f"Попытка {attempt + 1}: Ошибка получения thread {thread_id}, повторяем...")
-                time.sleep(1)
+    async def _get_or_create_thread(self, thread_id: str) -> str:
+        """ID thread OpenAI для thread клиента: из реестра или новый"""
+        async def create() -> str:
+            if thread_id.startswith("thread_"):
+                # Клиент прислал ID thread OpenAI (например, из прошлого ответа) -
+                # проверяем его один раз
+                try:
+                    return (await self.client.beta.threads.retrieve(thread_id)).id
+                except NotFoundError:
+                    pass
+            return await self._create_thread()
+
+        return await thread_registry.resolve(thread_id, create)
+
+    async def _create_thread(self) -> str:
+        thread = await self.client.beta.threads.create()
+        logger.info(f"Создан новый thread: {thread.id}")
+        return thread.id
     
     def _handle_run_error(self, run) -> Dict[str, Any]:
         """Обрабатывает ошибки выполнения ассистента"""
@@ -176,10 +359,10 @@ class CFAnatolikService:
         
         return annotations
     
-    def get_thread_messages(self, thread_id: str, limit: int = 20) -> list:
+    async def get_thread_messages(self, thread_id: str, limit: int = 20) -> list:
         """Получает историю сообщений из thread"""
         try:
-            messages = self.client.beta.threads.messages.list(
+            messages = await self.client.beta.threads.messages.list(
                 thread_id=thread_id,
                 limit=limit,
                 order="asc"  # Сортируем по возрастанию для правильного порядка
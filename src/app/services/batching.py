@@ -0,0 +1,89 @@
+# src/app/services/batching.py
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+
+class MicroBatcher:
+    """Собирает одновременные запросы в пакеты по времени и размеру
+
+    Запросы, пришедшие в течение `window` секунд (но не более `max_batch_size`),
+    передаются в `handler` одним списком; каждый вызывающий получает свой
+    элемент результата.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], Awaitable[List[Any]]],
+        window: float = 0.005,
+        max_batch_size: int = 32,
+    ):
+        self.handler = handler
+        self.window = window
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Event loop держит на задачи только слабые ссылки - без этого набора
+        # пакет в работе мог бы быть собран сборщиком мусора
+        self._tasks: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.batches = 0
+
+    async def submit(self, item: Any) -> Any:
+        """Ставит элемент в текущий пакет и ждет его результат"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Новый event loop (например, в тестах) - старое состояние неактуально
+            self._loop = loop
+            self._pending = []
+            self._timer = None
+            self._tasks = set()
+
+        future = loop.create_future()
+        self._pending.append((item, future))
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch = self._pending[:self.max_batch_size]
+        self._pending = self._pending[self.max_batch_size:]
+        if self._pending:
+            self._timer = self._loop.call_later(self.window, self._flush)
+        if batch:
+            self.batches += 1
+            task = self._loop.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future]]):
+        try:
+            results = await self.handler([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        """Сколько запросов и пакетов обработано"""
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+        }
@@ -0,0 +1,196 @@
+# src/app/services/chunker.py
+"""
+Разбиение текста на части по токенам
+
+В отличие от RecursiveCharacterTextSplitter, размер части задается в
+токенах модели эмбеддингов, поэтому части одинаковы по "весу" для API
+независимо от языка текста. Границы выбираются по структуре документа:
+
+- части не пересекают маркеры `--- СТРАНИЦА N ---`, которые вставляет
+  PDFProcessor; номер страницы записывается в метаданные части;
+- текст страницы делится по абзацам, слишком длинные абзацы - по
+  предложениям, а совсем длинные предложения - окнами по токенам;
+- перекрытие между соседними частями набирается целыми абзацами или
+  предложениями с конца предыдущей части.
+
+Каждый абзац кодируется tiktoken ровно один раз (encode_ordinary, без
+разбора спецтокенов; пакетный encode_ordinary_batch на коротких абзацах
+медленнее из-за создания пула потоков на каждый вызов), а число токенов
+части (сумма по ее абзацам, без разделителей) записывается в
+metadata["tokens"] - его используют пакетирование и лимиты ingest без
+повторного подсчета.
+
+Окна по токенам режутся только на границах символов: в cl100k один
+кириллический символ нередко делится между двумя токенами, и разрез
+посередине дал бы U+FFFD в тексте части и в ее эмбеддинге.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import tiktoken
+from langchain_core.documents import Document
+
+from src.app.services.ingest_embedder import EMBEDDING_ENCODING
+
+DEFAULT_CHUNK_TOKENS = 300
+DEFAULT_OVERLAP_TOKENS = 50
+
+PAGE_MARKER = re.compile(r"^--- СТРАНИЦА (\d+) ---$", re.MULTILINE)
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?…])\s+")
+
+PARAGRAPH_SEPARATOR = "\n\n"
+SENTENCE_SEPARATOR = " "
+
+# Единица разбиения: (текст, число токенов, разделитель перед ней)
+Unit = Tuple[str, int, str]
+
+
+def split_pages(text: str) -> List[Tuple[Optional[int], str]]:
+    """Делит текст по маркерам страниц: [(номер страницы или None, текст)]"""
+    pages: List[Tuple[Optional[int], str]] = []
+    page: Optional[int] = None
+    header = ""
+    position = 0
+
+    def add(body: str):
+        nonlocal header
+        if header:
+            body = header + PARAGRAPH_SEPARATOR + body
+            header = ""
+        pages.append((page, body))
+
+    for match in PAGE_MARKER.finditer(text):
+        body = text[position:match.start()]
+        if page is None and body.strip():
+            # Заголовок документа перед первым маркером относится к первой странице
+            header = body.strip()
+        elif page is not None:
+            add(body)
+        page = int(match.group(1))
+        position = match.end()
+    add(text[position:])
+    return [(page, body) for page, body in pages if body.strip()]
+
+
+class TokenChunker:
+    """Делит документы на части не длиннее chunk_tokens токенов"""
+
+    def __init__(
+        self,
+        chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+        overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+        encoding: Optional[tiktoken.Encoding] = None,
+    ):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens должен быть меньше chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self._encoding = encoding
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        if self._encoding is None:
+            self._encoding = tiktoken.get_encoding(EMBEDDING_ENCODING)
+        return self._encoding
+
+    def _units(self, text: str) -> List[Unit]:
+        """Абзацы страницы, при необходимости раздробленные до размера части"""
+        encode = self.encoding.encode_ordinary
+        units: List[Unit] = []
+        for paragraph in PARAGRAPH_BREAK.split(text):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            tokens = len(encode(paragraph))
+            if tokens <= self.chunk_tokens:
+                units.append((paragraph, tokens, PARAGRAPH_SEPARATOR))
+                continue
+            sentences = [s for s in SENTENCE_BREAK.split(paragraph) if s]
+            for i, sentence in enumerate(sentences):
+                encoded = encode(sentence)
+                separator = PARAGRAPH_SEPARATOR if i == 0 else SENTENCE_SEPARATOR
+                if len(encoded) <= self.chunk_tokens:
+                    units.append((sentence, len(encoded), separator))
+                    continue
+                # Предложение длиннее части - режем окнами по токенам
+                for window, tokens in self._windows(encoded):
+                    units.append((window, tokens, separator))
+                    separator = ""
+        return units
+
+    def _windows(self, encoded: List[int]) -> List[Tuple[str, int]]:
+        """Окна не длиннее chunk_tokens токенов, разрезанные между символами"""
+        pieces = [self.encoding.decode_single_token_bytes(token) for token in encoded]
+
+        def inside_char(end: int) -> bool:
+            # Токен, начинающийся с байта продолжения UTF-8, - хвост символа
+            return end < len(pieces) and pieces[end][0] & 0xC0 == 0x80
+
+        windows = []
+        start = 0
+        while start < len(pieces):
+            end = min(start + self.chunk_tokens, len(pieces))
+            cut = end
+            while cut > start + 1 and inside_char(cut):
+                cut -= 1
+            if inside_char(cut):
+                # Символ длиннее окна (при разумном chunk_tokens не бывает) - целиком
+                cut = end
+                while inside_char(cut):
+                    cut += 1
+            text = b"".join(pieces[start:cut]).decode("utf-8", errors="replace")
+            windows.append((text, cut - start))
+            start = cut
+        return windows
+
+    def _pack(self, units: List[Unit]) -> List[Tuple[str, int]]:
+        """Жадно собирает единицы в части с перекрытием: [(текст, токены)]"""
+        chunks: List[Tuple[str, int]] = []
+        current: List[Unit] = []
+        total = 0
+
+        def emit():
+            text = current[0][0] + "".join(sep + t for t, _, sep in current[1:])
+            chunks.append((text, total))
+
+        for unit in units:
+            if current and total + unit[1] > self.chunk_tokens:
+                emit()
+                # Перекрытие: хвостовые единицы, помещающиеся в overlap_tokens
+                overlap: List[Unit] = []
+                overlap_total = 0
+                for previous in reversed(current):
+                    if overlap_total + previous[1] > self.overlap_tokens:
+                        break
+                    overlap.insert(0, previous)
+                    overlap_total += previous[1]
+                if overlap_total + unit[1] > self.chunk_tokens:
+                    overlap, overlap_total = [], 0
+                current, total = overlap, overlap_total
+            current.append(unit)
+            total += unit[1]
+        if current:
+            emit()
+        return chunks
+
+    def split_text(self, text: str) -> List[Tuple[str, Optional[int], int]]:
+        """Части текста: [(текст, номер страницы или None, число токенов)]"""
+        result = []
+        for page, body in split_pages(text):
+            for chunk, tokens in self._pack(self._units(body)):
+                result.append((chunk, page, tokens))
+        return result
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        """Интерфейс как у текстовых сплиттеров LangChain"""
+        chunks = []
+        for doc in documents:
+            for text, page, tokens in self.split_text(doc.page_content):
+                metadata: Dict[str, Any] = dict(doc.metadata)
+                if page is not None:
+                    metadata["page"] = page
+                metadata["tokens"] = tokens
+                chunks.append(Document(page_content=text, metadata=metadata))
+        return chunks
@@ -0,0 +1,52 @@
+# src/app/services/document_loader.py
+"""
+Загрузка исходных документов для ingest
+
+PDF читаются через PyMuPDF (PDFProcessor) постранично: каждый документ -
+одна страница с ее номером в метаданных. Текстовые файлы - один документ.
+
+Функции модульного уровня и без состояния, поэтому их можно отправлять в
+ProcessPoolExecutor.
+"""
+
+from pathlib import Path
+from typing import List
+
+from langchain_core.documents import Document
+
+from src.app.services.pdf_processor import PDFProcessor
+
+# Записывается в настройки ingest: смена загрузчика меняет тексты частей
+PDF_LOADER = "pymupdf"
+
+
+def load_pdf(path: Path) -> List[Document]:
+    """Страницы PDF с текстом как отдельные документы"""
+    extracted = PDFProcessor().extract_pages(str(path))
+    info = extracted["metadata"]
+    return [
+        Document(
+            page_content=page["text"],
+            metadata={
+                "source": str(path),
+                "page": page["page"],
+                "total_pages": info["total_pages"],
+                "title": info["title"] or Path(path).stem,
+            },
+        )
+        for page in extracted["pages"]
+        if page["has_content"]
+    ]
+
+
+def load_text(path: Path) -> List[Document]:
+    with open(path, encoding="utf-8") as f:
+        return [Document(page_content=f.read(), metadata={"source": str(path)})]
+
+
+def load_document(path: Path) -> List[Document]:
+    """Загружает файл ingest'а по расширению"""
+    path = Path(path)
+    if path.suffix.lower() == ".pdf":
+        return load_pdf(path)
+    return load_text(path)
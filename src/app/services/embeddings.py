@@ -1,11 +1,237 @@
 # src/app/services/embeddings.py
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
-from dotenv import load_dotenv
-import os
 
-load_dotenv()
+from src.app.core.config import settings
+from src.app.core.openai_client import SharedResource
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+def normalize_text(text: str) -> str:
+    """Нормализует текст для ключа кэша: NFKC и схлопывание пробелов"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def _compact(keys: List[str], vectors: List[List[float]]) -> Dict[str, array]:
+    """Векторы ответа API в компактном float32 виде для кэша"""
+    return {key: array("f", vector) for key, vector in zip(keys, vectors)}
+
+
+class SQLiteEmbeddingStore:
+    """Персистентный уровень кэша: переживает рестарты и общий для воркеров uvicorn"""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # WAL позволяет нескольким процессам читать, пока один пишет
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, array]:
+        found = {}
+        with self._lock:
+            # SQLite ограничивает число параметров запроса - читаем порциями
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    part,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob)
+        return found
+
+    def put_many(self, items: Dict[str, array]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, vector.tobytes()) for key, vector in items.items()],
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Кэширующая обертка над эмбеддингами: LRU в памяти + опциональный SQLite
+
+    Векторы хранятся как array("f"): 1536 float32 - около 6 КБ против ~48 КБ
+    у списка Python float. Список создается только при возврате результата.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model: str,
+        max_size: int = 10000,
+        store: Optional[SQLiteEmbeddingStore] = None,
+    ):
+        self.underlying = underlying
+        self.model = model
+        self.max_size = max_size
+        self.store = store
+        self._lru: "OrderedDict[str, array]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def cache_key(self, text: str) -> str:
+        raw = f"{self.model}\x00{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _memory_lookup(self, keys: List[str]) -> Dict[str, array]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = vector
+        return found
+
+    def _remember(self, items: Dict[str, array]):
+        with self._lock:
+            for key, vector in items.items():
+                self._lru[key] = vector
+                self._lru.move_to_end(key)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+
+    def _split(self, texts: List[str]):
+        """Возвращает ключи, найденное в памяти и ключи для дальнейшего поиска"""
+        keys = [self.cache_key(t) for t in texts]
+        unique = list(dict.fromkeys(keys))
+        found = self._memory_lookup(unique)
+        missing = [k for k in unique if k not in found]
+        return keys, found, missing
+
+    def _account(self, memory: int, disk: int, computed: int):
+        with self._lock:
+            self.hits += memory
+            self.disk_hits += disk
+            self.misses += computed
+
+    def _texts_for(
+        self, texts: List[str], keys: List[str], missing: List[str]
+    ) -> List[str]:
+        first_text = {}
+        for text, key in zip(texts, keys):
+            first_text.setdefault(key, text)
+        return [first_text[k] for k in missing]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._split(texts)
+        memory_hits = len(found)
+
+        disk_found = self.store.get_many(missing) if self.store and missing else {}
+        if disk_found:
+            self._remember(disk_found)
+            found.update(disk_found)
+            missing = [k for k in missing if k not in disk_found]
+
+        if missing:
+            vectors = self.underlying.embed_documents(
+                self._texts_for(texts, keys, missing)
+            )
+            computed = _compact(missing, vectors)
+            self._remember(computed)
+            if self.store:
+                self.store.put_many(computed)
+            found.update(computed)
+
+        self._account(memory_hits, len(disk_found), len(missing))
+        return [found[k].tolist() for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._split(texts)
+        memory_hits = len(found)
+
+        disk_found = {}
+        if self.store and missing:
+            disk_found = await asyncio.to_thread(self.store.get_many, missing)
+        if disk_found:
+            self._remember(disk_found)
+            found.update(disk_found)
+            missing = [k for k in missing if k not in disk_found]
+
+        if missing:
+            vectors = await self.underlying.aembed_documents(
+                self._texts_for(texts, keys, missing)
+            )
+            computed = _compact(missing, vectors)
+            self._remember(computed)
+            if self.store:
+                await asyncio.to_thread(self.store.put_many, computed)
+            found.update(computed)
+
+        self._account(memory_hits, len(disk_found), len(missing))
+        return [found[k].tolist() for k in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики попаданий и промахов кэша"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "size": len(self._lru),
+                "max_size": self.max_size,
+                "persistent": self.store is not None,
+            }
+
+
+def create_embeddings(
+    api_key: Optional[str] = None, async_client=None
+) -> CachedEmbeddings:
+    """Создает кэширующие эмбеддинги OpenAI согласно настройкам
+
+    async_client - ресурс embeddings асинхронного клиента OpenAI (например,
+    общего клиента приложения); по умолчанию OpenAIEmbeddings создает свой.
+    """
+    store = None
+    if settings.embedding_cache_path:
+        store = SQLiteEmbeddingStore(settings.embedding_cache_path)
+
+    return CachedEmbeddings(
+        OpenAIEmbeddings(
+            openai_api_key=api_key or settings.openai_api_key,
+            model=EMBEDDING_MODEL,
+            async_client=async_client,
+        ),
+        model=EMBEDDING_MODEL,
+        max_size=settings.embedding_cache_size,
+        store=store,
+    )
+
 
-embeddings = OpenAIEmbeddings(
-    openai_api_key=os.getenv("OPENAI_API_KEY"),
-    model="text-embedding-ada-002"
-)
\ No newline at end of file
+# Запросы приложения идут через общий AsyncOpenAI и его пул соединений
+embeddings = create_embeddings(async_client=SharedResource("embeddings"))
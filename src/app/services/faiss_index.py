@@ -1,54 +1,294 @@
 # src/app/services/faiss_index.py
+import asyncio
+import threading
+import time
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import faiss
+import numpy as np
 from dotenv import load_dotenv
 from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from src.app.core.config import settings
+from src.app.core.logger import logger
+from src.app.services.batching import MicroBatcher
 from src.app.services.embeddings import embeddings
+from src.app.services.index_store import (
+    INDEX_FILE,
+    META_FILE,
+    MmapIndex,
+    current_version,
+    gc_versions,
+    is_mmap_index,
+    resolve_index,
+)
 
 load_dotenv()
 INDEX_PATH = Path("data/faiss_index")
+# Старый формат LangChain: FAISS индекс + pickle docstore
+LEGACY_INDEX_FILES = ("index.faiss", "index.pkl")
+MMAP_INDEX_FILES = (META_FILE, INDEX_FILE)
 
-def get_vectorstore():
-    """Загружает FAISS векторное хранилище"""
-    if not INDEX_PATH.exists():
-        raise FileNotFoundError(
-            f"FAISS индекс не найден в {INDEX_PATH}. "
-            f"Запустите сначала: python scripts/ingest.py"
-        )
-    
-    try:
-        return FAISS.load_local(
-            str(INDEX_PATH), 
-            embeddings, 
-            allow_dangerous_deserialization=True
+VectorStore = Union[MmapIndex, FAISS]
+
+
+class VectorStoreHolder:
+    """Держит FAISS хранилище в памяти процесса и подменяет его при выходе новой версии
+
+    Первая загрузка синхронная. Новая версия индекса (переключенный CURRENT
+    или измененные файлы плоской раскладки) загружается в фоновом потоке, а
+    до конца загрузки запросы обслуживает текущее хранилище. Подмена - одно
+    присваивание ссылки: запросы, уже получившие старое хранилище, дорабатывают
+    с ним. После подмены удаляются версии, замененные дольше gc_grace секунд назад.
+    """
+
+    def __init__(
+        self,
+        index_path: Path,
+        check_interval: float = 5.0,
+        gc_grace: Optional[float] = None,
+    ):
+        self.index_path = Path(index_path)
+        self.check_interval = check_interval
+        self.gc_grace = gc_grace
+        self._store: Optional[VectorStore] = None
+        self._signature: Optional[Tuple] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._loader: Optional[threading.Thread] = None
+        self.generation = 0
+        self.version: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+
+    def _disk_signature(self) -> Tuple:
+        """Версия из CURRENT или снимок (mtime, size) файлов плоской раскладки"""
+        version = current_version(self.index_path)
+        if version is not None:
+            # Каталог версии не изменяется после публикации - достаточно имени
+            return (("version", version),)
+
+        if is_mmap_index(self.index_path):
+            names = MMAP_INDEX_FILES
+        else:
+            names = LEGACY_INDEX_FILES
+        signature = []
+        for name in names:
+            stat = (self.index_path / name).stat()
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _open(self) -> Tuple[VectorStore, Tuple, Optional[str], float]:
+        """Открывает текущую версию с диска, не трогая загруженное хранилище"""
+        if not self.index_path.exists():
+            raise FileNotFoundError(
+                f"FAISS индекс не найден в {self.index_path}. "
+                f"Запустите сначала: python scripts/ingest.py"
+            )
+
+        signature = self._disk_signature()
+        version = current_version(self.index_path)
+        location = resolve_index(self.index_path)
+        started = time.perf_counter()
+        try:
+            if is_mmap_index(location):
+                store = MmapIndex(location)
+            else:
+                store = FAISS.load_local(
+                    str(location),
+                    embeddings,
+                    allow_dangerous_deserialization=True
+                )
+        except Exception as e:
+            raise RuntimeError(f"Ошибка загрузки FAISS индекса: {e}")
+        return store, signature, version, time.perf_counter() - started
+
+    def _publish(
+        self,
+        store: VectorStore,
+        signature: Tuple,
+        version: Optional[str],
+        seconds: float,
+    ) -> VectorStore:
+        # Публикуем новое хранилище одной операцией присваивания:
+        # запросы, уже получившие старую ссылку, спокойно дорабатывают с ней
+        self._store = store
+        self._signature = signature
+        self.version = version
+        self.generation += 1
+        self.loaded_at = time.time()
+        self.load_seconds = seconds
+        logger.info(
+            f"FAISS индекс загружен: поколение {self.generation}"
+            f"{f', версия {version}' if version else ''}, {seconds:.3f} с"
         )
-    except Exception as e:
-        raise RuntimeError(f"Ошибка загрузки FAISS индекса: {e}")
+        return store
+
+    def _is_stale(self) -> bool:
+        try:
+            return self._disk_signature() != self._signature
+        except FileNotFoundError:
+            # Файлы временно отсутствуют (идет перезапись) - работаем со старой версией
+            return False
+
+    def _load_in_background(self):
+        try:
+            loaded = self._open()
+        except Exception as e:
+            logger.warning(f"Перезагрузка индекса не удалась, используем текущий: {e}")
+            return
+        with self._lock:
+            self._publish(*loaded)
+        self._collect_garbage()
+
+    def _collect_garbage(self):
+        if self.gc_grace is None:
+            return
+        try:
+            removed = gc_versions(self.index_path, self.gc_grace)
+        except OSError as e:
+            logger.warning(f"Не удалось удалить старые версии индекса: {e}")
+            return
+        if removed:
+            logger.info(f"Удалены старые версии индекса: {', '.join(removed)}")
+
+    def get(self) -> VectorStore:
+        """Возвращает загруженное хранилище; новую версию начинает загружать в фоне"""
+        store = self._store
+        now = time.monotonic()
+        if store is not None and now - self._last_check < self.check_interval:
+            return store
+
+        with self._lock:
+            if self._store is None:
+                return self._publish(*self._open())
+            if now - self._last_check >= self.check_interval:
+                self._last_check = now
+                loading = self._loader is not None and self._loader.is_alive()
+                if not loading and self._is_stale():
+                    self._loader = threading.Thread(
+                        target=self._load_in_background,
+                        name="faiss-reload",
+                        daemon=True,
+                    )
+                    self._loader.start()
+            return self._store
+
+    def wait_reload(self, timeout: Optional[float] = None) -> bool:
+        """Ждет окончания фоновой загрузки; False, если она не успела завершиться"""
+        loader = self._loader
+        if loader is not None:
+            loader.join(timeout)
+            return not loader.is_alive()
+        return True
+
+    def reload(self) -> VectorStore:
+        """Принудительно перечитывает индекс с диска"""
+        with self._lock:
+            return self._publish(*self._open())
+
+    def stats(self) -> Dict[str, Any]:
+        """Информация о загруженном поколении индекса"""
+        return {
+            "loaded": self._store is not None,
+            "generation": self.generation,
+            "version": self.version,
+            "reloading": self._loader is not None and self._loader.is_alive(),
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "index_path": str(self.index_path),
+            "format": "mmap" if isinstance(self._store, MmapIndex) else "langchain",
+        }
+
+
+vectorstore_holder = VectorStoreHolder(
+    INDEX_PATH,
+    settings.faiss_reload_interval,
+    gc_grace=settings.faiss_version_grace_seconds,
+)
+
+
+def get_vectorstore():
+    """Возвращает общее для процесса FAISS векторное хранилище"""
+    return vectorstore_holder.get()
+
+
+def _format_results(docs_and_scores):
+    """Возвращаем только текст документов с их релевантностью"""
+    return [
+        {
+            "content": doc.page_content,
+            "metadata": doc.metadata,
+            "score": score
+        }
+        for doc, score in docs_and_scores
+    ]
 
 def query_index(query: str, k: int = 5):
     """Поиск похожих документов в индексе"""
     try:
         store = get_vectorstore()
-        docs_and_scores = store.similarity_search_with_score(query, k=k)
-        
-        # Возвращаем только текст документов с их релевантностью
-        results = []
-        for doc, score in docs_and_scores:
-            results.append({
-                "content": doc.page_content,
-                "metadata": doc.metadata,
-                "score": score
-            })
-        
-        return results
+        vector = embeddings.embed_query(query)
+        return _format_results(search_vectors(store, [vector], k)[0])
+    except Exception as e:
+        raise RuntimeError(f"Ошибка поиска в индексе: {e}")
+
+
+def search_vectors(store: VectorStore, vectors: List[List[float]], k: int):
+    """Один матричный FAISS поиск для пачки векторов запросов"""
+    if isinstance(store, MmapIndex):
+        return store.search(vectors, k)
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if getattr(store, "_normalize_L2", False):
+        faiss.normalize_L2(matrix)
+
+    distances, indices = store.index.search(matrix, k)
+
+    results = []
+    for row_distances, row_indices in zip(distances, indices):
+        row = []
+        for score, i in zip(row_distances, row_indices):
+            if i == -1:
+                continue
+            doc = store.docstore.search(store.index_to_docstore_id[i])
+            row.append((doc, float(score)))
+        results.append(row)
+    return results
+
+
+async def search_batch(
+    get_store: Callable[[], VectorStore],
+    embedder: Embeddings,
+    items: List[Tuple[str, int]],
+):
+    """Обрабатывает пакет (запрос, k): один запрос эмбеддингов и один поиск в FAISS"""
+    store = await asyncio.to_thread(get_store)
+    vectors = await embedder.aembed_documents([query for query, _ in items])
+    k_max = max(k for _, k in items)
+    rows = await asyncio.to_thread(search_vectors, store, vectors, k_max)
+    return [row[:k] for row, (_, k) in zip(rows, items)]
+
+query_batcher = MicroBatcher(
+    lambda items: search_batch(get_vectorstore, embeddings, items),
+    window=settings.query_batch_window_ms / 1000,
+    max_batch_size=settings.query_batch_max_size,
+)
+
+
+async def query_index_async(query: str, k: int = 5):
+    """Неблокирующий поиск: одновременные запросы эмбеддятся и ищутся пакетами"""
+    try:
+        docs_and_scores = await query_batcher.submit((query, k))
+        return _format_results(docs_and_scores)
     except Exception as e:
         raise RuntimeError(f"Ошибка поиска в индексе: {e}")
 
 def test_index():
     """Тестирование индекса"""
     try:
-        store = get_vectorstore()
         # Простой тест поиска
-        results = store.similarity_search("тест", k=1)
+        results = query_index("тест", k=1)
         return len(results) > 0
     except:
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,590 @@
+# src/app/services/index_store.py
+"""
+Формат индекса, открываемый через mmap
+
+Каталог индекса содержит:
+- index.faiss   - FAISS индекс, читается с флагом mmap (страницы общие для воркеров)
+- records.bin   - тексты чанков и метаданные: подряд идущие JSON записи в UTF-8
+- ids.npy       - отсортированная таблица ID векторов (int64)
+- offsets.npy   - смещения [начало, конец) записи в records.bin для каждого ID
+- meta.json     - описание формата, размерность, число векторов, тип индекса
+- manifest.json - хэши исходных файлов и ID их чанков (для инкрементального ingest)
+
+Каждый ingest пишет индекс в новый каталог versions/<версия>, а затем
+атомарно переключает на него указатель CURRENT в корне индекса. Приложение
+замечает новую версию, загружает ее в фоне и подменяет, а старые версии
+удаляются по истечении grace-периода. Каталог без CURRENT с файлами индекса
+прямо в корне (старая плоская раскладка) по-прежнему читается.
+
+Долгий ingest периодически сохраняет контрольную точку - индекс того же
+формата в соседнем каталоге `.{имя}.checkpoint`, откуда его можно продолжить.
+Точки не копируют сделанное заново: первая содержит снимок FAISS индекса,
+следующие - жесткие ссылки на этот снимок, на records.bin (он только
+дописывается) и на журнал векторов, добавленных после снимка
+(vectors.log / vector_ids.log, число строк - log_rows в meta.json).
+
+В отличие от pickle docstore LangChain, ничего не десериализуется целиком:
+открытие занимает постоянное время, записи читаются по требованию.
+"""
+
+import json
+import mmap
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from src.app.services.index_types import apply_search_params, remove_ids
+
+FORMAT_NAME = "mmap"
+FORMAT_VERSION = 1
+
+INDEX_FILE = "index.faiss"
+RECORDS_FILE = "records.bin"
+IDS_FILE = "ids.npy"
+OFFSETS_FILE = "offsets.npy"
+META_FILE = "meta.json"
+MANIFEST_FILE = "manifest.json"
+DATA_FILES = (INDEX_FILE, RECORDS_FILE, IDS_FILE, OFFSETS_FILE)
+CHECKPOINT_SUFFIX = ".checkpoint"
+VECTORS_LOG = "vectors.log"
+VECTOR_IDS_LOG = "vector_ids.log"
+LOG_FILES = (VECTORS_LOG, VECTOR_IDS_LOG)
+LOG_REPLAY_ROWS = 65536
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+
+
+def is_mmap_index(path: Path) -> bool:
+    """Проверяет, записан ли каталог в mmap формате"""
+    return (Path(path) / META_FILE).exists()
+
+
+def read_meta(path: Path) -> Dict[str, Any]:
+    with open(Path(path) / META_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_faiss_index(path: Path):
+    """Открывает FAISS индекс через mmap, если тип индекса это поддерживает"""
+    mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    try:
+        return faiss.read_index(str(path), mmap_flag | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # Не все типы индексов умеют mmap - читаем обычным способом
+        return faiss.read_index(str(path))
+
+
+def current_version(root: Path) -> Optional[str]:
+    """Имя опубликованной версии индекса; None для плоской раскладки"""
+    try:
+        name = (Path(root) / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return name or None
+
+
+def resolve_index(root: Path) -> Path:
+    """Каталог, из которого читается текущий индекс"""
+    root = Path(root)
+    name = current_version(root)
+    return root / VERSIONS_DIR / name if name else root
+
+
+def new_version_path(root: Path) -> Path:
+    """Каталог для новой версии; имена сортируются в порядке создания"""
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    return Path(root) / VERSIONS_DIR / name
+
+
+def publish_version(root: Path, version_path: Path):
+    """Атомарно переключает CURRENT на записанную версию"""
+    root = Path(root)
+    pointer = root / f".{CURRENT_FILE}.tmp-{os.getpid()}"
+    with open(pointer, "w", encoding="utf-8") as f:
+        f.write(Path(version_path).name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer, root / CURRENT_FILE)
+
+    # Файлы плоской раскладки больше не читаются - убираем их из корня
+    for name in DATA_FILES + (META_FILE, MANIFEST_FILE, "index.pkl"):
+        (root / name).unlink(missing_ok=True)
+
+
+def gc_versions(root: Path, grace_seconds: float) -> List[str]:
+    """Удаляет версии, замененные более grace_seconds назад; возвращает их имена
+
+    Момент замены версии - время записи следующей за ней. Текущая версия и
+    все более новые не удаляются никогда.
+    """
+    versions = Path(root) / VERSIONS_DIR
+    current = current_version(root)
+    if current is None or not versions.exists():
+        return []
+
+    # Каталоги с точкой - недописанные версии ingest'а, который еще работает
+    names = sorted(
+        p.name for p in versions.iterdir() if p.is_dir() and not p.name.startswith(".")
+    )
+    if current not in names:
+        return []
+    now = time.time()
+    removed = []
+    for name, successor in zip(names, names[1:]):
+        if name == current:
+            break
+        try:
+            retired_at = (versions / successor / META_FILE).stat().st_mtime
+        except FileNotFoundError:
+            continue
+        if now - retired_at >= grace_seconds:
+            shutil.rmtree(versions / name, ignore_errors=True)
+            removed.append(name)
+    return removed
+
+
+def checkpoint_path(path: Path) -> Path:
+    """Каталог контрольной точки ingest для индекса"""
+    path = Path(path)
+    return path.parent / f".{path.name}{CHECKPOINT_SUFFIX}"
+
+
+def find_checkpoint(path: Path) -> Optional[Path]:
+    """Последняя целиком записанная контрольная точка индекса, если она есть"""
+    current = checkpoint_path(path)
+    # Прерванная замена оставляет предыдущую точку под суффиксом .old
+    for candidate in (current, current.with_name(current.name + ".old")):
+        if is_mmap_index(candidate):
+            return candidate
+    return None
+
+
+def remove_checkpoint(path: Path):
+    current = checkpoint_path(path)
+    for suffix in ("", ".old", ".new"):
+        shutil.rmtree(current.with_name(current.name + suffix), ignore_errors=True)
+
+
+def link_file(src: Path, dst: Path):
+    """Жесткая ссылка на файл, а если ФС их не поддерживает - копия"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def replay_log(index: faiss.Index, path: Path, rows: int) -> faiss.Index:
+    """Добавляет в индекс первые rows векторов из журнала контрольной точки"""
+    path = Path(path)
+    vectors = np.memmap(
+        path / VECTORS_LOG, dtype=np.float32, mode="r", shape=(rows, index.d)
+    )
+    ids = np.fromfile(path / VECTOR_IDS_LOG, dtype=np.int64, count=rows)
+    for start in range(0, rows, LOG_REPLAY_ROWS):
+        end = start + LOG_REPLAY_ROWS
+        index.add_with_ids(np.ascontiguousarray(vectors[start:end]), ids[start:end])
+    return index
+
+
+def encode_record(page_content: str, metadata: Dict[str, Any]) -> bytes:
+    return json.dumps(
+        {"page_content": page_content, "metadata": metadata},
+        ensure_ascii=False,
+    ).encode("utf-8")
+
+
+class IndexWriter:
+    """Пишет индекс в mmap формате
+
+    Векторы хранятся в IndexIDMap2, поэтому у каждого чанка стабильный ID,
+    по которому его можно удалить при инкрементальном обновлении.
+
+    Файлы создаются во временном каталоге рядом с целевым. Новый (или пустой)
+    целевой каталог публикуется одним переименованием временного - читатель
+    видит либо все файлы индекса, либо ни одного. Существующий каталог
+    обновляется пофайловыми os.replace: процессы со старой версией читают
+    старые inode, но между заменами набор файлов не согласован, поэтому
+    ingest пишет каждую версию в новый каталог (см. publish_version).
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        index: faiss.Index,
+        train_size: int = 0,
+        checkpoint_dir: Optional[Path] = None,
+    ):
+        self.path = Path(path)
+        self.checkpoint_dir = (
+            Path(checkpoint_dir) if checkpoint_dir else checkpoint_path(self.path)
+        )
+        if not isinstance(index, faiss.IndexIDMap2):
+            index = faiss.IndexIDMap2(index)
+        self.index = index
+        # Индексы IVF требуют обучения: копим первые векторы, пока их не хватит
+        self.train_size = train_size
+        self._untrained: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.staging = self.path.parent / f".{self.path.name}.tmp-{os.getpid()}"
+        if self.staging.exists():
+            shutil.rmtree(self.staging)
+        self.staging.mkdir(parents=True)
+        self._records = open(self.staging / RECORDS_FILE, "wb")
+        self._reader = None
+        self._ids: List[int] = []
+        self._offsets: List[Tuple[int, int]] = []
+        self._positions: Dict[int, int] = {}
+        self._position = 0
+        self.next_id = 0
+        # Индекс изменен, а записи дописаны не полностью - сохранять такое нельзя
+        self._broken = False
+        # Журнал векторов после снимка в последней контрольной точке
+        self._log: Optional[Tuple[Any, Any]] = None
+        self._log_rows = 0
+
+    @classmethod
+    def update(
+        cls,
+        path: Path,
+        remove: Iterable[int] = (),
+        target: Optional[Path] = None,
+        checkpoint_dir: Optional[Path] = None,
+    ) -> "IndexWriter":
+        """Открывает существующий индекс для дополнения, удаляя векторы с указанными ID
+
+        target - куда публиковать результат, если не туда же, откуда читаем
+        (например, при продолжении ingest с контрольной точки).
+        """
+        path = Path(path)
+        meta = read_meta(path)
+        # Обычное чтение, не mmap: индекс будет изменяться
+        index = faiss.read_index(str(path / INDEX_FILE))
+        if meta.get("log_rows"):
+            index = replay_log(index, path, meta["log_rows"])
+        removed = np.asarray(sorted(set(remove)), dtype=np.int64)
+        if len(removed):
+            index = remove_ids(index, removed, meta)
+
+        writer = cls(target or path, index, checkpoint_dir=checkpoint_dir)
+        ids = np.load(path / IDS_FILE, mmap_mode="r")
+        offsets = np.load(path / OFFSETS_FILE, mmap_mode="r")
+        keep = ~np.isin(ids, removed)
+        with open(path / RECORDS_FILE, "rb") as f:
+            for record_id, (start, end) in zip(ids[keep], offsets[keep]):
+                f.seek(start)
+                writer._append_record(int(record_id), f.read(end - start))
+        writer.next_id = int(ids.max()) + 1 if len(ids) else 0
+        return writer
+
+    @property
+    def count(self) -> int:
+        return len(self._ids)
+
+    def _append_record(self, record_id: int, payload: bytes):
+        self._records.write(payload)
+        span = (self._position, self._position + len(payload))
+        self._position += len(payload)
+        position = self._positions.get(record_id)
+        if position is None:
+            self._positions[record_id] = len(self._ids)
+            self._ids.append(record_id)
+            self._offsets.append(span)
+        else:
+            # Перезапись: новая версия дописывается в конец, старые байты
+            # остаются мусором до следующего IndexWriter.update
+            self._offsets[position] = span
+
+    def read_record(self, record_id: int) -> Optional[Document]:
+        """Читает уже добавленную запись"""
+        position = self._positions.get(record_id)
+        if position is None:
+            return None
+        self._records.flush()
+        if self._reader is None:
+            self._reader = open(self.staging / RECORDS_FILE, "rb")
+        start, end = self._offsets[position]
+        self._reader.seek(start)
+        record = json.loads(self._reader.read(end - start))
+        return Document(
+            page_content=record["page_content"], metadata=record["metadata"]
+        )
+
+    def update_record(self, record_id: int, document: Document):
+        """Заменяет текст и метаданные записи, не трогая ее вектор"""
+        if record_id not in self._positions:
+            raise KeyError(record_id)
+        self._append_record(
+            record_id, encode_record(document.page_content, document.metadata)
+        )
+
+    def _close_files(self):
+        self._records.close()
+        if self._reader is not None:
+            self._reader.close()
+        self._close_log()
+
+    def _start_log(self):
+        """Новый журнал векторов; прежний остается у ссылающейся на него точки"""
+        self._close_log()
+        for name in LOG_FILES:
+            (self.staging / name).unlink(missing_ok=True)
+        self._log = tuple(open(self.staging / name, "wb") for name in LOG_FILES)
+        self._log_rows = 0
+
+    def _close_log(self):
+        log, self._log = self._log, None
+        for f in log or ():
+            f.close()
+
+    def _index_add(self, vectors: np.ndarray, ids: np.ndarray):
+        self.index.add_with_ids(vectors, ids)
+        if self._log is None:
+            return
+        try:
+            self._log[0].write(vectors.tobytes())
+            self._log[1].write(ids.tobytes())
+            self._log_rows += len(ids)
+        except OSError:
+            # Без журнала следующая точка просто сохранит полный снимок
+            self._close_log()
+
+    def add(
+        self,
+        vectors: np.ndarray,
+        documents: Iterable[Document],
+        ids: Optional[Iterable[int]] = None,
+    ) -> List[int]:
+        """Добавляет векторы и соответствующие им документы, возвращает их ID
+
+        Добавление атомарно: при ошибке в writer не остается ни векторов,
+        ни записей пакета. Векторы, ждущие обучения IVF индекса, остаются в
+        буфере вместе со своими записями и при ошибке обучения не теряются.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if ids is None:
+            ids = range(self.next_id, self.next_id + len(vectors))
+        ids = np.asarray(list(ids), dtype=np.int64)
+        # Записи кодируются заранее: ошибка здесь ничего не меняет
+        records = [
+            (int(record_id), encode_record(doc.page_content, doc.metadata))
+            for record_id, doc in zip(ids, documents)
+        ]
+        if len(ids):
+            self.next_id = max(self.next_id, int(ids.max()) + 1)
+
+        if self.index.is_trained:
+            self._index_add(vectors, ids)
+            self._append_records(records)
+        else:
+            self._append_records(records)
+            self._untrained.append((vectors, ids))
+            if sum(len(v) for v, _ in self._untrained) >= self.train_size:
+                self._train()
+        return ids.tolist()
+
+    def _append_records(self, records: List[Tuple[int, bytes]]):
+        try:
+            for record_id, payload in records:
+                self._append_record(record_id, payload)
+        except BaseException:
+            self._broken = True
+            raise
+
+    def _train(self):
+        data = np.concatenate([v for v, _ in self._untrained])
+        ids = np.concatenate([i for _, i in self._untrained])
+        try:
+            self.index.train(data)
+        except RuntimeError as e:
+            raise ValueError(
+                f"Недостаточно векторов ({len(data)}) для обучения индекса, "
+                f"уменьшите nlist: {e}"
+            )
+        self._index_add(data, ids)
+        # Буфер очищается, только когда векторы действительно в индексе
+        self._untrained = []
+
+    def _check_consistent(self):
+        if self._broken:
+            raise RuntimeError(
+                "Запись индекса прервана на середине пакета - сохранять его нельзя"
+            )
+
+    def _save(
+        self,
+        folder: Path,
+        extra_meta: Optional[Dict[str, Any]],
+        manifest: Optional[Dict[str, Any]],
+        write_index: bool = True,
+    ) -> Tuple[Dict[str, Any], List[str]]:
+        """Пишет таблицы ID, индекс, meta.json и манифест; records.bin уже на месте"""
+        ids = np.asarray(self._ids, dtype=np.int64)
+        offsets = np.asarray(self._offsets, dtype=np.int64).reshape(-1, 2)
+        order = np.argsort(ids, kind="stable")
+        np.save(folder / IDS_FILE, ids[order])
+        np.save(folder / OFFSETS_FILE, offsets[order])
+        if write_index:
+            faiss.write_index(self.index, str(folder / INDEX_FILE))
+
+        meta = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "dim": self.index.d,
+            "count": int(self.index.ntotal),
+            "created_at": time.time(),
+        }
+        meta.update(extra_meta or {})
+
+        names = list(DATA_FILES)
+        if manifest is not None:
+            with open(folder / MANIFEST_FILE, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False)
+            names.append(MANIFEST_FILE)
+        with open(folder / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        return meta, names
+
+    def checkpoint(
+        self,
+        extra_meta: Optional[Dict[str, Any]] = None,
+        manifest: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """Сохраняет текущее состояние в контрольную точку, не публикуя индекс
+
+        Возвращает False, если сохранить нечего: IVF индекс еще не обучен и
+        векторы пока только копятся в памяти.
+
+        Первая точка writer'а пишет снимок индекса, следующие ссылаются на него
+        и на журнал новых векторов - объем записи пропорционален новым данным.
+        """
+        self._check_consistent()
+        if self._untrained:
+            return False
+
+        current = self.checkpoint_dir
+        fresh = current.with_name(current.name + ".new")
+        old = current.with_name(current.name + ".old")
+        shutil.rmtree(fresh, ignore_errors=True)
+        fresh.mkdir(parents=True)
+
+        # records.bin только дописывается: точке хватает ссылки на файл и смещений
+        self._records.flush()
+        link_file(self.staging / RECORDS_FILE, fresh / RECORDS_FILE)
+        if self._log is not None and (current / INDEX_FILE).exists():
+            link_file(current / INDEX_FILE, fresh / INDEX_FILE)
+            for name, f in zip(LOG_FILES, self._log):
+                f.flush()
+                link_file(self.staging / name, fresh / name)
+            log_rows = self._log_rows
+        else:
+            faiss.write_index(self.index, str(fresh / INDEX_FILE))
+            self._start_log()
+            log_rows = 0
+        meta = dict(extra_meta or {}, log_rows=log_rows)
+        self._save(fresh, meta, manifest, write_index=False)
+
+        # Каталог целиком заменяется двумя переименованиями: в любой момент на
+        # диске есть полная точка - текущая или предыдущая (.old)
+        shutil.rmtree(old, ignore_errors=True)
+        if current.exists():
+            os.replace(current, old)
+        os.replace(fresh, current)
+        shutil.rmtree(old, ignore_errors=True)
+        return True
+
+    def commit(
+        self,
+        extra_meta: Optional[Dict[str, Any]] = None,
+        manifest: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Сохраняет индекс и публикует его в целевой каталог
+
+        Новый или пустой каталог заменяется временным целиком, одним
+        переименованием. В существующий каталог файлы переносятся по одному,
+        и атомарна только замена каждого файла.
+        """
+        self._check_consistent()
+        self._close_files()
+        for name in LOG_FILES:
+            (self.staging / name).unlink(missing_ok=True)
+        if self._untrained:
+            self._train()
+        meta, names = self._save(self.staging, extra_meta, manifest)
+
+        if not self.path.exists() or not any(self.path.iterdir()):
+            # rename поверх пустого каталога атомарен
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(self.staging, self.path)
+            return meta
+
+        for name in names:
+            os.replace(self.staging / name, self.path / name)
+        # meta.json публикуется последним - по нему читатели замечают новую версию
+        os.replace(self.staging / META_FILE, self.path / META_FILE)
+        shutil.rmtree(self.staging, ignore_errors=True)
+        return meta
+
+    def abort(self):
+        self._close_files()
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+class MmapIndex:
+    """Индекс, открытый через mmap: векторы, тексты и метаданные читаются по запросу"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.meta = read_meta(self.path)
+        if self.meta.get("format") != FORMAT_NAME:
+            raise ValueError(f"Неизвестный формат индекса: {self.meta.get('format')}")
+
+        self.index = apply_search_params(
+            read_faiss_index(self.path / INDEX_FILE), self.meta
+        )
+        self.ids = np.load(self.path / IDS_FILE, mmap_mode="r")
+        self.offsets = np.load(self.path / OFFSETS_FILE, mmap_mode="r")
+
+        with open(self.path / RECORDS_FILE, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap нулевой длины создать нельзя - пустой индекс обходится без него
+            self._blob = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+            )
+
+    def __len__(self) -> int:
+        return int(self.index.ntotal)
+
+    def get(self, record_id: int) -> Optional[Document]:
+        """Возвращает документ по ID вектора"""
+        pos = int(np.searchsorted(self.ids, record_id))
+        if pos >= len(self.ids) or self.ids[pos] != record_id:
+            return None
+        start, end = self.offsets[pos]
+        record = json.loads(self._blob[start:end])
+        return Document(
+            page_content=record["page_content"], metadata=record["metadata"]
+        )
+
+    def search(
+        self, vectors: List[List[float]], k: int
+    ) -> List[List[Tuple[Document, float]]]:
+        """Матричный поиск: для каждого вектора список (документ, расстояние)"""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        distances, indices = self.index.search(matrix, k)
+
+        results = []
+        for row_distances, row_indices in zip(distances, indices):
+            row = []
+            for score, i in zip(row_distances, row_indices):
+                if i == -1:
+                    continue
+                doc = self.get(int(i))
+                if doc is not None:
+                    row.append((doc, float(score)))
+            results.append(row)
+        return results
@@ -0,0 +1,121 @@
+# src/app/services/index_types.py
+"""
+Типы FAISS индексов, доступные при ingest
+
+- flat      - точный поиск полным перебором (по умолчанию)
+- ivf-flat  - инвертированные списки: поиск только в nprobe из nlist кластеров
+- ivf-pq    - IVF + product quantization: векторы сжаты до pq_m * pq_bits бит
+- hnsw      - граф HNSW: быстрый поиск без обучения, больше памяти
+
+Выбранный тип и параметры записываются в meta.json индекса, а при открытии
+индекса в приложении применяются параметры поиска (nprobe, efSearch).
+"""
+
+from typing import Any, Dict
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf-flat", "ivf-pq", "hnsw")
+
+DEFAULT_PARAMS: Dict[str, Dict[str, Any]] = {
+    "flat": {},
+    "ivf-flat": {"nlist": 1024, "nprobe": 16},
+    "ivf-pq": {"nlist": 1024, "nprobe": 16, "pq_m": 64, "pq_bits": 8},
+    "hnsw": {"hnsw_m": 32, "ef_construction": 200, "ef_search": 64},
+}
+
+# Минимум обучающих векторов на кластер, который рекомендует FAISS
+TRAIN_POINTS_PER_CENTROID = 39
+
+
+def resolve_params(index_type: str, overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """Параметры по умолчанию для типа индекса, дополненные переданными значениями"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(
+            f"Неизвестный тип индекса: {index_type}. Доступны: {', '.join(INDEX_TYPES)}"
+        )
+
+    params = dict(DEFAULT_PARAMS[index_type])
+    for key, value in overrides.items():
+        if key in params and value is not None:
+            params[key] = value
+    return params
+
+
+def build_index(index_type: str, dim: int, params: Dict[str, Any]) -> faiss.Index:
+    """Создает пустой FAISS индекс (L2 метрика, как у LangChain FAISS)"""
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+
+    if index_type == "ivf-flat":
+        quantizer = faiss.IndexFlatL2(dim)
+        return faiss.IndexIVFFlat(quantizer, dim, params["nlist"], faiss.METRIC_L2)
+
+    if index_type == "ivf-pq":
+        if dim % params["pq_m"] != 0:
+            raise ValueError(
+                f"Размерность {dim} должна делиться на pq_m={params['pq_m']}"
+            )
+        quantizer = faiss.IndexFlatL2(dim)
+        return faiss.IndexIVFPQ(
+            quantizer, dim, params["nlist"], params["pq_m"], params["pq_bits"]
+        )
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"], faiss.METRIC_L2)
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.hnsw.efSearch = params["ef_search"]
+        return index
+
+    raise ValueError(f"Неизвестный тип индекса: {index_type}")
+
+
+def train_size(index_type: str, params: Dict[str, Any]) -> int:
+    """Сколько векторов собрать перед обучением индекса (0 - обучение не нужно)"""
+    if index_type in ("ivf-flat", "ivf-pq"):
+        return params["nlist"] * TRAIN_POINTS_PER_CENTROID
+    return 0
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """Возвращает индекс под оберткой IndexIDMap"""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return faiss.downcast_index(index)
+
+
+def remove_ids(
+    index: faiss.IndexIDMap2, ids: np.ndarray, meta: Dict[str, Any]
+) -> faiss.IndexIDMap2:
+    """Удаляет векторы по ID; HNSW удаление не поддерживает - индекс пересобирается"""
+    ids = np.asarray(ids, dtype=np.int64)
+    try:
+        index.remove_ids(ids)
+        return index
+    except RuntimeError:
+        pass
+
+    all_ids = faiss.vector_to_array(index.id_map)
+    keep = ~np.isin(all_ids, ids)
+    vectors = base_index(index).reconstruct_n(0, index.ntotal)[keep]
+
+    index_type = meta.get("index_type", "flat")
+    rebuilt = faiss.IndexIDMap2(
+        build_index(index_type, index.d, meta.get("index_params", {}))
+    )
+    if len(vectors):
+        rebuilt.add_with_ids(vectors, all_ids[keep])
+    return rebuilt
+
+
+def apply_search_params(index: faiss.Index, meta: Dict[str, Any]) -> faiss.Index:
+    """Применяет параметры поиска из meta.json к открытому индексу"""
+    index_type = meta.get("index_type", "flat")
+    params = meta.get("index_params", {})
+
+    if index_type in ("ivf-flat", "ivf-pq") and "nprobe" in params:
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+    elif index_type == "hnsw" and "ef_search" in params:
+        base_index(index).hnsw.efSearch = params["ef_search"]
+    return index
@@ -0,0 +1,229 @@
+# src/app/services/ingest_embedder.py
+"""
+Конкурентный эмбеддинг для ingest с учетом лимитов OpenAI
+
+- пакеты формируются по числу токенов (tiktoken), а не по числу чанков;
+- несколько пакетов одновременно "в полете";
+- темп ограничен token bucket'ами на запросы и токены в минуту;
+- неудачные пакеты повторяются с экспоненциальной задержкой;
+- результаты выдаются строго в порядке пакетов, поэтому индекс
+  детерминирован независимо от того, какой запрос завершился первым.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import numpy as np
+import tiktoken
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.app.core.logger import logger
+
+# Кодировка токенизатора text-embedding-ada-002 / text-embedding-3-*
+EMBEDDING_ENCODING = "cl100k_base"
+# Лимиты API эмбеддингов на один запрос
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 300_000
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Число токенов текста в кодировке модели эмбеддингов"""
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding(EMBEDDING_ENCODING)
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def batch_by_tokens(
+    documents: Iterable[Document],
+    max_tokens: int,
+    max_items: int = MAX_INPUTS_PER_REQUEST,
+) -> Iterable[List[Document]]:
+    """Группирует документы в пакеты не больше max_tokens токенов и max_items штук"""
+    batch: List[Document] = []
+    batch_tokens = 0
+    for doc in documents:
+        tokens = doc.metadata.get("tokens") or count_tokens(doc.page_content)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(doc)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+class TokenBucket:
+    """Token bucket: не более `per_minute` единиц в минуту с равномерным пополнением"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        # Запрос больше емкости ведра иначе не дождался бы никогда
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """Лимиты запросов и токенов в минуту (RPM/TPM) аккаунта OpenAI"""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, tokens: int):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+
+class EmbeddingFailed(RuntimeError):
+    """Пакет не удалось заэмбеддить после всех повторов"""
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Задержка из заголовка Retry-After ответа OpenAI, если она есть"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ConcurrentEmbedder:
+    """Держит до `concurrency` запросов эмбеддингов одновременно"""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        concurrency: int = 4,
+        requests_per_minute: float = 3000,
+        tokens_per_minute: float = 1_000_000,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.embeddings = embeddings
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # seconds - сумма длительностей запросов, busy_seconds - время, когда
+        # шел хотя бы один запрос (при конкурентных запросах меньше seconds)
+        self.stats: Dict[str, float] = {
+            "requests": 0, "retries": 0, "chunks": 0, "tokens": 0,
+            "seconds": 0.0, "busy_seconds": 0.0,
+        }
+        self._active = 0
+        self._busy_since = 0.0
+
+    def _begin_request(self):
+        if self._active == 0:
+            self._busy_since = time.perf_counter()
+        self._active += 1
+
+    def _end_request(self):
+        self._active -= 1
+        if self._active == 0:
+            self.stats["busy_seconds"] += time.perf_counter() - self._busy_since
+
+    async def embed_batch(self, batch: List[Document]) -> np.ndarray:
+        """Эмбеддит один пакет с повторами и экспоненциальной задержкой"""
+        texts = [doc.page_content for doc in batch]
+        tokens = sum(
+            doc.metadata.get("tokens") or count_tokens(text)
+            for doc, text in zip(batch, texts)
+        )
+
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(tokens)
+            self.stats["requests"] += 1
+            started = time.perf_counter()
+            self._begin_request()
+            try:
+                try:
+                    vectors = await self.embeddings.aembed_documents(texts)
+                finally:
+                    self._end_request()
+                    self.stats["seconds"] += time.perf_counter() - started
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise EmbeddingFailed(
+                        f"Пакет из {len(batch)} частей не заэмбеддился "
+                        f"после {self.max_retries + 1} попыток: {e}"
+                    ) from e
+                delay = _retry_after(e) or min(
+                    self.max_delay, self.base_delay * 2 ** attempt
+                )
+                # Разносим повторы параллельных пакетов
+                delay *= 1 + random.random() * 0.25
+                self.stats["retries"] += 1
+                logger.warning(
+                    f"Ошибка эмбеддинга ({e}), повтор {attempt + 1} через {delay:.1f} с"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            self.stats["chunks"] += len(batch)
+            self.stats["tokens"] += tokens
+            return np.asarray(vectors, dtype=np.float32)
+
+    async def embed_stream(
+        self,
+        batches: Union[Iterable[List[Document]], AsyncIterable[List[Document]]],
+    ) -> AsyncIterator[Tuple[List[Document], np.ndarray]]:
+        """Эмбеддит пакеты конкурентно и выдает (пакет, векторы) в исходном порядке"""
+        in_flight: deque = deque()
+
+        async def batches_iter():
+            if hasattr(batches, "__aiter__"):
+                async for batch in batches:
+                    yield batch
+            else:
+                for batch in batches:
+                    yield batch
+
+        try:
+            async for batch in batches_iter():
+                in_flight.append((batch, asyncio.create_task(self.embed_batch(batch))))
+                if len(in_flight) >= self.concurrency:
+                    done_batch, task = in_flight.popleft()
+                    yield done_batch, await task
+            while in_flight:
+                done_batch, task = in_flight.popleft()
+                yield done_batch, await task
+        finally:
+            for _, task in in_flight:
+                task.cancel()
@@ -0,0 +1,133 @@
+# src/app/services/ingest_manifest.py
+"""
+Манифест инкрементального ingest
+
+Для каждого исходного файла хранит SHA-256 содержимого и ID его чанков в
+индексе. По манифесту ingest определяет, какие файлы новые, изменены или
+удалены, и эмбеддит только их, не трогая остальные векторы.
+
+Одинаковые чанки разных файлов хранятся в индексе один раз: ID такого чанка
+входит в списки нескольких файлов, а манифест хранит хэш содержимого каждого
+чанка, чтобы следующий запуск находил дубликаты и среди старых векторов.
+"""
+
+import hashlib
+import json
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: Path, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 содержимого файла, читаемого блоками"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_sha256(text: str) -> str:
+    """Хэш содержимого чанка: различия в пробелах и формах Unicode не учитываются"""
+    normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def scan_documents(folder: Path, extensions: Iterable[str]) -> Dict[str, Path]:
+    """Поддерживаемые файлы папки: относительный путь -> путь"""
+    extensions = {e.lower() for e in extensions}
+    return {
+        file.relative_to(folder).as_posix(): file
+        for file in sorted(folder.glob("*"))
+        if file.is_file() and file.suffix.lower() in extensions
+    }
+
+
+class Manifest:
+    """Состояние индекса на момент последнего ingest"""
+
+    def __init__(
+        self,
+        settings: Dict[str, Any],
+        files: Optional[Dict[str, Dict[str, Any]]] = None,
+        hashes: Optional[Dict[int, str]] = None,
+    ):
+        self.settings = settings
+        self.files: Dict[str, Dict[str, Any]] = files or {}
+        # ID чанка -> хэш его содержимого
+        self.hashes: Dict[int, str] = hashes or {}
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["Manifest"]:
+        """Читает манифест; None, если его нет или формат устарел"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        hashes = {
+            int(chunk_id): sha
+            for chunk_id, sha in data.get("content_hashes", {}).items()
+        }
+        return cls(data.get("settings", {}), data.get("files", {}), hashes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Хэши чанков, на которые больше не ссылается ни один файл, не сохраняем
+        referenced = set(self.chunk_ids(self.files))
+        return {
+            "version": MANIFEST_VERSION,
+            "settings": self.settings,
+            "files": self.files,
+            "content_hashes": {
+                str(chunk_id): sha
+                for chunk_id, sha in self.hashes.items()
+                if chunk_id in referenced
+            },
+        }
+
+    def diff(self, hashes: Dict[str, str]) -> Dict[str, List[str]]:
+        """Сравнивает текущие хэши файлов с манифестом"""
+        result = {"added": [], "changed": [], "removed": [], "unchanged": []}
+        for name, sha in hashes.items():
+            entry = self.files.get(name)
+            if entry is None:
+                result["added"].append(name)
+            elif entry.get("sha256") != sha:
+                result["changed"].append(name)
+            else:
+                result["unchanged"].append(name)
+        result["removed"] = [name for name in self.files if name not in hashes]
+        return result
+
+    def chunk_ids(self, names: Iterable[str]) -> List[int]:
+        ids = []
+        for name in names:
+            ids.extend(self.files.get(name, {}).get("chunk_ids", []))
+        return ids
+
+    def content_index(self) -> Dict[str, int]:
+        """Хэш содержимого -> ID чанка для чанков, которые остаются в индексе"""
+        referenced = set(self.chunk_ids(self.files))
+        return {
+            sha: chunk_id
+            for chunk_id, sha in self.hashes.items()
+            if chunk_id in referenced
+        }
+
+    def record(
+        self,
+        name: str,
+        sha256: Optional[str],
+        chunk_ids: List[int],
+        hashes: Optional[Dict[int, str]] = None,
+    ):
+        """Запоминает файл; sha256=None - файл обработан не полностью, будет повторен"""
+        self.files[name] = {"sha256": sha256, "chunk_ids": chunk_ids}
+        self.hashes.update(hashes or {})
+
+    def forget(self, name: str):
+        self.files.pop(name, None)
@@ -0,0 +1,135 @@
+# src/app/services/ingest_metrics.py
+"""
+Замеры стадий ingest для сравнения запусков между собой
+
+Стадии конвейера работают одновременно, поэтому для каждой стадии
+считается время ее собственной работы, а не доля общего времени:
+
+- load   - ожидание следующего разобранного файла от загрузчика
+- split  - разбиение на части и дедупликация
+- embed  - время, когда шел хотя бы один запрос эмбеддингов; сумма
+           длительностей запросов (при конкурентных запросах больше) -
+           в request_seconds
+- add    - добавление векторов и записей в индекс
+- open / save - открытие прошлой версии индекса и сохранение новой
+
+Отчет - JSON с общим временем, пиковым RSS и счетчиками по стадиям.
+"""
+
+import json
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator
+
+REPORT_VERSION = 1
+REPORTS_DIR = "reports"
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """Пиковый RSS процесса (или его завершившихся дочерних процессов) в МБ"""
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux отдает килобайты, macOS - байты
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+class StageStats:
+    """Счетчики одной стадии"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.calls = 0
+        self.items = 0
+        self.nbytes = 0
+        self.tokens = 0
+        self.request_seconds = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        stats = {
+            "seconds": round(self.seconds, 4),
+            "calls": self.calls,
+            "items": self.items,
+            "bytes": self.nbytes,
+            "tokens": self.tokens,
+            "items_per_second": (
+                round(self.items / self.seconds, 2) if self.seconds else None
+            ),
+            "megabytes_per_second": (
+                round(self.nbytes / 1024 / 1024 / self.seconds, 3)
+                if self.seconds and self.nbytes
+                else None
+            ),
+            "tokens_per_second": (
+                round(self.tokens / self.seconds, 1)
+                if self.seconds and self.tokens
+                else None
+            ),
+        }
+        if self.request_seconds:
+            stats["request_seconds"] = round(self.request_seconds, 4)
+        return stats
+
+
+class IngestMetrics:
+    """Накопитель замеров; безопасен для вызова из потока загрузки и event loop"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self.stages: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        stage: str,
+        seconds: float = 0.0,
+        items: int = 0,
+        nbytes: int = 0,
+        tokens: int = 0,
+        calls: int = 1,
+        request_seconds: float = 0.0,
+    ):
+        with self._lock:
+            stats = self.stages.setdefault(stage, StageStats())
+            stats.seconds += seconds
+            stats.request_seconds += request_seconds
+            stats.calls += calls
+            stats.items += items
+            stats.nbytes += nbytes
+            stats.tokens += tokens
+
+    @contextmanager
+    def stage(
+        self, stage: str, items: int = 0, nbytes: int = 0, tokens: int = 0
+    ) -> Iterator[None]:
+        """Замеряет блок кода как работу стадии"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started, items, nbytes, tokens)
+
+    def report(self, **extra: Any) -> Dict[str, Any]:
+        with self._lock:
+            stages = {name: stats.to_dict() for name, stats in self.stages.items()}
+        report = {
+            "version": REPORT_VERSION,
+            "started_at": self.started_at,
+            "wall_seconds": round(time.perf_counter() - self.started, 4),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "peak_rss_children_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+            "stages": stages,
+        }
+        report.update(extra)
+        return report
+
+    def write(self, path: Path, **extra: Any) -> Dict[str, Any]:
+        report = self.report(**extra)
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return report
@@ -0,0 +1,447 @@
+# src/app/services/ingest_pipeline.py
+"""
+Потоковый конвейер ingest: загрузка -> разбиение -> эмбеддинг -> индекс
+
+Стадии связаны ограниченными буферами, поэтому в памяти одновременно
+находятся лишь несколько файлов и пакетов, независимо от размера корпуса:
+
+- загрузка и разбиение файлов идут в фоновом потоке, части собираются в
+  пакеты по токенам по мере поступления, готовых пакетов в буфере не более
+  `buffer_size`;
+- ConcurrentEmbedder держит ограниченное число пакетов в полете;
+- готовые векторы сразу добавляются в индекс, тексты пишутся на диск;
+- части с уже встречавшимся содержимым не эмбеддятся повторно.
+
+Стадии работают одновременно: пока идут запросы эмбеддингов, следующий
+файл уже читается и разбивается.
+
+Каждые `checkpoint_every` пакетов (и при прерывании) вызывается `checkpoint`
+с writer'ом и списком полностью записанных файлов - так долгий ingest можно
+продолжить с последней контрольной точки.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from langchain_core.documents import Document
+
+from src.app.services.ingest_embedder import ConcurrentEmbedder, batch_by_tokens
+from src.app.services.ingest_manifest import chunk_sha256
+from src.app.services.ingest_metrics import IngestMetrics
+
+_DONE = object()
+
+
+async def threaded_iter(iterable: Iterable[Any], maxsize: int) -> AsyncIterator[Any]:
+    """Итерирует в фоновом потоке, опережая потребителя не больше чем на maxsize"""
+    buffer: "queue.Queue" = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        buffer.put((item, None), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            buffer.put((_DONE, None))
+        except BaseException as e:
+            buffer.put((_DONE, e))
+
+    thread = threading.Thread(target=produce, name="ingest-loader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = await asyncio.to_thread(buffer.get)
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def load_sequential(
+    files: Dict[str, Path],
+    load_file: Callable[[Path], List[Document]],
+) -> Iterator[Tuple[str, Optional[List[Document]], Optional[Exception]]]:
+    """Загружает файлы по одному: (имя, документы, ошибка)"""
+    for name, path in files.items():
+        try:
+            yield name, load_file(path), None
+        except Exception as e:
+            yield name, None, e
+
+
+def _timed_load(load_file: Callable[[Path], List[Document]], path: Path):
+    """Выполняется в процессе пула: документы файла и процессорное время его разбора
+
+    Считается время CPU потока, а не всего процесса: без пула разбор идет в
+    фоновом потоке процесса, где параллельно работают event loop и эмбеддинги.
+    """
+    started = time.thread_time()
+    docs = load_file(path)
+    return docs, time.thread_time() - started
+
+
+class ParallelLoader:
+    """Загружает файлы в пуле процессов, выдавая результаты в исходном порядке
+
+    Разбор PDF упирается в CPU, поэтому потоки не помогают из-за GIL.
+    Впереди потребителя не более `workers * 2` файлов, чтобы не держать
+    в памяти весь корпус. load_file должна быть функцией модульного уровня.
+
+    Если процесс пула падает (например, OOM на битом файле), файлы, которые
+    были в пуле, получают ошибку, а остальные идут в новый пул.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.stats = {
+            "files": 0, "pages": 0, "bytes": 0, "cpu_seconds": 0.0, "seconds": 0.0,
+            "restarts": 0,
+        }
+
+    def __call__(
+        self,
+        files: Dict[str, Path],
+        load_file: Callable[[Path], List[Document]],
+    ) -> Iterator[Tuple[str, Optional[List[Document]], Optional[Exception]]]:
+        if self.workers == 1 or len(files) < 2:
+            # Пул ради одного файла только добавил бы время на запуск процессов
+            yield from self._track(self._sequential(files, load_file), files)
+            return
+        yield from self._track(self._parallel(files, load_file), files)
+
+    def _sequential(self, files, load_file):
+        for name, path in files.items():
+            try:
+                docs, seconds = _timed_load(load_file, path)
+            except Exception as e:
+                yield name, None, e
+                continue
+            self.stats["cpu_seconds"] += seconds
+            yield name, docs, None
+
+    def _parallel(self, files, load_file):
+        pending: deque = deque()
+        # spawn, а не fork: загрузчик работает в фоновом потоке процесса с event loop
+        context = multiprocessing.get_context("spawn")
+
+        def new_pool():
+            return ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+        pool = new_pool()
+        try:
+            for name, path in files.items():
+                try:
+                    future = pool.submit(_timed_load, load_file, path)
+                except BrokenProcessPool:
+                    # Ждущие файлы упавшего пула уже получили ошибку
+                    pool.shutdown()
+                    pool = new_pool()
+                    self.stats["restarts"] += 1
+                    print("  ⚠️ Процесс разбора упал, пул перезапущен")
+                    future = pool.submit(_timed_load, load_file, path)
+                pending.append((name, future))
+                if len(pending) >= self.workers * 2:
+                    yield self._result(*pending.popleft())
+            while pending:
+                yield self._result(*pending.popleft())
+        finally:
+            pool.shutdown()
+
+    def _result(self, name, future):
+        try:
+            docs, seconds = future.result()
+        except Exception as e:
+            return name, None, e
+        self.stats["cpu_seconds"] += seconds
+        return name, docs, None
+
+    def _track(self, results, files):
+        started = time.perf_counter()
+        try:
+            for name, docs, error in results:
+                if error is None:
+                    self.stats["files"] += 1
+                    self.stats["pages"] += len(docs)
+                    self.stats["bytes"] += files[name].stat().st_size
+                self.stats["seconds"] = time.perf_counter() - started
+                yield name, docs, error
+        finally:
+            self.stats["seconds"] = time.perf_counter() - started
+
+
+def source_ref(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Ссылка на место чанка в исходном документе"""
+    return {key: metadata[key] for key in ("source", "page") if key in metadata}
+
+
+def add_sources(writer, record_id: int, refs: List[Dict[str, Any]]):
+    """Дописывает ссылки на копии чанка в metadata["sources"] его записи"""
+    doc = writer.read_record(record_id)
+    sources = doc.metadata.get("sources") or [source_ref(doc.metadata)]
+    new = [ref for ref in refs if ref not in sources]
+    if new:
+        doc.metadata["sources"] = sources + new
+        writer.update_record(record_id, doc)
+
+
+def drop_sources(writer, record_ids: Iterable[int], removed: Iterable[str]):
+    """Убирает ссылки на удаленные или измененные файлы из общих чанков"""
+    removed = set(removed)
+    for record_id in record_ids:
+        doc = writer.read_record(record_id)
+        if doc is None:
+            continue
+        sources = doc.metadata.get("sources") or [source_ref(doc.metadata)]
+        kept = [ref for ref in sources if ref.get("source") not in removed]
+        if len(kept) == len(sources) or not kept:
+            continue
+        doc.metadata["sources"] = kept
+        # Основной источник - первая оставшаяся копия
+        doc.metadata.pop("page", None)
+        doc.metadata.update(kept[0])
+        writer.update_record(record_id, doc)
+
+
+class IngestPipeline:
+    """Собирает индекс из файлов, не держа корпус в памяти целиком
+
+    Одинаковые по содержимому части (повторяющиеся колонтитулы, копии и
+    редакции одного документа) эмбеддятся и хранятся один раз: копия не идет
+    в эмбеддинг, а ее ID и ссылка на источник добавляются к уже записанной части.
+    """
+
+    def __init__(
+        self,
+        load_file: Callable[[Path], List[Document]],
+        split: Callable[[List[Document]], List[Document]],
+        embedder: ConcurrentEmbedder,
+        batch_tokens: int,
+        buffer_size: int = 4,
+        loader: Callable = load_sequential,
+        checkpoint: Optional[Callable[[Any, List[str]], None]] = None,
+        checkpoint_every: int = 0,
+        metrics: Optional[IngestMetrics] = None,
+    ):
+        self.load_file = load_file
+        self.split = split
+        self.embedder = embedder
+        self.batch_tokens = batch_tokens
+        self.buffer_size = buffer_size
+        self.loader = loader
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.metrics = metrics or IngestMetrics()
+        self.added_ids: Dict[str, List[int]] = {}
+        self.chunk_hashes: Dict[int, str] = {}
+        self.expected: Dict[str, int] = {}
+        self._done: Dict[str, int] = {}
+        self.failed: Dict[str, str] = {}
+        self.stats = {
+            "files": 0, "documents": 0, "chunks": 0,
+            "duplicates": 0, "batches": 0, "checkpoints": 0,
+        }
+
+    def completed(self) -> List[str]:
+        """Файлы, все части которых уже добавлены в индекс"""
+        return [
+            name for name, count in list(self.expected.items())
+            if self._done.get(name, 0) == count
+        ]
+
+    def _checkpoint(self, writer):
+        if self.checkpoint is None or writer is None:
+            return
+        self._flush_sources(writer)
+        if self.checkpoint(writer, self.completed()):
+            self.stats["checkpoints"] += 1
+
+    def _chunks(self, files: Dict[str, Path]) -> Iterator[Document]:
+        """Стадии загрузки, разбиения и дедупликации: части файлов, файл за файлом"""
+        results = iter(self.loader(files, self.load_file))
+        while True:
+            started = time.perf_counter()
+            try:
+                name, docs, error = next(results)
+            except StopIteration:
+                break
+            if error is not None:
+                print(f"  ❌ Ошибка загрузки {name}: {error}")
+                self.failed[name] = str(error)
+                continue
+            self.metrics.record(
+                "load",
+                time.perf_counter() - started,
+                items=len(docs),
+                nbytes=files[name].stat().st_size,
+            )
+
+            started = time.perf_counter()
+            chunks = self.split(docs)
+            unique = []
+            for chunk in chunks:
+                content_hash = chunk_sha256(chunk.page_content)
+                if content_hash in self._seen:
+                    # Копия уже записанной или ожидающей эмбеддинга части
+                    self._references.append(
+                        (content_hash, name, source_ref(chunk.metadata))
+                    )
+                    continue
+                self._seen.add(content_hash)
+                # Ключ файла в манифесте - по нему ID частей раскладываются по файлам
+                chunk.metadata["_file"] = name
+                chunk.metadata["_hash"] = content_hash
+                unique.append(chunk)
+            self.metrics.record(
+                "split",
+                time.perf_counter() - started,
+                items=len(chunks),
+                tokens=sum(chunk.metadata.get("tokens", 0) for chunk in chunks),
+            )
+            # Число частей известно до того, как они попадут в индекс
+            self.expected[name] = len(chunks)
+            self.stats["files"] += 1
+            self.stats["documents"] += len(docs)
+            self.stats["chunks"] += len(chunks)
+            self.stats["duplicates"] += len(chunks) - len(unique)
+            print(f"📄 {name}: {len(docs)} документов, {len(chunks)} частей, "
+                  f"{len(chunks) - len(unique)} дубликатов")
+            yield from unique
+
+    def _batches(self, files: Dict[str, Path]) -> Iterator[List[Document]]:
+        return batch_by_tokens(self._chunks(files), self.batch_tokens)
+
+    def _assign(self, name: str, chunk_id: int, content_hash: str):
+        self._done[name] = self._done.get(name, 0) + 1
+        if chunk_id not in self._file_ids[name]:
+            self._file_ids[name].add(chunk_id)
+            self.added_ids[name].append(chunk_id)
+        self.chunk_hashes[chunk_id] = content_hash
+
+    def _resolve_references(self):
+        """Привязывает копии к ID их оригиналов, если те уже записаны"""
+        pending = self._unresolved
+        while self._references:
+            pending.append(self._references.popleft())
+        self._unresolved = []
+        for content_hash, name, ref in pending:
+            chunk_id = self._content_ids.get(content_hash)
+            if chunk_id is None:
+                self._unresolved.append((content_hash, name, ref))
+                continue
+            self._assign(name, chunk_id, content_hash)
+            self._new_sources.setdefault(chunk_id, []).append(ref)
+
+    def _flush_sources(self, writer):
+        """Записывает накопленные ссылки на копии в метаданные частей"""
+        self._resolve_references()
+        for chunk_id, refs in self._new_sources.items():
+            add_sources(writer, chunk_id, refs)
+        self._new_sources = {}
+
+    async def run(
+        self,
+        files: Dict[str, Path],
+        writer=None,
+        create_writer=None,
+        known: Optional[Dict[str, int]] = None,
+    ):
+        """Прогоняет файлы через конвейер; возвращает writer с добавленными частями
+
+        known - хэш содержимого -> ID частей, уже лежащих в индексе writer'а.
+        """
+        self.added_ids = {name: [] for name in files}
+        self.chunk_hashes = {}
+        self.expected = {}
+        self._done = {}
+        self._file_ids: Dict[str, set] = {name: set() for name in files}
+        self._content_ids: Dict[str, int] = dict(known or {})
+        # _seen и _references пополняются в потоке загрузки, остальное - здесь
+        self._seen = set(self._content_ids)
+        self._references: deque = deque()
+        self._unresolved: List[Tuple[str, str, Dict[str, Any]]] = []
+        self._new_sources: Dict[int, List[Dict[str, Any]]] = {}
+        # Батч уже передан writer'у, но его ID еще не разнесены по файлам
+        self._adding = False
+        batches = threaded_iter(self._batches(files), self.buffer_size)
+        embedded = dict(self.embedder.stats)
+
+        try:
+            async for batch, vectors in self.embedder.embed_stream(batches):
+                if writer is None:
+                    writer = create_writer(vectors.shape[1])
+                    print("    ✅ Создан базовый индекс")
+                with self.metrics.stage("add", items=len(batch)):
+                    names = [doc.metadata.pop("_file") for doc in batch]
+                    hashes = [doc.metadata.pop("_hash") for doc in batch]
+                    self._adding = True
+                    ids = writer.add(vectors, batch)
+                    for name, content_hash, chunk_id in zip(names, hashes, ids):
+                        self._content_ids[content_hash] = chunk_id
+                        self._assign(name, chunk_id, content_hash)
+                    self._resolve_references()
+                    self._adding = False
+                self.stats["batches"] += 1
+                total = sum(len(i) for i in self.added_ids.values())
+                print(f"  📦 Батч {self.stats['batches']} добавлен "
+                      f"({len(batch)} частей, всего {total})")
+                every = self.checkpoint_every
+                if every and self.stats["batches"] % every == 0:
+                    self._checkpoint(writer)
+            if writer is not None:
+                with self.metrics.stage("add"):
+                    self._flush_sources(writer)
+        except BaseException:
+            # Сохраняем сделанное в контрольную точку, сам индекс не публикуем:
+            # прошлая версия остается нетронутой
+            if self._adding:
+                # Части батча попали бы в точку без файла-владельца и остались
+                # бы в индексе навсегда - оставляем предыдущую точку
+                print("  ⚠️ Батч добавлен не полностью, контрольная точка не обновлена")
+            else:
+                try:
+                    self._checkpoint(writer)
+                except Exception as e:
+                    print(f"  ⚠️ Не удалось сохранить контрольную точку: {e}")
+            if writer is not None:
+                writer.abort()
+            await batches.aclose()
+            raise
+        finally:
+            self.metrics.record(
+                "embed",
+                self.embedder.stats["busy_seconds"] - embedded["busy_seconds"],
+                items=self.embedder.stats["chunks"] - embedded["chunks"],
+                tokens=self.embedder.stats["tokens"] - embedded["tokens"],
+                calls=self.embedder.stats["requests"] - embedded["requests"],
+                request_seconds=self.embedder.stats["seconds"] - embedded["seconds"],
+            )
+
+        return writer
@@ -1,6 +1,6 @@
 # src/app/services/openai_vector_service.py - версия с загрузкой целых файлов
-from openai import OpenAI
-from typing import Dict, Any, List, Optional
+from openai import AsyncOpenAI
+from typing import Dict, Any, List, Optional, Callable
 import tempfile
 import os
 from pathlib import Path
@@ -9,12 +9,13 @@ from datetime import datetime
 
 from src.app.core.config import settings
 from src.app.core.logger import logger
+from src.app.core.openai_client import get_openai_client
+from src.app.services.run_waiter import run_waiter
 
 class OpenAIVectorStoreService:
     """Сервис для работы с OpenAI Vector Stores и file search"""
     
     def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
         self.vector_store_id = settings.vector_store_id
         
         # Проверяем наличие vector_store_id
@@ -23,6 +24,11 @@ class OpenAIVectorStoreService:
                 "VECTOR_STORE_ID не задан в переменных окружения. "
                 "Добавьте VECTOR_STORE_ID=vs_... в файл .env"
             )
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """Общий асинхронный клиент приложения"""
+        return get_openai_client()
         
     def _create_safe_filename(self, original_filename: str) -> str:
         """Создает безопасное и читаемое имя файла"""
@@ -78,13 +84,13 @@ class OpenAIVectorStoreService:
         
         return f"{clean_name}.txt"
     
-    def get_vector_store_info(self) -> Dict[str, Any]:
+    async def get_vector_store_info(self) -> Dict[str, Any]:
         """Получает информацию о vector store"""
         try:
-            store_info = self.client.vector_stores.retrieve(self.vector_store_id)
+            store_info = await self.client.vector_stores.retrieve(self.vector_store_id)
             
             # Получаем список файлов
-            files = self.client.vector_stores.files.list(
+            files = await self.client.vector_stores.files.list(
                 vector_store_id=self.vector_store_id
             )
             
@@ -116,8 +122,19 @@ class OpenAIVectorStoreService:
                 "vector_store_id": self.vector_store_id
             }
     
-    async def upload_text_as_file(self, text_content: str, filename: str, metadata: Dict = None) -> Dict[str, Any]:
-        """Загружает весь текст как один файл в OpenAI Vector Store"""
+    async def upload_text_as_file(
+        self,
+        text_content: str,
+        filename: str,
+        metadata: Dict = None,
+        on_progress: Optional[Callable[..., None]] = None,
+    ) -> Dict[str, Any]:
+        """Загружает весь текст как один файл в OpenAI Vector Store
+
+        on_progress(stage, **data) вызывается после загрузки файла ("uploaded")
+        и после добавления его в Vector Store ("indexed").
+        """
+        on_progress = on_progress or (lambda stage, **data: None)
         
         try:
             logger.info(f"📄 Загружаем файл целиком: {filename} ({len(text_content)} символов)")
@@ -156,24 +173,31 @@ class OpenAIVectorStoreService:
                 logger.info(f"🔄 Загружаем файл в OpenAI Files API с именем: {safe_filename}")
                 
                 # Загружаем файл в OpenAI с правильным именем
-                with open(tmp_file_path, 'rb') as f:
-                    file_obj = self.client.files.create(
-                        file=(safe_filename, f),  # Передаем кортеж (имя, файл)
-                        purpose='assistants'
-                    )
+                # (путь вместо открытого файла: клиент читает его асинхронно)
+                file_obj = await self.client.files.create(
+                    # Передаем кортеж (имя, файл)
+                    file=(safe_filename, Path(tmp_file_path)),
+                    purpose='assistants'
+                )
                 
                 logger.info(f"✅ Файл создан в OpenAI: {file_obj.id}")
                 logger.info(f"📄 Имя файла в OpenAI: {file_obj.filename}")
+                on_progress("uploaded", openai_file_id=file_obj.id)
                 
                 # Добавляем файл в vector store
                 logger.info(f"🔄 Добавляем файл в Vector Store...")
                 
-                vector_file = self.client.vector_stores.files.create(
+                vector_file = await self.client.vector_stores.files.create(
                     vector_store_id=self.vector_store_id,
                     file_id=file_obj.id
                 )
                 
                 logger.info(f"✅ Файл добавлен в Vector Store: {vector_file.id}, статус: {vector_file.status}")
+                on_progress(
+                    "indexed",
+                    vector_store_file_id=vector_file.id,
+                    vector_status=vector_file.status,
+                )
                 
                 return {
                     "success": True,
@@ -213,13 +237,15 @@ class OpenAIVectorStoreService:
                 "filename": filename
             }
     
-    def search_in_vector_store(self, query: str, limit: int = 5) -> Dict[str, Any]:
+    async def search_in_vector_store(
+        self, query: str, limit: int = 5
+    ) -> Dict[str, Any]:
         """Поиск в vector store через assistant"""
         try:
             logger.info(f"🔍 Выполняем поиск: '{query}'")
             
             # Создаем временный assistant для поиска
-            assistant = self.client.beta.assistants.create(
+            assistant = await self.client.beta.assistants.create(
                 name="Search Assistant",
                 instructions="Найди релевантную информацию в загруженных файлах. Отвечай на русском языке, основываясь только на информации из файлов.",
                 model="gpt-4o",
@@ -232,43 +258,26 @@ class OpenAIVectorStoreService:
             )
             
             # Создаем thread и отправляем запрос
-            thread = self.client.beta.threads.create()
+            thread = await self.client.beta.threads.create()
             
-            self.client.beta.threads.messages.create(
+            await self.client.beta.threads.messages.create(
                 thread_id=thread.id,
                 role="user",
                 content=query
             )
             
-            # Запускаем assistant
-            run = self.client.beta.threads.runs.create(
-                thread_id=thread.id,
-                assistant_id=assistant.id
-            )
-            
+            # Запускаем assistant и ждем завершения
             logger.info(f"🔄 Ожидаем ответ от assistant...")
+            wait = await run_waiter.run(
+                thread.id, assistant.id, settings.assistant_timeout
+            )
             
-            # Ждем завершения
-            import time
-            max_attempts = 60  # Увеличили время ожидания
-            for attempt in range(max_attempts):
-                run_status = self.client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
-                
-                if run_status.status == "completed":
-                    logger.info(f"✅ Поиск завершен успешно")
-                    break
-                elif run_status.status in ["failed", "cancelled", "expired"]:
-                    raise Exception(f"Поиск завершился со статусом: {run_status.status}")
-                elif attempt % 10 == 0:  # Логируем прогресс каждые 10 секунд
-                    logger.info(f"⏳ Статус поиска: {run_status.status} (попытка {attempt + 1}/{max_attempts})")
-                
-                time.sleep(1)
+            if wait.run.status != "completed":
+                raise Exception(f"Поиск завершился со статусом: {wait.run.status}")
+            logger.info("✅ Поиск завершен успешно")
             
             # Получаем результаты
-            messages = self.client.beta.threads.messages.list(
+            messages = await self.client.beta.threads.messages.list(
                 thread_id=thread.id,
                 limit=1
             )
@@ -279,7 +288,7 @@ class OpenAIVectorStoreService:
                 
                 # Очищаем ресурсы
                 try:
-                    self.client.beta.assistants.delete(assistant.id)
+                    await self.client.beta.assistants.delete(assistant.id)
                     logger.info(f"🗑️ Временный assistant удален")
                 except:
                     pass
@@ -290,7 +299,8 @@ class OpenAIVectorStoreService:
                     "success": True,
                     "response": response,
                     "annotations": annotations,
-                    "sources_count": len(annotations)
+                    "sources_count": len(annotations),
+                    "timings": wait.timings()
                 }
             else:
                 logger.warning("⚠️ Нет ответа от assistant")
@@ -306,19 +316,19 @@ class OpenAIVectorStoreService:
                 "error": str(e)
             }
     
-    def delete_file_from_vector_store(self, file_id: str) -> bool:
+    async def delete_file_from_vector_store(self, file_id: str) -> bool:
         """Удаляет файл из vector store"""
         try:
             logger.info(f"🗑️ Удаляем файл: {file_id}")
             
             # Удаляем файл из vector store
-            self.client.vector_stores.files.delete(
+            await self.client.vector_stores.files.delete(
                 vector_store_id=self.vector_store_id,
                 file_id=file_id
             )
             
             # Также удаляем сам файл
-            self.client.files.delete(file_id)
+            await self.client.files.delete(file_id)
             
             logger.info(f"✅ Файл {file_id} удален из vector store")
             return True
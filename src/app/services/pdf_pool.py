@@ -0,0 +1,84 @@
+# src/app/services/pdf_pool.py
+"""
+Пул процессов для разбора PDF в приложении
+
+Разбор PyMuPDF занимает CPU и держит GIL, поэтому в event loop (или в
+потоке) он останавливает обработку чатов. Пул создается при старте
+приложения и закрывается при остановке; задачи отправляются через
+`await pdf_pool.run(fn, *args)`, где `fn` - функция уровня модуля.
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from src.app.core.config import settings
+from src.app.core.logger import logger
+
+
+class PDFWorkerPool:
+    """ProcessPoolExecutor, которым владеет приложение"""
+
+    def __init__(self, workers: int = 0, max_tasks_per_child: int = 0):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        # Перезапуск воркера после N задач ограничивает рост памяти PyMuPDF
+        self.max_tasks_per_child = max_tasks_per_child or None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.stats: Dict[str, int] = {
+            "submitted": 0, "completed": 0, "failed": 0, "in_flight": 0, "restarts": 0,
+        }
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    def start(self):
+        if self._executor is not None:
+            return
+        # spawn: дочерние процессы не наследуют event loop, потоки и соединения
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            max_tasks_per_child=self.max_tasks_per_child,
+        )
+        logger.info(f"PDF pool started: {self.workers} processes")
+
+    def shutdown(self, wait: bool = True):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+            logger.info("PDF pool stopped")
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        """Выполняет fn(*args) в процессе пула, не блокируя event loop"""
+        if self._executor is None:
+            self.start()
+        executor = self._executor
+        self.stats["submitted"] += 1
+        self.stats["in_flight"] += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            # Воркер упал (например, OOM на битом файле) -
+            # следующие задачи получат новый пул
+            self.stats["failed"] += 1
+            if self._executor is executor:
+                logger.error("PDF pool broken, restarting")
+                self.stats["restarts"] += 1
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self.stats["in_flight"] -= 1
+        self.stats["completed"] += 1
+        return result
+
+
+pdf_pool = PDFWorkerPool(settings.pdf_workers, settings.pdf_worker_max_tasks)
@@ -12,31 +12,84 @@ class PDFProcessor:
     def __init__(self):
         self.logger = logger
     
+    def extract_pages(self, pdf_path: str) -> Dict[str, Any]:
+        """
+        Извлекает очищенный текст каждой страницы PDF отдельно
+        Используется ingest'ом для постраничных документов с номером страницы
+        """
+        doc = fitz.open(pdf_path)
+        try:
+            return self._extract_pages(doc)
+        finally:
+            doc.close()
+
+    def _extract_pages(self, doc: fitz.Document) -> Dict[str, Any]:
+        metadata = {
+            "total_pages": len(doc),
+            "title": doc.metadata.get("title", ""),
+            "author": doc.metadata.get("author", ""),
+            "creation_date": doc.metadata.get("creationDate", ""),
+        }
+        pages = []
+        for page_num in range(len(doc)):
+            text = doc.load_page(page_num).get_text("text")
+            pages.append({
+                "page": page_num + 1,
+                "text": self.clean_text(text),
+                "char_count": len(text),
+                "has_content": bool(text.strip()),
+            })
+        return {"pages": pages, "metadata": metadata}
+
+    def analyze(self, pdf_path: str) -> Dict[str, Any]:
+        """
+        Проверка, сведения о документе, размеры страниц и текст за одно открытие файла
+        Результат: {"validation", "pdf_info", "conversion"} в форматах validate_pdf,
+        get_pdf_info и extract_text_from_pdf; для невалидного файла pdf_info и
+        conversion равны None
+        """
+        try:
+            doc = fitz.open(pdf_path)
+        except Exception as e:
+            return {
+                "validation": self._invalid(e), "pdf_info": None, "conversion": None,
+            }
+        try:
+            validation = self._validate(doc)
+            if not validation["valid"]:
+                return {"validation": validation, "pdf_info": None, "conversion": None}
+            return {
+                "validation": validation,
+                "pdf_info": self._pdf_info(doc, pdf_path),
+                "conversion": self._extract_text(
+                    lambda: self._extract_pages(doc), pdf_path
+                ),
+            }
+        finally:
+            doc.close()
+
     def extract_text_from_pdf(self, pdf_path: str) -> Dict[str, Any]:
         """
         Извлекает текст из PDF файла с метаданными
         Адаптированный метод из scripts/main.py
         """
+        return self._extract_text(lambda: self.extract_pages(pdf_path), pdf_path)
+
+    def _extract_text(self, extract, pdf_path: str) -> Dict[str, Any]:
         try:
-            doc = fitz.open(pdf_path)
+            extracted = extract()
+            metadata = dict(extracted["metadata"])
+            metadata["page_texts"] = []
             text_content = []
-            metadata = {
-                "total_pages": len(doc),
-                "title": doc.metadata.get("title", ""),
-                "author": doc.metadata.get("author", ""),
-                "creation_date": doc.metadata.get("creationDate", ""),
-                "page_texts": []
-            }
             
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                text = page.get_text("text")
+            for page in extracted["pages"]:
+                page_num = page["page"] - 1
                 
                 # Сохраняем информацию о каждой странице
                 metadata["page_texts"].append({
-                    "page": page_num + 1,
-                    "char_count": len(text),
-                    "has_content": bool(text.strip())
+                    "page": page["page"],
+                    "char_count": page["char_count"],
+                    "has_content": page["has_content"]
                 })
                 
                 # Добавляем разделитель страниц для лучшей структуры
@@ -47,11 +100,7 @@ class PDFProcessor:
                     document_title = metadata["title"] or Path(pdf_path).stem
                     text_content.append(f"# {document_title}\n\n--- СТРАНИЦА {page_num + 1} ---\n\n")
                 
-                # Очищаем и форматируем текст
-                cleaned_text = self.clean_text(text)
-                text_content.append(cleaned_text)
-            
-            doc.close()
+                text_content.append(page["text"])
             
             full_text = "".join(text_content)
             
@@ -102,31 +151,45 @@ class PDFProcessor:
         """Проверяет валидность PDF файла"""
         try:
             doc = fitz.open(file_path)
-            page_count = len(doc)
+            validation = self._validate(doc)
             doc.close()
-            
-            if page_count == 0:
-                return {
-                    "valid": False,
-                    "error": "PDF файл не содержит страниц"
-                }
-            
-            return {
-                "valid": True,
-                "pages": page_count
-            }
+            return validation
             
         except Exception as e:
+            return self._invalid(e)
+
+    def _validate(self, doc: fitz.Document) -> Dict[str, Any]:
+        page_count = len(doc)
+        if page_count == 0:
             return {
                 "valid": False,
-                "error": f"Невалидный PDF файл: {e}"
+                "error": "PDF файл не содержит страниц"
             }
+
+        return {
+            "valid": True,
+            "pages": page_count
+        }
+
+    def _invalid(self, error: Exception) -> Dict[str, Any]:
+        return {
+            "valid": False,
+            "error": f"Невалидный PDF файл: {error}"
+        }
     
     def get_pdf_info(self, file_path: str) -> Dict[str, Any]:
         """Получает информацию о PDF файле без извлечения текста"""
         try:
             doc = fitz.open(file_path)
-            
+        except Exception as e:
+            return self._info_error(e, file_path)
+        try:
+            return self._pdf_info(doc, file_path)
+        finally:
+            doc.close()
+
+    def _pdf_info(self, doc: fitz.Document, file_path: str) -> Dict[str, Any]:
+        try:
             info = {
                 "success": True,
                 "filename": Path(file_path).name,
@@ -154,12 +217,22 @@ class PDFProcessor:
                     "height": rect.height
                 })
             
-            doc.close()
             return info
             
         except Exception as e:
-            return {
-                "success": False,
-                "error": str(e),
-                "filename": Path(file_path).name
-            }
\ No newline at end of file
+            return self._info_error(e, file_path)
+
+    def _info_error(self, error: Exception, file_path: str) -> Dict[str, Any]:
+        return {
+            "success": False,
+            "error": str(error),
+            "filename": Path(file_path).name
+        }
+
+
+def process_pdf_file(pdf_path: str) -> Dict[str, Any]:
+    """
+    Проверка, сведения и текст PDF за один вызов
+    Функция уровня модуля, чтобы ее можно было выполнить в процессе из пула
+    """
+    return PDFProcessor().analyze(pdf_path)
@@ -0,0 +1,266 @@
+# src/app/services/run_waiter.py
+"""
+Запуск run в Assistants API и ожидание его завершения
+
+Run создается со stream=True, и смены статуса приходят событиями сервера
+(thread.run.in_progress, thread.run.completed, ...): результат доступен
+сразу, без пауз между опросами. Если поток недоступен или оборвался,
+статус опрашивается через runs.retrieve с растущей паузой - короткие
+ответы приходят быстро, а долгие не тратят запрос в секунду.
+
+Текст ответа из событий thread.message.delta можно получать по мере
+генерации (on_delta). Для каждого run замеряется время в очереди (до
+перехода в in_progress), время до первого фрагмента текста и время
+выполнения.
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional
+
+from openai import APIStatusError, AsyncOpenAI
+
+from src.app.core.config import settings
+from src.app.core.logger import logger
+from src.app.core.openai_client import get_openai_client
+
+# requires_action тоже завершает ожидание: вызовы функций приложение не
+# выполняет, и такой run простоял бы до истечения срока. Run в этом статусе
+# остается активным и отменяется, иначе в thread не добавить сообщение
+FINAL_STATUSES = (
+    "completed", "failed", "cancelled", "expired", "incomplete", "requires_action",
+)
+QUEUED_STATUSES = ("queued",)
+# Статусы run, который еще занимает thread на сервере
+ACTIVE_STATUSES = ("queued", "in_progress", "requires_action")
+
+
+class RunWait:
+    """Последнее известное состояние run и замеры ожидания"""
+
+    def __init__(self, thread_id: str):
+        self.thread_id = thread_id
+        self.run: Any = None
+        self.mode = "stream"
+        self.events = 0
+        self.polls = 0
+        self.started = time.monotonic()
+        self.in_progress_at: Optional[float] = None
+        self.first_delta_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.run is not None and self.run.status in FINAL_STATUSES
+
+    def observe(self, run: Any):
+        self.run = run
+        now = time.monotonic()
+        if self.in_progress_at is None and run.status not in QUEUED_STATUSES:
+            self.in_progress_at = now
+        if self.finished_at is None and run.status in FINAL_STATUSES:
+            self.finished_at = now
+
+    def timings(self) -> Dict[str, Any]:
+        end = self.finished_at or time.monotonic()
+        total = end - self.started
+        if self.in_progress_at is not None and self.in_progress_at < end:
+            queued = self.in_progress_at - self.started
+        else:
+            # Переход в in_progress не застали (опрос сразу увидел итог) -
+            # делим время по отметкам сервера, они с точностью до секунды
+            created = getattr(self.run, "created_at", None)
+            started = getattr(self.run, "started_at", None)
+            if created and started:
+                queued = min(max(started - created, 0), total)
+            else:
+                queued = total
+        return {
+            "mode": self.mode,
+            "queued_seconds": round(queued, 3),
+            "run_seconds": round(total - queued, 3),
+            "total_seconds": round(total, 3),
+            "first_delta_seconds": (
+                round(self.first_delta_at - self.started, 3)
+                if self.first_delta_at is not None
+                else None
+            ),
+            "events": self.events,
+            "polls": self.polls,
+        }
+
+
+class RunWaiter:
+    """Общий для сервисов способ запустить run и дождаться его итога"""
+
+    def __init__(self):
+        self.use_stream = settings.assistant_stream
+        self.stats = {
+            "runs": 0, "stream": 0, "poll": 0, "timeouts": 0,
+            "queued_seconds": 0.0, "run_seconds": 0.0,
+        }
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        return get_openai_client()
+
+    async def run(
+        self,
+        thread_id: str,
+        assistant_id: str,
+        timeout: float,
+        on_delta: Optional[Callable[[str], Any]] = None,
+        **params: Any,
+    ) -> RunWait:
+        """Создает run и ждет финального статуса не дольше timeout секунд
+
+        on_delta получает фрагменты текста ответа по мере генерации (только
+        пока работает поток событий). Возвращает RunWait: итоговый run в
+        `.run`, замеры - `.timings()`.
+        """
+        wait = RunWait(thread_id)
+        try:
+            await asyncio.wait_for(
+                self._complete(wait, assistant_id, on_delta, params), timeout
+            )
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            await self._cancel(wait)
+            raise TimeoutError(f"Ассистент не ответил в течение {timeout} секунд")
+        except asyncio.CancelledError:
+            # Ожидание прервано (например, клиент закрыл поток) - run больше не нужен
+            await self._cancel(wait)
+            raise
+        if wait.run.status == "requires_action":
+            await self._cancel(wait)
+
+        timings = wait.timings()
+        self.stats["runs"] += 1
+        self.stats[wait.mode] += 1
+        self.stats["queued_seconds"] += timings["queued_seconds"]
+        self.stats["run_seconds"] += timings["run_seconds"]
+        logger.info(
+            f"Run {wait.run.id}: {wait.run.status}, "
+            f"в очереди {timings['queued_seconds']:.2f} с, "
+            f"выполнение {timings['run_seconds']:.2f} с "
+            f"({wait.mode}, событий {wait.events}, опросов {wait.polls})"
+        )
+        return wait
+
+    async def _complete(
+        self,
+        wait: RunWait,
+        assistant_id: str,
+        on_delta: Optional[Callable[[str], Any]],
+        params: Dict[str, Any],
+    ):
+        if self.use_stream:
+            try:
+                await self._stream(wait, assistant_id, on_delta, params)
+            except APIStatusError:
+                # Запрос отклонен сервером - без потока его отклонят так же
+                if wait.run is None:
+                    raise
+                logger.warning(
+                    f"Поток run {wait.run.id} прерван ошибкой API, переходим на опрос"
+                )
+            except Exception as e:
+                logger.warning(
+                    f"Поток событий run недоступен ({e}), переходим на опрос"
+                )
+            if wait.finished:
+                return
+
+        wait.mode = "poll"
+        if wait.run is None and self.use_stream:
+            # Поток оборвался до первого события, но run мог уже создаться -
+            # второй create дал бы дубль или ошибку "thread already has an active run"
+            active = await self._active_run(wait.thread_id, assistant_id)
+            if active is not None:
+                logger.info(f"Run {active.id} создан до обрыва потока, опрашиваем его")
+                wait.observe(active)
+        if wait.run is None:
+            wait.observe(
+                await self.client.beta.threads.runs.create(
+                    thread_id=wait.thread_id, assistant_id=assistant_id, **params
+                )
+            )
+        await self._poll(wait)
+
+    async def _active_run(self, thread_id: str, assistant_id: str) -> Optional[Any]:
+        """Последний незавершенный run ассистента в thread или None"""
+        runs = await self.client.beta.threads.runs.list(
+            thread_id=thread_id, limit=1, order="desc"
+        )
+        for run in runs.data:
+            if run.assistant_id == assistant_id and run.status in ACTIVE_STATUSES:
+                return run
+        return None
+
+    async def _stream(
+        self,
+        wait: RunWait,
+        assistant_id: str,
+        on_delta: Optional[Callable[[str], Any]],
+        params: Dict[str, Any],
+    ):
+        stream = await self.client.beta.threads.runs.create(
+            thread_id=wait.thread_id, assistant_id=assistant_id, stream=True, **params
+        )
+        async with stream:
+            async for event in stream:
+                wait.events += 1
+                if event.event == "error":
+                    raise RuntimeError(event.data.message)
+                if event.event == "thread.message.delta":
+                    self._emit_delta(wait, event.data, on_delta)
+                    continue
+                if event.event.startswith("thread.run.") and not event.event.startswith(
+                    "thread.run.step."
+                ):
+                    wait.observe(event.data)
+                    if wait.finished:
+                        return
+
+    def _emit_delta(
+        self, wait: RunWait, data: Any, on_delta: Optional[Callable[[str], Any]]
+    ):
+        for block in getattr(data.delta, "content", None) or []:
+            text = getattr(getattr(block, "text", None), "value", None)
+            if not text:
+                continue
+            if wait.first_delta_at is None:
+                wait.first_delta_at = time.monotonic()
+            if on_delta is not None:
+                on_delta(text)
+
+    async def _poll(self, wait: RunWait):
+        delay = settings.assistant_poll_initial
+        while not wait.finished:
+            await asyncio.sleep(delay)
+            delay = min(
+                delay * settings.assistant_poll_backoff, settings.assistant_poll_max
+            )
+            wait.polls += 1
+            wait.observe(
+                await self.client.beta.threads.runs.retrieve(
+                    thread_id=wait.thread_id, run_id=wait.run.id
+                )
+            )
+            logger.debug(
+                f"Статус run {wait.run.id}: {wait.run.status} (опрос {wait.polls})"
+            )
+
+    async def _cancel(self, wait: RunWait):
+        """Отменяет зависший run: пока он активен, в thread нельзя добавить сообщение"""
+        if wait.run is None or (wait.finished and wait.run.status != "requires_action"):
+            return
+        try:
+            await self.client.beta.threads.runs.cancel(
+                thread_id=wait.thread_id, run_id=wait.run.id
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось отменить run {wait.run.id}: {e}")
+
+
+run_waiter = RunWaiter()
@@ -0,0 +1,103 @@
+# src/app/services/thread_registry.py
+"""
+Соответствие thread клиента и thread в OpenAI
+
+Клиент присылает свой thread_id ("t1", "web-<uuid>", ...), а разговор идет в
+thread OpenAI. Соответствие хранится в таблице chat_threads и LRU кэше
+в памяти: обычное сообщение обходится без запросов к OpenAI и к БД, а
+новый thread создается один раз на разговор, и контекст сохраняется.
+
+Общие ID вроде "main" (значение по умолчанию у старых клиентов) не
+связываются ни с каким thread: иначе все такие клиенты писали бы в один
+разговор и читали чужой контекст. Сообщение с таким ID идет в новый thread.
+"""
+
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from src.app.core.config import settings
+from src.app.core.logger import logger
+from src.app.db.models import ChatThread
+from src.app.db.session import SessionLocal
+
+# thread_id, которые присылают разные клиенты, - не идентификатор разговора
+SHARED_THREAD_IDS = ("main",)
+
+
+class ThreadRegistry:
+    def __init__(self, session_factory=SessionLocal, max_size: int = 10000):
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+        # thread клиента -> создание его thread OpenAI, которое уже идет
+        self.in_flight: Dict[str, asyncio.Task] = {}
+
+    async def resolve(
+        self, local_thread_id: str, create: Callable[[], Awaitable[str]]
+    ) -> str:
+        """ID thread OpenAI для thread клиента; create() создает новый thread"""
+        openai_thread_id = self._lru.get(local_thread_id)
+        if openai_thread_id is not None:
+            self._lru.move_to_end(local_thread_id)
+            return openai_thread_id
+
+        # Одновременные первые сообщения одного разговора ждут один и тот же thread
+        task = self.in_flight.get(local_thread_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load_or_create(local_thread_id, create))
+            self.in_flight[local_thread_id] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(local_thread_id, None))
+        return await asyncio.shield(task)
+
+    async def forget(self, local_thread_id: str):
+        """Удаляет соответствие (например, thread удален в OpenAI)"""
+        self._lru.pop(local_thread_id, None)
+        async with self.session_factory() as session:
+            await session.execute(
+                delete(ChatThread).where(ChatThread.local_thread_id == local_thread_id)
+            )
+            await session.commit()
+
+    async def _load_or_create(
+        self, local_thread_id: str, create: Callable[[], Awaitable[str]]
+    ) -> str:
+        openai_thread_id = await self._load(local_thread_id)
+        if openai_thread_id is None:
+            openai_thread_id = await create()
+            async with self.session_factory() as session:
+                session.add(ChatThread(
+                    local_thread_id=local_thread_id, openai_thread_id=openai_thread_id
+                ))
+                try:
+                    await session.commit()
+                    logger.info(
+                        f"Thread {local_thread_id} связан "
+                        f"с thread OpenAI {openai_thread_id}"
+                    )
+                except IntegrityError:
+                    # Другой процесс приложения успел связать этот thread - берем его
+                    await session.rollback()
+                    openai_thread_id = await self._load(local_thread_id)
+        self._remember(local_thread_id, openai_thread_id)
+        return openai_thread_id
+
+    async def _load(self, local_thread_id: str) -> Optional[str]:
+        async with self.session_factory() as session:
+            return (await session.execute(
+                select(ChatThread.openai_thread_id).where(
+                    ChatThread.local_thread_id == local_thread_id
+                )
+            )).scalar_one_or_none()
+
+    def _remember(self, local_thread_id: str, openai_thread_id: str):
+        self._lru[local_thread_id] = openai_thread_id
+        self._lru.move_to_end(local_thread_id)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+
+thread_registry = ThreadRegistry(max_size=settings.thread_cache_size)
@@ -0,0 +1,235 @@
+# src/app/services/upload_jobs.py
+"""
+Очередь фоновых задач загрузки
+
+HTTP запрос только принимает файл и ставит задачу в ограниченную очередь;
+разбор и загрузку в OpenAI выполняют несколько воркеров внутри процесса.
+Задача проходит стадии JOB_STAGES, каждая смена стадии - событие, которое
+можно получить опросом статуса или подпиской (SSE).
+
+По умолчанию воркеров столько же, сколько процессов в pdf_pool: иначе
+очередь, а не пул, ограничивала бы число одновременно разбираемых PDF.
+"""
+
+import asyncio
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from src.app.core.config import settings
+from src.app.core.logger import logger
+from src.app.services.pdf_pool import pdf_pool
+
+JOB_STAGES = ("received", "parsed", "uploaded", "indexed")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFull(RuntimeError):
+    """В очереди нет места - клиенту стоит повторить позже"""
+
+
+class UploadJob:
+    """Состояние одной задачи и журнал ее событий"""
+
+    def __init__(
+        self,
+        handler: Optional[Callable[["UploadJob"], Awaitable[Any]]],
+        info: Dict[str, Any],
+    ):
+        self.id = uuid.uuid4().hex
+        self.handler = handler
+        self.info = info
+        self.status = QUEUED
+        self.stage: Optional[str] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.error_code: Optional[int] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.events: List[Dict[str, Any]] = []
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def _emit(self, event: str, **data: Any):
+        self.events.append({
+            "event": event,
+            "status": self.status,
+            "stage": self.stage,
+            "at": time.time(),
+            **data,
+        })
+        # Будим всех подписчиков и заводим новое событие для следующего ожидания
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def advance(self, stage: str, **data: Any):
+        """Отмечает пройденную стадию (из JOB_STAGES)"""
+        if stage not in JOB_STAGES:
+            raise ValueError(f"Неизвестная стадия: {stage}")
+        self.stage = stage
+        self._emit("stage", **data)
+
+    def _start(self):
+        self.status = RUNNING
+        self._emit("status")
+
+    def _finish(
+        self,
+        result: Any = None,
+        error: Optional[str] = None,
+        error_code: Optional[int] = None,
+    ):
+        self.status = FAILED if error is not None else DONE
+        self.result = result
+        self.error = error
+        self.error_code = error_code
+        self.finished_at = time.time()
+        self._emit("status", error=error)
+
+    async def watch(
+        self, heartbeat: Optional[float] = None
+    ) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """События задачи с начала и до завершения; None - нет событий за heartbeat"""
+        seen = 0
+        while True:
+            while seen < len(self.events):
+                seen += 1
+                yield self.events[seen - 1]
+            if self.finished:
+                return
+            try:
+                await asyncio.wait_for(self._changed.wait(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": list(JOB_STAGES),
+            "info": self.info,
+            "result": self.result,
+            "error": self.error,
+            "error_code": self.error_code,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "events": self.events,
+        }
+
+
+class JobQueue:
+    """Ограниченная очередь задач с фиксированным числом воркеров в event loop
+
+    Завершенные задачи хранятся `ttl` секунд, чтобы клиент успел забрать результат.
+    """
+
+    def __init__(self, workers: int = 2, max_queued: int = 20, ttl: float = 3600.0):
+        self.workers = max(1, workers)
+        self.max_queued = max(1, max_queued)
+        self.ttl = ttl
+        self.jobs: Dict[str, UploadJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if loop is self._loop and self._tasks:
+            return
+        # Новый event loop (например, в тестах) - старые воркеры и очередь неактуальны
+        self._loop = loop
+        self._queue = asyncio.Queue(self.max_queued)
+        self._tasks = [loop.create_task(self._worker(n)) for n in range(self.workers)]
+        logger.info(
+            f"Upload job queue started: {self.workers} workers, "
+            f"up to {self.max_queued} queued"
+        )
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(
+        self, handler: Callable[[UploadJob], Awaitable[Any]], **info: Any
+    ) -> UploadJob:
+        """Ставит задачу в очередь; QueueFull, если очередь заполнена"""
+        self.start()
+        self._prune()
+        job = UploadJob(handler, info)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f"В очереди уже {self.max_queued} задач")
+        self.jobs[job.id] = job
+        job._emit("status")
+        return job
+
+    def add_finished(self, result: Any, **info: Any) -> UploadJob:
+        """Задача с уже известным результатом (повторная загрузка) - без очереди"""
+        self._prune()
+        job = UploadJob(None, info)
+        self.jobs[job.id] = job
+        for stage in JOB_STAGES:
+            job.advance(stage)
+        job._finish(result=result)
+        return job
+
+    def get(self, job_id: str) -> Optional[UploadJob]:
+        return self.jobs.get(job_id)
+
+    async def wait(self, job: UploadJob) -> UploadJob:
+        async for _ in job.watch():
+            pass
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for job in self.jobs.values():
+            counts[job.status] += 1
+        return {**counts, "workers": self.workers, "max_queued": self.max_queued}
+
+    def _prune(self):
+        deadline = time.time() - self.ttl
+        expired = [
+            j.id for j in self.jobs.values() if j.finished and j.finished_at < deadline
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def _worker(self, n: int):
+        while True:
+            job = await self._queue.get()
+            job._start()
+            try:
+                result = await job.handler(job)
+            except asyncio.CancelledError:
+                job._finish(error="Задача прервана остановкой приложения")
+                raise
+            except Exception as e:
+                # HTTPException и подобные несут код и текст ошибки для клиента
+                detail = getattr(e, "detail", None) or str(e)
+                logger.error(f"Задача {job.id} завершилась ошибкой: {detail}")
+                job._finish(
+                    error=str(detail), error_code=getattr(e, "status_code", None)
+                )
+            else:
+                job._finish(result=result)
+            finally:
+                self._queue.task_done()
+
+
+upload_jobs = JobQueue(
+    settings.upload_job_workers or pdf_pool.workers,
+    settings.upload_job_queue_size,
+    settings.upload_job_ttl_seconds,
+)
@@ -0,0 +1,94 @@
+# src/app/services/upload_registry.py
+"""
+Реестр загруженных PDF по SHA-256 содержимого
+
+Повторная загрузка того же файла в тот же Vector Store не разбирается и не
+загружается в OpenAI заново: результат берется из таблицы uploaded_files.
+Одновременные загрузки одного файла делят одну задачу (in_flight).
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from src.app.core.logger import logger
+from src.app.db.models import UploadedFile
+from src.app.db.session import SessionLocal
+
+
+class UploadRegistry:
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        # (sha256, vector_store_id) -> задача, которая сейчас обрабатывает этот файл
+        self.in_flight: Dict[Tuple[str, str], Any] = {}
+
+    async def lookup(
+        self, sha256: str, vector_store_id: str
+    ) -> Optional[Dict[str, Any]]:
+        """Результат прошлой обработки файла или None"""
+        async with self.session_factory() as session:
+            return (await session.execute(
+                select(UploadedFile.result).where(
+                    UploadedFile.sha256 == sha256,
+                    UploadedFile.vector_store_id == vector_store_id,
+                )
+            )).scalar_one_or_none()
+
+    async def record_hit(self, sha256: str, vector_store_id: str):
+        """Отмечает повторную загрузку, на которую отдан прошлый результат"""
+        async with self.session_factory() as session:
+            await session.execute(
+                update(UploadedFile)
+                .where(
+                    UploadedFile.sha256 == sha256,
+                    UploadedFile.vector_store_id == vector_store_id,
+                )
+                .values(
+                    upload_count=UploadedFile.upload_count + 1,
+                    last_uploaded_at=datetime.utcnow(),
+                )
+            )
+            await session.commit()
+
+    async def save(
+        self,
+        sha256: str,
+        vector_store_id: str,
+        filename: str,
+        file_size: int,
+        result: Dict[str, Any],
+    ):
+        uploaded = result.get("vector_store_result", {}).get("uploaded_files") or [{}]
+        async with self.session_factory() as session:
+            session.add(UploadedFile(
+                sha256=sha256,
+                vector_store_id=vector_store_id,
+                original_filename=filename,
+                file_size=file_size,
+                openai_file_id=uploaded[0].get("file_id"),
+                vector_store_file_id=uploaded[0].get("vector_store_file_id"),
+                result=result,
+            ))
+            try:
+                await session.commit()
+            except IntegrityError:
+                # Тот же файл успел сохранить другой процесс приложения
+                await session.rollback()
+                return
+        logger.info(f"Файл {filename} добавлен в реестр загрузок ({sha256[:12]})")
+
+    async def forget(self, openai_file_id: str) -> int:
+        """Удаляет записи о файле, удаленном из OpenAI; возвращает число записей"""
+        async with self.session_factory() as session:
+            deleted = await session.execute(
+                delete(UploadedFile).where(
+                    UploadedFile.openai_file_id == openai_file_id
+                )
+            )
+            await session.commit()
+            return deleted.rowcount
+
+
+upload_registry = UploadRegistry()
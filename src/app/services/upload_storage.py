@@ -0,0 +1,86 @@
+# src/app/services/upload_storage.py
+"""
+Сохранение загружаемых файлов на диск блоками
+
+Файл копируется блоками фиксированного размера, поэтому память на одну
+загрузку постоянна независимо от размера файла. Размер и сигнатура PDF
+проверяются по мере чтения: слишком большой файл или не-PDF отбрасываются
+на первом же неподходящем блоке, а недописанный файл удаляется.
+"""
+
+from pathlib import Path
+from typing import Optional
+
+import aiofiles
+
+# Сигнатура PDF; по спецификации может стоять не в самом начале, а в первых 1024 байтах
+PDF_MAGIC = b"%PDF-"
+PDF_MAGIC_WINDOW = 1024
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+MAX_BATCH_FILES = 10
+
+
+class UploadRejected(ValueError):
+    """Загрузка отклонена до окончания копирования"""
+
+
+class UploadTooLarge(UploadRejected):
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"Файл больше допустимых {max_bytes / 1024 / 1024:.0f} МБ")
+
+
+class NotPDF(UploadRejected):
+    def __init__(self):
+        super().__init__("Содержимое файла не является PDF")
+
+
+def multipart_limit(max_file_bytes: int, files: int = 1) -> int:
+    """Предельный размер multipart запроса с `files` файлами (с запасом на заголовки)"""
+    return max_file_bytes * files + 64 * 1024 * files
+
+
+async def spool_upload(
+    file,
+    path: Path,
+    max_bytes: int,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    expect_pdf: bool = True,
+    hasher=None,
+) -> int:
+    """Копирует загрузку (UploadFile или любой объект с async read(n)) в `path`
+
+    Возвращает число записанных байт. При превышении `max_bytes` или
+    неверной сигнатуре бросает UploadRejected и удаляет записанное.
+    `hasher` (например, hashlib.sha256()) получает содержимое по ходу копирования.
+    """
+    # Размер уже известен, если сервер принял файл целиком - отказываем без копирования
+    size: Optional[int] = getattr(file, "size", None)
+    if size is not None and size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+
+    written = 0
+    head = b""
+    try:
+        async with aiofiles.open(path, "wb") as f:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                if expect_pdf and len(head) < PDF_MAGIC_WINDOW:
+                    head = (head + chunk)[:PDF_MAGIC_WINDOW]
+                    if PDF_MAGIC not in head and len(head) >= PDF_MAGIC_WINDOW:
+                        raise NotPDF()
+                if hasher is not None:
+                    hasher.update(chunk)
+                await f.write(chunk)
+        if expect_pdf and PDF_MAGIC not in head:
+            raise NotPDF()
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return written
@@ -0,0 +1,7 @@
+# tests/conftest.py
+import os
+
+# Настройки приложения требуют ключей при импорте - для модульных тестов
+# достаточно фиктивных значений (реальные запросы к OpenAI здесь не выполняются)
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("VECTOR_STORE_ID", "vs_test")
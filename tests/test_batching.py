@@ -0,0 +1,110 @@
+# tests/test_batching.py
+import asyncio
+
+import pytest
+
+from src.app.services.batching import MicroBatcher
+
+
+def test_concurrent_requests_share_one_batch():
+    calls = []
+
+    async def handler(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    async def scenario():
+        batcher = MicroBatcher(handler, window=0.01, max_batch_size=10)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        return batcher, results
+
+    batcher, results = asyncio.run(scenario())
+    assert results == [0, 2, 4, 6, 8]
+    assert calls == [[0, 1, 2, 3, 4]]
+    assert batcher.stats()["batches"] == 1
+
+
+def test_max_batch_size_splits_batches():
+    calls = []
+
+    async def handler(items):
+        calls.append(len(items))
+        return items
+
+    async def scenario():
+        batcher = MicroBatcher(handler, window=0.01, max_batch_size=4)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+
+    assert asyncio.run(scenario()) == list(range(10))
+    assert calls == [4, 4, 2]
+
+
+def test_in_flight_batches_are_referenced_until_done():
+    release = None
+
+    async def handler(items):
+        await release.wait()
+        return items
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        batcher = MicroBatcher(handler, window=0.001)
+        pending = asyncio.ensure_future(batcher.submit(1))
+        await asyncio.sleep(0.02)
+        in_flight = len(batcher._tasks)
+        release.set()
+        result = await pending
+        await asyncio.sleep(0)
+        return in_flight, result, len(batcher._tasks)
+
+    assert asyncio.run(scenario()) == (1, 1, 0)
+
+
+def test_handler_error_reaches_every_caller():
+    async def handler(items):
+        raise ValueError("сбой API")
+
+    async def scenario():
+        batcher = MicroBatcher(handler, window=0.001)
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_search_batch_runs_one_embedding_call():
+    import faiss
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import Embeddings
+
+    from src.app.services.faiss_index import search_batch
+
+    class AxisEmbeddings(Embeddings):
+        calls = 0
+
+        def embed_documents(self, texts):
+            return [[1.0 if str(i) == t else 0.0 for i in range(3)] for t in texts]
+
+        def embed_query(self, text):
+            return self.embed_documents([text])[0]
+
+        async def aembed_documents(self, texts):
+            AxisEmbeddings.calls += 1
+            return self.embed_documents(texts)
+
+    embedder = AxisEmbeddings()
+    index = faiss.IndexFlatL2(3)
+    index.add(np.eye(3, dtype=np.float32))
+    docstore = InMemoryDocstore({str(i): Document(page_content=f"doc{i}") for i in range(3)})
+    store = FAISS(embedder, index, docstore, {i: str(i) for i in range(3)})
+
+    rows = asyncio.run(search_batch(lambda: store, embedder, [("0", 1), ("2", 2)]))
+
+    assert AxisEmbeddings.calls == 1
+    assert [doc.page_content for doc, _ in rows[0]] == ["doc0"]
+    assert len(rows[1]) == 2 and rows[1][0][0].page_content == "doc2"
+    assert rows[1][0][1] == pytest.approx(0.0)
@@ -0,0 +1,65 @@
+# tests/test_chunker.py
+import tiktoken
+from langchain_core.documents import Document
+
+from src.app.services.chunker import TokenChunker, split_pages
+
+
+def _byte_encoding():
+    """Токен = байт: кодировка tiktoken, не требующая загрузки словаря"""
+    return tiktoken.Encoding(
+        name="bytes",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+
+
+def test_split_pages_attaches_header_to_first_page():
+    text = "# Отчет\n\n--- СТРАНИЦА 1 ---\n\nпервая\n\n--- СТРАНИЦА 2 ---\n\nвторая"
+    pages = split_pages(text)
+
+    assert [page for page, _ in pages] == [1, 2]
+    assert pages[0][1].strip().startswith("# Отчет")
+    assert "СТРАНИЦА" not in pages[1][1]
+
+
+def test_chunks_respect_token_limit_pages_and_overlap():
+    paragraph = " ".join(f"word{i}." for i in range(30))  # 239 байт
+    text = "--- СТРАНИЦА 1 ---\n\n" + "\n\n".join([paragraph] * 3) + "\n\n--- СТРАНИЦА 2 ---\n\nкоротко"
+    chunker = TokenChunker(chunk_tokens=100, overlap_tokens=20, encoding=_byte_encoding())
+
+    chunks = chunker.split_text(text)
+
+    assert all(tokens <= 100 for _, _, tokens in chunks)
+    assert {page for _, page, _ in chunks} == {1, 2}
+    assert chunks[-1] == ("коротко", 2, len("коротко".encode()))
+    # Соседние части одной страницы перекрываются целыми предложениями
+    first, second = chunks[0][0], chunks[1][0]
+    assert second.split(" ")[0] in first.split(" ")
+
+
+def test_split_documents_keeps_metadata_and_counts_tokens():
+    chunker = TokenChunker(chunk_tokens=50, overlap_tokens=0, encoding=_byte_encoding())
+    docs = [Document(page_content="abc\n\n" + "x" * 120, metadata={"source": "a.pdf", "page": 7})]
+
+    chunks = chunker.split_documents(docs)
+
+    assert [c.metadata["tokens"] for c in chunks] == [3, 50, 50, 20]
+    assert all(c.metadata["source"] == "a.pdf" and c.metadata["page"] == 7 for c in chunks)
+    assert "".join(c.page_content for c in chunks[1:]) == "x" * 120
+
+
+def test_long_cyrillic_sentence_is_cut_between_characters():
+    # В байтовой кодировке кириллический символ - два токена, окно нечетной длины
+    sentence = "Длинное предложение без точек " * 20
+    chunker = TokenChunker(
+        chunk_tokens=101, overlap_tokens=10, encoding=_byte_encoding()
+    )
+
+    chunks = chunker.split_text(sentence.strip())
+
+    assert len(chunks) > 1
+    assert all("\ufffd" not in text for text, _, _ in chunks)
+    assert all(tokens <= 101 for _, _, tokens in chunks)
+    assert "".join(text for text, _, _ in chunks) == sentence.strip()
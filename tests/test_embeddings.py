@@ -0,0 +1,75 @@
+# tests/test_embeddings.py
+import asyncio
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from src.app.services.embeddings import CachedEmbeddings, SQLiteEmbeddingStore
+
+
+class CountingEmbeddings(Embeddings):
+    """Фейковые эмбеддинги, считающие обращения к "API" """
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_cache_hits_on_normalized_text():
+    fake = CountingEmbeddings()
+    cached = CachedEmbeddings(fake, model="m")
+
+    first = cached.embed_query("Что такое  FAISS?")
+    second = cached.embed_query("  Что такое FAISS? ")
+
+    assert first == second
+    assert len(fake.calls) == 1
+    assert cached.stats()["hits"] == 1
+    assert cached.stats()["misses"] == 1
+
+
+def test_lru_eviction():
+    fake = CountingEmbeddings()
+    cached = CachedEmbeddings(fake, model="m", max_size=2)
+
+    cached.embed_documents(["a", "bb", "ccc"])
+    cached.embed_query("a")
+
+    assert cached.stats()["size"] == 2
+    assert fake.calls[-1] == ["a"]
+    # В памяти - компактные float32, наружу - обычные списки
+    assert all(isinstance(vector, array) for vector in cached._lru.values())
+    assert cached.embed_query("a") == [1.0, 1.0]
+
+
+def test_documents_embed_only_misses():
+    fake = CountingEmbeddings()
+    cached = CachedEmbeddings(fake, model="m")
+
+    cached.embed_documents(["a", "bb"])
+    result = cached.embed_documents(["bb", "ccc", "ccc"])
+
+    assert fake.calls[-1] == ["ccc"]
+    assert result == [[2.0, 1.0], [3.0, 1.0], [3.0, 1.0]]
+
+
+def test_persistent_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    fake = CountingEmbeddings()
+    CachedEmbeddings(fake, model="m", store=SQLiteEmbeddingStore(path)).embed_query("привет")
+
+    restarted = CachedEmbeddings(fake, model="m", store=SQLiteEmbeddingStore(path))
+    assert asyncio.run(restarted.aembed_query("привет")) == [6.0, 1.0]
+    assert len(fake.calls) == 1
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def test_model_is_part_of_key():
+    fake = CountingEmbeddings()
+    assert CachedEmbeddings(fake, "a").cache_key("x") != CachedEmbeddings(fake, "b").cache_key("x")
@@ -0,0 +1,53 @@
+# tests/test_faiss_index.py
+import os
+
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.app.services.faiss_index import VectorStoreHolder
+
+
+def _write_index(path, texts):
+    store = FAISS.from_texts(texts, DeterministicFakeEmbedding(size=8))
+    store.save_local(str(path))
+
+
+def test_holder_loads_once_and_reuses(tmp_path):
+    _write_index(tmp_path, ["первый", "второй"])
+    holder = VectorStoreHolder(tmp_path, check_interval=0)
+
+    first = holder.get()
+    second = holder.get()
+
+    assert first is second
+    assert holder.stats()["generation"] == 1
+    assert holder.stats()["load_seconds"] is not None
+
+
+def test_holder_reloads_when_files_change(tmp_path):
+    _write_index(tmp_path, ["первый"])
+    holder = VectorStoreHolder(tmp_path, check_interval=0)
+    old = holder.get()
+
+    _write_index(tmp_path, ["первый", "второй", "третий"])
+    # гарантируем, что mtime изменился даже на грубых файловых системах
+    for name in ("index.faiss", "index.pkl"):
+        stat = os.stat(tmp_path / name)
+        os.utime(tmp_path / name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    # Новая версия грузится в фоне, пока запросы обслуживает текущая
+    assert holder.get() is old
+    assert holder.wait_reload(timeout=10)
+
+    new = holder.get()
+    assert new is not old
+    assert new.index.ntotal == 3
+    assert old.index.ntotal == 1
+    assert holder.generation == 2
+
+
+def test_holder_missing_index(tmp_path):
+    holder = VectorStoreHolder(tmp_path / "missing")
+    with pytest.raises(FileNotFoundError):
+        holder.get()
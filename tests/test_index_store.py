@@ -0,0 +1,223 @@
+# tests/test_index_store.py
+import json
+
+import faiss
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from src.app.services.faiss_index import VectorStoreHolder
+from src.app.services.index_store import (
+    IndexWriter,
+    MmapIndex,
+    checkpoint_path,
+    find_checkpoint,
+    gc_versions,
+    is_mmap_index,
+    new_version_path,
+    publish_version,
+    remove_checkpoint,
+)
+
+
+def _write(path, count=3):
+    writer = IndexWriter(path, faiss.IndexFlatL2(count))
+    docs = [
+        Document(page_content=f"текст {i}", metadata={"source": f"doc{i}.pdf", "page": i})
+        for i in range(count)
+    ]
+    writer.add(np.eye(count, dtype=np.float32), docs)
+    return writer.commit({"embedding_model": "test"})
+
+
+def test_write_and_open_roundtrip(tmp_path):
+    meta = _write(tmp_path / "index")
+
+    assert is_mmap_index(tmp_path / "index")
+    assert meta["count"] == 3 and meta["embedding_model"] == "test"
+    assert not any(p.name.startswith(".") for p in tmp_path.iterdir())
+
+    store = MmapIndex(tmp_path / "index")
+    assert len(store) == 3
+    assert store.get(1).page_content == "текст 1"
+    assert store.get(1).metadata == {"source": "doc1.pdf", "page": 1}
+    assert store.get(42) is None
+
+
+def test_search_returns_documents_and_distances(tmp_path):
+    _write(tmp_path)
+    store = MmapIndex(tmp_path)
+
+    rows = store.search([[0.0, 0.0, 1.0], [1.0, 0.0, 0.0]], k=2)
+
+    assert rows[0][0][0].page_content == "текст 2"
+    assert rows[0][0][1] == 0.0
+    assert rows[1][0][0].metadata["source"] == "doc0.pdf"
+    assert len(rows[1]) == 2
+
+
+def test_holder_opens_mmap_format(tmp_path):
+    _write(tmp_path)
+    holder = VectorStoreHolder(tmp_path, check_interval=0)
+
+    assert isinstance(holder.get(), MmapIndex)
+    assert holder.stats()["format"] == "mmap"
+
+
+def test_ivf_index_is_trained_and_search_params_applied(tmp_path):
+    from src.app.services.index_types import build_index, resolve_params, train_size
+
+    params = resolve_params("ivf-flat", {"nlist": 4, "nprobe": 4})
+    writer = IndexWriter(tmp_path, build_index("ivf-flat", 8, params), train_size("ivf-flat", params))
+    vectors = np.random.default_rng(0).random((400, 8), dtype=np.float32)
+    for start in range(0, 400, 100):
+        batch = vectors[start:start + 100]
+        writer.add(batch, [Document(page_content=str(start + i)) for i in range(len(batch))])
+    writer.commit({"index_type": "ivf-flat", "index_params": params})
+
+    store = MmapIndex(tmp_path)
+    assert faiss.extract_index_ivf(store.index).nprobe == 4
+    # nprobe == nlist - поиск точный, ближайший к вектору - он сам
+    assert store.search([vectors[123]], k=1)[0][0][0].page_content == "123"
+
+
+def test_failed_training_keeps_buffered_vectors(tmp_path):
+    from src.app.services.index_types import build_index, resolve_params
+
+    params = resolve_params("ivf-flat", {"nlist": 4, "nprobe": 4})
+    writer = IndexWriter(tmp_path, build_index("ivf-flat", 8, params), train_size=2)
+    vectors = np.random.default_rng(0).random((300, 8), dtype=np.float32)
+    docs = [Document(page_content=str(i)) for i in range(300)]
+
+    with pytest.raises(ValueError):
+        writer.add(vectors[:2], docs[:2])
+    # Векторы остались в буфере вместе с записями - точку без них не сохранить
+    assert not writer.checkpoint()
+    assert writer.read_record(1).page_content == "1"
+
+    writer.add(vectors[2:], docs[2:])
+    meta = writer.commit()
+
+    assert meta["count"] == writer.count == 300
+    assert MmapIndex(tmp_path).search([vectors[1]], k=1)[0][0][0].page_content == "1"
+
+
+def test_hnsw_ef_search_applied(tmp_path):
+    from src.app.services.index_types import base_index, build_index, resolve_params
+
+    params = resolve_params("hnsw", {"ef_search": 77})
+    writer = IndexWriter(tmp_path, build_index("hnsw", 4, params))
+    writer.add(np.eye(4, dtype=np.float32), [Document(page_content=str(i)) for i in range(4)])
+    writer.commit({"index_type": "hnsw", "index_params": params})
+
+    assert base_index(MmapIndex(tmp_path).index).hnsw.efSearch == 77
+
+
+def test_update_removes_and_keeps_records(tmp_path):
+    _write(tmp_path)
+
+    writer = IndexWriter.update(tmp_path, remove=[1])
+    ids = writer.add(np.array([[0.5, 0.5, 0.0]], dtype=np.float32), [Document(page_content="новый")])
+    writer.commit()
+
+    store = MmapIndex(tmp_path)
+    assert ids == [3]
+    assert len(store) == 3
+    assert store.get(1) is None
+    assert store.get(2).page_content == "текст 2"
+    assert store.get(3).page_content == "новый"
+
+
+def test_update_rebuilds_hnsw_without_remove_support(tmp_path):
+    from src.app.services.index_types import build_index, resolve_params
+
+    params = resolve_params("hnsw", {})
+    writer = IndexWriter(tmp_path, build_index("hnsw", 4, params))
+    writer.add(np.eye(4, dtype=np.float32), [Document(page_content=str(i)) for i in range(4)])
+    writer.commit({"index_type": "hnsw", "index_params": params})
+
+    IndexWriter.update(tmp_path, remove=[0, 2]).commit({"index_type": "hnsw", "index_params": params})
+
+    store = MmapIndex(tmp_path)
+    assert len(store) == 2
+    assert store.search([[0.0, 0.0, 0.0, 1.0]], k=1)[0][0][0].page_content == "3"
+
+
+def test_checkpoint_resumes_into_target(tmp_path):
+    index_path = tmp_path / "index"
+    writer = IndexWriter(index_path, faiss.IndexFlatL2(3))
+    writer.add(np.eye(3, dtype=np.float32)[:2], [Document(page_content="a"), Document(page_content="b")])
+    assert writer.checkpoint(manifest={"files": {}})
+    writer.add(np.eye(3, dtype=np.float32)[2:], [Document(page_content="c")])
+    assert writer.checkpoint()
+    writer.abort()
+
+    # Прерванный запуск ничего не публикует, но оставляет контрольную точку
+    assert not is_mmap_index(index_path)
+    checkpoint = find_checkpoint(index_path)
+    assert checkpoint == checkpoint_path(index_path)
+
+    resumed = IndexWriter.update(checkpoint, remove=[2], target=index_path)
+    resumed.commit()
+    remove_checkpoint(index_path)
+
+    store = MmapIndex(index_path)
+    assert len(store) == 2
+    assert store.get(1).page_content == "b"
+    assert find_checkpoint(index_path) is None
+
+
+def test_later_checkpoints_link_snapshot_and_log_new_vectors(tmp_path):
+    index_path = tmp_path / "index"
+    writer = IndexWriter(index_path, faiss.IndexFlatL2(4))
+    vectors = np.eye(4, dtype=np.float32)
+    writer.add(vectors[:2], [Document(page_content=str(i)) for i in range(2)])
+    assert writer.checkpoint()
+    snapshot = (checkpoint_path(index_path) / "index.faiss").stat().st_ino
+    writer.add(vectors[2:], [Document(page_content=str(i)) for i in range(2, 4)])
+    assert writer.checkpoint()
+
+    checkpoint = checkpoint_path(index_path)
+    # Снимок и records.bin не копируются заново, новые векторы - в журнале
+    assert (checkpoint / "index.faiss").stat().st_ino == snapshot
+    assert (checkpoint / "records.bin").stat().st_ino == (writer.staging / "records.bin").stat().st_ino
+    assert json.loads((checkpoint / "meta.json").read_text())["log_rows"] == 2
+    writer.abort()
+
+    IndexWriter.update(checkpoint, target=index_path).commit()
+    store = MmapIndex(index_path)
+    assert len(store) == 4
+    assert store.search([vectors[3]], k=1)[0][0][0].page_content == "3"
+    assert not (index_path / "vectors.log").exists()
+
+
+def test_holder_hot_swaps_published_versions_and_collects_old(tmp_path):
+    first = tmp_path / "versions" / "0001"
+    _write(first, count=2)
+    publish_version(tmp_path, first)
+    holder = VectorStoreHolder(tmp_path, check_interval=0, gc_grace=0)
+    old = holder.get()
+    assert len(old) == 2 and holder.stats()["version"] == "0001"
+
+    second = tmp_path / "versions" / "0002"
+    _write(second, count=3)
+    publish_version(tmp_path, second)
+
+    assert holder.get() is old
+    assert holder.wait_reload(timeout=10)
+    assert len(holder.get()) == 3
+    assert holder.stats()["version"] == "0002"
+    # Старая версия удалена с диска, но уже выданное хранилище продолжает отвечать
+    assert not first.exists()
+    assert old.get(1).page_content == "текст 1"
+
+
+def test_gc_keeps_current_and_recent_versions(tmp_path):
+    for name in ("a", "b", "c"):
+        _write(tmp_path / "versions" / name)
+    publish_version(tmp_path, tmp_path / "versions" / "b")
+
+    assert gc_versions(tmp_path, grace_seconds=3600) == []
+    assert gc_versions(tmp_path, grace_seconds=0) == ["a"]
+    assert sorted(p.name for p in (tmp_path / "versions").iterdir()) == ["b", "c"]
+    assert new_version_path(tmp_path).parent == tmp_path / "versions"
@@ -0,0 +1,117 @@
+# tests/test_ingest_embedder.py
+import asyncio
+import random
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.app.services.ingest_embedder import (
+    ConcurrentEmbedder,
+    EmbeddingFailed,
+    TokenBucket,
+    batch_by_tokens,
+)
+
+
+def _docs(count, tokens=10):
+    return [Document(page_content=str(i), metadata={"tokens": tokens}) for i in range(count)]
+
+
+class FlakyEmbeddings(Embeddings):
+    """Отвечает со случайной задержкой и падает на первых `failures` вызовах"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    def embed_documents(self, texts):
+        return [[float(t)] for t in texts]
+
+    def embed_query(self, text):
+        return [float(text)]
+
+    async def aembed_documents(self, texts):
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(random.random() * 0.01)
+            if self.failures > 0:
+                self.failures -= 1
+                raise ConnectionError("timeout")
+            return self.embed_documents(texts)
+        finally:
+            self.active -= 1
+
+
+def _collect(embedder, batches):
+    async def run():
+        return [item async for item in embedder.embed_stream(batches)]
+    return asyncio.run(run())
+
+
+def test_batch_by_tokens_respects_limits():
+    batches = list(batch_by_tokens(_docs(10), max_tokens=35, max_items=100))
+    assert [len(b) for b in batches] == [3, 3, 3, 1]
+
+    batches = list(batch_by_tokens(_docs(5), max_tokens=1000, max_items=2))
+    assert [len(b) for b in batches] == [2, 2, 1]
+
+
+def test_results_keep_batch_order_with_concurrency():
+    fake = FlakyEmbeddings()
+    embedder = ConcurrentEmbedder(fake, concurrency=4)
+    batches = list(batch_by_tokens(_docs(40), max_tokens=30))
+
+    results = _collect(embedder, batches)
+
+    flattened = [float(v[0]) for _, vectors in results for v in vectors]
+    assert flattened == [float(i) for i in range(40)]
+    assert fake.max_active > 1
+    assert embedder.stats["chunks"] == 40
+
+
+def test_busy_time_counts_concurrent_requests_once():
+    class SlowEmbeddings(FlakyEmbeddings):
+        async def aembed_documents(self, texts):
+            await asyncio.sleep(0.05)
+            return self.embed_documents(texts)
+
+    embedder = ConcurrentEmbedder(SlowEmbeddings(), concurrency=4)
+
+    _collect(embedder, [_docs(1) for _ in range(8)])
+
+    # Сумма длительностей - около 8 запросов, время работы - около двух волн по 4
+    assert embedder.stats["seconds"] >= 0.4
+    assert embedder.stats["busy_seconds"] < embedder.stats["seconds"] / 2
+
+
+def test_failed_batch_is_retried():
+    fake = FlakyEmbeddings(failures=2)
+    embedder = ConcurrentEmbedder(fake, concurrency=1, base_delay=0)
+
+    results = _collect(embedder, [_docs(3)])
+
+    assert len(results[0][1]) == 3
+    assert embedder.stats["retries"] == 2
+
+
+def test_exhausted_retries_raise_instead_of_dropping():
+    embedder = ConcurrentEmbedder(FlakyEmbeddings(failures=10), max_retries=1, base_delay=0)
+    with pytest.raises(EmbeddingFailed):
+        _collect(embedder, [_docs(3)])
+
+
+def test_token_bucket_paces_requests():
+    async def run():
+        bucket = TokenBucket(per_minute=600)  # 10 в секунду
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await bucket.acquire(600)
+        await bucket.acquire(2)
+        return loop.time() - started
+
+    assert asyncio.run(run()) >= 0.15
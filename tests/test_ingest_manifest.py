@@ -0,0 +1,46 @@
+# tests/test_ingest_manifest.py
+import json
+
+from src.app.services.ingest_manifest import Manifest, file_sha256, scan_documents
+
+
+def test_diff_detects_added_changed_removed():
+    manifest = Manifest({}, {
+        "a.pdf": {"sha256": "1", "chunk_ids": [0, 1]},
+        "b.pdf": {"sha256": "2", "chunk_ids": [2]},
+        "c.pdf": {"sha256": "3", "chunk_ids": [3, 4]},
+    })
+
+    diff = manifest.diff({"a.pdf": "1", "b.pdf": "changed", "d.pdf": "4"})
+
+    assert diff == {
+        "added": ["d.pdf"],
+        "changed": ["b.pdf"],
+        "removed": ["c.pdf"],
+        "unchanged": ["a.pdf"],
+    }
+    assert manifest.chunk_ids(diff["changed"] + diff["removed"]) == [2, 3, 4]
+
+
+def test_incomplete_file_is_reprocessed():
+    manifest = Manifest({})
+    manifest.record("a.pdf", None, [0])
+    assert manifest.diff({"a.pdf": "1"})["changed"] == ["a.pdf"]
+
+
+def test_load_roundtrip_and_scan(tmp_path):
+    (tmp_path / "doc.txt").write_text("текст", encoding="utf-8")
+    (tmp_path / "image.png").write_bytes(b"\x89PNG")
+
+    files = scan_documents(tmp_path, {".txt", ".pdf"})
+    assert list(files) == ["doc.txt"]
+
+    manifest = Manifest({"chunk_size": 1000})
+    manifest.record("doc.txt", file_sha256(files["doc.txt"]), [7])
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps(manifest.to_dict()), encoding="utf-8")
+
+    loaded = Manifest.load(path)
+    assert loaded.settings == {"chunk_size": 1000}
+    assert loaded.diff({"doc.txt": file_sha256(files["doc.txt"])})["unchanged"] == ["doc.txt"]
+    assert Manifest.load(tmp_path / "missing.json") is None
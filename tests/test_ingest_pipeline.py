@@ -0,0 +1,234 @@
+# tests/test_ingest_pipeline.py
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.app.services.document_loader import load_document
+from src.app.services.index_store import IndexWriter, MmapIndex
+from src.app.services.index_types import build_index
+from src.app.services.ingest_embedder import ConcurrentEmbedder
+from src.app.services.ingest_metrics import IngestMetrics
+from src.app.services.ingest_pipeline import (
+    IngestPipeline,
+    ParallelLoader,
+    drop_sources,
+    threaded_iter,
+)
+
+
+def test_threaded_iter_is_bounded_and_ordered():
+    produced = []
+
+    def source():
+        for i in range(10):
+            produced.append(i)
+            yield i
+
+    async def run():
+        items = threaded_iter(source(), maxsize=2)
+        first = await items.__anext__()
+        await asyncio.sleep(0.05)
+        # Производитель опередил потребителя не больше чем на буфер (+1 ожидающий)
+        ahead = len(produced)
+        rest = [item async for item in items]
+        return first, ahead, rest
+
+    first, ahead, rest = asyncio.run(run())
+    assert first == 0
+    assert ahead <= 4
+    assert rest == list(range(1, 10))
+
+
+def _load(path: Path):
+    if path.name == "broken.txt":
+        raise IOError("не читается")
+    return [Document(page_content=path.read_text(), metadata={"source": str(path)})]
+
+
+def _crashing_load(path: Path):
+    if path.name == "crash.txt":
+        # Процесс пула умирает, как при OOM
+        os._exit(1)
+    return _load(path)
+
+
+def _split(docs):
+    return [
+        Document(page_content=word, metadata={**doc.metadata, "tokens": 1})
+        for doc in docs
+        for word in doc.page_content.split()
+    ]
+
+
+def _split_parts(docs):
+    return [
+        Document(page_content=part, metadata={**doc.metadata, "tokens": 1})
+        for doc in docs
+        for part in doc.page_content.split("|")
+    ]
+
+
+def test_pipeline_builds_index_and_tracks_files(tmp_path):
+    files = {}
+    for name, text in [("a.txt", "alpha beta gamma"), ("broken.txt", "x"), ("b.txt", "delta epsilon")]:
+        files[name] = tmp_path / name
+        files[name].write_text(text)
+
+    embedder = ConcurrentEmbedder(DeterministicFakeEmbedding(size=8), concurrency=2)
+    metrics = IngestMetrics()
+    pipeline = IngestPipeline(_load, _split, embedder, batch_tokens=2, buffer_size=1, metrics=metrics)
+    index_path = tmp_path / "index"
+
+    writer = asyncio.run(pipeline.run(
+        files, create_writer=lambda dim: IndexWriter(index_path, build_index("flat", dim, {}))
+    ))
+    writer.commit()
+
+    assert pipeline.failed.keys() == {"broken.txt"}
+    assert len(pipeline.added_ids["a.txt"]) == 3
+    assert len(pipeline.added_ids["b.txt"]) == 2
+    assert pipeline.stats["batches"] == 3
+
+    index = MmapIndex(index_path)
+    assert len(index) == 5
+    doc = index.get(pipeline.added_ids["b.txt"][0])
+    assert doc.page_content == "delta"
+    assert "_file" not in doc.metadata
+
+    report = metrics.write(tmp_path / "reports" / "run.json", status="ok")
+    stages = report["stages"]
+    assert stages["load"]["calls"] == 2
+    assert stages["load"]["bytes"] == files["a.txt"].stat().st_size + files["b.txt"].stat().st_size
+    assert stages["split"]["items"] == stages["split"]["tokens"] == 5
+    assert stages["embed"]["calls"] == 3 and stages["embed"]["items"] == 5
+    assert stages["add"]["items"] == 5
+    assert report["peak_rss_mb"] > 0
+    assert (tmp_path / "reports" / "run.json").exists()
+
+
+def test_parallel_loader_reads_pdf_pages_in_order(tmp_path):
+    import fitz
+
+    files = {}
+    for n in range(3):
+        pdf = fitz.open()
+        for page in range(2):
+            pdf.new_page().insert_text((72, 72), f"file {n} page {page + 1}")
+        files[f"{n}.pdf"] = tmp_path / f"{n}.pdf"
+        pdf.save(files[f"{n}.pdf"])
+    files["broken.pdf"] = tmp_path / "broken.pdf"
+    files["broken.pdf"].write_bytes(b"not a pdf")
+
+    loader = ParallelLoader(workers=2)
+    results = list(loader(files, load_document))
+
+    assert [name for name, _, _ in results] == list(files)
+    name, docs, error = results[1]
+    assert error is None
+    assert [d.metadata["page"] for d in docs] == [1, 2]
+    assert docs[1].page_content == "file 1 page 2"
+    assert results[-1][1] is None and results[-1][2] is not None
+    assert loader.stats["files"] == 3
+    assert loader.stats["pages"] == 6
+
+
+def test_parallel_loader_survives_crashed_worker(tmp_path):
+    files = {}
+    for name in ["crash.txt"] + [f"{n}.txt" for n in range(6)]:
+        files[name] = tmp_path / name
+        files[name].write_text(name)
+
+    loader = ParallelLoader(workers=2)
+    results = list(loader(files, _crashing_load))
+
+    # Файлы упавшего пула отмечены ошибкой, остальные прочитаны новым пулом
+    assert [name for name, _, _ in results] == list(files)
+    assert results[0][2] is not None
+    assert results[-1][1][0].page_content == "5.txt"
+    assert loader.stats["restarts"] == 1
+
+
+def test_loader_counts_cpu_time_not_waiting(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("alpha")
+
+    def slow_load(path: Path):
+        time.sleep(0.2)
+        return _load(path)
+
+    loader = ParallelLoader(workers=1)
+    results = list(loader({"a.txt": path}, slow_load))
+
+    assert results[0][1][0].page_content == "alpha"
+    assert loader.stats["seconds"] >= 0.2
+    assert loader.stats["cpu_seconds"] < 0.1
+
+
+def test_pipeline_embeds_duplicate_chunks_once_and_merges_sources(tmp_path):
+    files = {}
+    for name, text in [("a.txt", "общий колонтитул|alpha"), ("b.txt", "общий  колонтитул|beta")]:
+        files[name] = tmp_path / name
+        files[name].write_text(text)
+
+    embedder = ConcurrentEmbedder(DeterministicFakeEmbedding(size=8), concurrency=2)
+    pipeline = IngestPipeline(_load, _split_parts, embedder, batch_tokens=1)
+    index_path = tmp_path / "index"
+
+    writer = asyncio.run(pipeline.run(
+        files, create_writer=lambda dim: IndexWriter(index_path, build_index("flat", dim, {}))
+    ))
+
+    assert pipeline.stats["duplicates"] == 1
+    assert embedder.stats["chunks"] == 3
+    shared = pipeline.added_ids["a.txt"][0]
+    assert pipeline.added_ids["b.txt"][0] == shared
+    sources = writer.read_record(shared).metadata["sources"]
+    assert [s["source"] for s in sources] == [str(files["a.txt"]), str(files["b.txt"])]
+
+    # Файл a удален: общая часть остается, но ссылается только на b
+    drop_sources(writer, [shared], [str(files["a.txt"])])
+    writer.commit()
+    doc = MmapIndex(index_path).get(shared)
+    assert doc.metadata["source"] == str(files["b.txt"])
+    assert len(doc.metadata["sources"]) == 1
+
+
+def test_failure_after_add_keeps_previous_checkpoint(tmp_path):
+    files = {}
+    for name, text in [("a.txt", "alpha beta"), ("b.txt", "gamma")]:
+        files[name] = tmp_path / name
+        files[name].write_text(text)
+
+    class InterruptedWriter(IndexWriter):
+        def add(self, vectors, docs):
+            ids = super().add(vectors, docs)
+            if self.count == 3:
+                # Векторы и записи уже в writer'е, ID не успели разнести по файлам
+                raise KeyboardInterrupt
+            return ids
+
+    checkpoints = []
+
+    def checkpoint(writer, completed):
+        checkpoints.append((writer.count, completed))
+        return True
+
+    embedder = ConcurrentEmbedder(DeterministicFakeEmbedding(size=8), concurrency=1)
+    pipeline = IngestPipeline(
+        _load, _split, embedder, batch_tokens=1, checkpoint=checkpoint, checkpoint_every=1
+    )
+    index_path = tmp_path / "index"
+
+    with pytest.raises(KeyboardInterrupt):
+        asyncio.run(pipeline.run(
+            files,
+            create_writer=lambda dim: InterruptedWriter(index_path, build_index("flat", dim, {})),
+        ))
+
+    # Последняя точка - после второго батча, без части из незавершенного
+    assert checkpoints == [(1, []), (2, ["a.txt"])]
@@ -0,0 +1,41 @@
+# tests/test_openai_client.py
+import asyncio
+
+from src.app.core import openai_client
+from src.app.core.openai_client import SharedResource, close_openai_client, get_openai_client
+
+
+def test_shared_client_is_created_once_and_recreated_after_close():
+    async def run():
+        first = get_openai_client()
+        same = get_openai_client()
+        embeddings = SharedResource("embeddings")
+        create_before = embeddings.create
+        await close_openai_client()
+        second = get_openai_client()
+        create_after = embeddings.create
+        await close_openai_client()
+        return first, same, second, create_before, create_after
+
+    first, same, second, create_before, create_after = asyncio.run(run())
+
+    assert first is same
+    assert second is not first
+    assert first.is_closed()
+    # Ресурс всегда ведет к текущему клиенту, а не к закрытому
+    assert create_before.__self__._client is first
+    assert create_after.__self__._client is second
+    assert openai_client._client is None
+
+
+def test_client_uses_configured_pool_and_timeouts():
+    client = openai_client.create_openai_client(api_key="sk-test")
+    settings = openai_client.settings
+
+    pool = client._client._transport._pool
+    assert pool._max_connections == settings.openai_max_connections
+    assert pool._max_keepalive_connections == settings.openai_max_keepalive_connections
+    assert client.timeout.connect == settings.openai_connect_timeout
+    assert client.timeout.read == settings.openai_timeout
+    assert client.max_retries == settings.openai_max_retries
+    asyncio.run(client.close())
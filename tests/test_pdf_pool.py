@@ -0,0 +1,55 @@
+# tests/test_pdf_pool.py
+import asyncio
+
+import fitz
+
+from src.app.services.pdf_pool import PDFWorkerPool
+from src.app.services.pdf_processor import process_pdf_file
+
+
+def _make_pdf(path, pages):
+    pdf = fitz.open()
+    for page in range(pages):
+        pdf.new_page().insert_text((72, 72), f"page {page + 1}")
+    pdf.save(path)
+
+
+def test_pool_parses_pdfs_without_blocking_loop(tmp_path):
+    paths = []
+    for n in range(3):
+        paths.append(str(tmp_path / f"{n}.pdf"))
+        _make_pdf(paths[-1], pages=n + 1)
+    (tmp_path / "broken.pdf").write_bytes(b"%PDF-1.7 broken")
+    paths.append(str(tmp_path / "broken.pdf"))
+
+    pool = PDFWorkerPool(workers=2)
+    ticks = 0
+
+    async def ticker(done):
+        nonlocal ticks
+        while not done.is_set():
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    async def run():
+        pool.start()
+        done = asyncio.Event()
+        task = asyncio.create_task(ticker(done))
+        results = await asyncio.gather(*(pool.run(process_pdf_file, p) for p in paths))
+        done.set()
+        await task
+        return results
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+    assert [r["validation"]["valid"] for r in results] == [True, True, True, False]
+    assert results[2]["conversion"]["metadata"]["total_pages"] == 3
+    assert "page 3" in results[2]["conversion"]["text"]
+    assert results[3]["conversion"] is None
+    assert pool.stats["completed"] == 4 and pool.stats["in_flight"] == 0
+    # Пока воркеры разбирали файлы, event loop продолжал работать
+    assert ticks > 1
+    assert not pool.started
@@ -0,0 +1,46 @@
+# tests/test_pdf_processor.py
+import fitz
+
+from src.app.services import pdf_processor
+from src.app.services.pdf_processor import PDFProcessor
+
+
+def test_analyze_opens_once_and_matches_separate_calls(tmp_path, monkeypatch):
+    path = str(tmp_path / "doc.pdf")
+    pdf = fitz.open()
+    for page in range(7):
+        pdf.new_page(width=300 + page).insert_text((72, 72), f"страница {page + 1}\n\n\n  текст  ")
+    pdf.set_metadata({"title": "Отчет", "author": "Автор"})
+    pdf.save(path)
+
+    processor = PDFProcessor()
+    expected = {
+        "validation": processor.validate_pdf(path),
+        "pdf_info": processor.get_pdf_info(path),
+        "conversion": processor.extract_text_from_pdf(path),
+    }
+
+    opened = []
+    original_open = pdf_processor.fitz.open
+
+    def counting_open(*args, **kwargs):
+        opened.append(args)
+        return original_open(*args, **kwargs)
+
+    monkeypatch.setattr(pdf_processor.fitz, "open", counting_open)
+    result = processor.analyze(path)
+
+    assert len(opened) == 1
+    assert result == expected
+    assert len(result["pdf_info"]["page_sizes"]) == 5
+
+
+def test_analyze_invalid_pdf(tmp_path):
+    path = tmp_path / "broken.pdf"
+    path.write_bytes(b"%PDF-1.7 broken")
+
+    result = PDFProcessor().analyze(str(path))
+
+    assert result["validation"]["valid"] is False
+    assert result["validation"]["error"].startswith("Невалидный PDF файл")
+    assert result["pdf_info"] is None and result["conversion"] is None
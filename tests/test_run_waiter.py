@@ -0,0 +1,193 @@
+# tests/test_run_waiter.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.app.services import run_waiter as run_waiter_module
+from src.app.services.run_waiter import RunWaiter
+
+
+def make_delta(text):
+    return SimpleNamespace(delta=SimpleNamespace(content=[SimpleNamespace(text=SimpleNamespace(value=text))]))
+
+
+def make_run(status, created_at=100, started_at=None):
+    return SimpleNamespace(
+        id="run_1", assistant_id="asst", status=status, created_at=created_at, started_at=started_at
+    )
+
+
+class FakeStream:
+    def __init__(self, events, fail_after=None):
+        self.events = events
+        self.fail_after = fail_after
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def __aiter__(self):
+        for n, (name, data) in enumerate(self.events):
+            if n == self.fail_after:
+                raise ConnectionError("stream closed")
+            await asyncio.sleep(0.01)
+            yield SimpleNamespace(event=name, data=data)
+
+
+class FakeRuns:
+    def __init__(self, stream=None, statuses=(), listed=()):
+        self.stream = stream
+        self.statuses = list(statuses)
+        self.listed = list(listed)
+        self.calls = []
+
+    async def create(self, thread_id, assistant_id, stream=False, **params):
+        self.calls.append(("create", stream))
+        if stream:
+            if self.stream is None:
+                raise ConnectionError("no streaming")
+            return self.stream
+        return make_run("queued")
+
+    async def retrieve(self, thread_id, run_id):
+        self.calls.append(("retrieve", run_id))
+        return make_run(self.statuses.pop(0), started_at=101)
+
+    async def list(self, thread_id, limit, order):
+        self.calls.append(("list", thread_id))
+        return SimpleNamespace(data=self.listed)
+
+    async def cancel(self, thread_id, run_id):
+        self.calls.append(("cancel", run_id))
+
+
+def waiter_with(monkeypatch, runs):
+    client = SimpleNamespace(beta=SimpleNamespace(threads=SimpleNamespace(runs=runs)))
+    monkeypatch.setattr(run_waiter_module, "get_openai_client", lambda: client)
+    monkeypatch.setattr(run_waiter_module.settings, "assistant_poll_initial", 0.01)
+    monkeypatch.setattr(run_waiter_module.settings, "assistant_poll_max", 0.02)
+    return RunWaiter()
+
+
+def test_stream_events_complete_run_without_polling(monkeypatch):
+    runs = FakeRuns(stream=FakeStream([
+        ("thread.run.created", make_run("queued")),
+        ("thread.run.queued", make_run("queued")),
+        ("thread.run.in_progress", make_run("in_progress")),
+        ("thread.message.delta", make_delta("При")),
+        ("thread.message.delta", make_delta("вет")),
+        ("thread.run.step.completed", None),
+        ("thread.run.completed", make_run("completed")),
+    ]))
+    waiter = waiter_with(monkeypatch, runs)
+    deltas = []
+
+    wait = asyncio.run(waiter.run("thread_1", "asst", timeout=5, on_delta=deltas.append))
+    timings = wait.timings()
+
+    assert wait.run.status == "completed"
+    assert deltas == ["При", "вет"]
+    assert 0 < timings["first_delta_seconds"] < timings["total_seconds"]
+    assert runs.calls == [("create", True)]
+    assert timings["mode"] == "stream" and timings["polls"] == 0
+    assert timings["queued_seconds"] > 0 and timings["run_seconds"] > 0
+    assert waiter.stats["stream"] == 1
+
+
+def test_falls_back_to_polling_the_same_run(monkeypatch):
+    runs = FakeRuns(
+        stream=FakeStream([("thread.run.created", make_run("queued")), ("thread.run.completed", None)], fail_after=1),
+        statuses=["queued", "completed"],
+    )
+    waiter = waiter_with(monkeypatch, runs)
+
+    wait = asyncio.run(waiter.run("thread_1", "asst", timeout=5))
+
+    # Run не создается заново - опрашивается тот, что успел прийти из потока
+    assert runs.calls == [("create", True), ("retrieve", "run_1"), ("retrieve", "run_1")]
+    assert wait.run.status == "completed"
+    # Переход в in_progress опрос не застал - очередь считается по отметкам сервера
+    assert wait.timings()["mode"] == "poll"
+    assert wait.timings()["queued_seconds"] <= 1
+
+
+def test_stream_lost_before_first_event_polls_existing_run(monkeypatch):
+    runs = FakeRuns(
+        stream=FakeStream([("thread.run.created", make_run("queued"))], fail_after=0),
+        statuses=["completed"],
+        listed=[make_run("in_progress")],
+    )
+    waiter = waiter_with(monkeypatch, runs)
+
+    wait = asyncio.run(waiter.run("thread_1", "asst", timeout=5))
+
+    # Run уже создан сервером - второй не создается
+    assert runs.calls == [("create", True), ("list", "thread_1"), ("retrieve", "run_1")]
+    assert wait.run.status == "completed"
+
+
+def test_stream_unavailable_creates_run_once(monkeypatch):
+    runs = FakeRuns(statuses=["completed"])
+    waiter = waiter_with(monkeypatch, runs)
+
+    wait = asyncio.run(waiter.run("thread_1", "asst", timeout=5))
+
+    assert runs.calls == [
+        ("create", True), ("list", "thread_1"), ("create", False), ("retrieve", "run_1"),
+    ]
+    assert wait.run.status == "completed"
+
+
+def test_timeout_cancels_the_run(monkeypatch):
+    runs = FakeRuns(statuses=["in_progress"] * 100)
+    waiter = waiter_with(monkeypatch, runs)
+    waiter.use_stream = False
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(waiter.run("thread_1", "asst", timeout=0.1))
+
+    assert runs.calls[0] == ("create", False)
+    assert runs.calls[-1] == ("cancel", "run_1")
+    assert waiter.stats["timeouts"] == 1
+
+
+def test_requires_action_run_is_cancelled(monkeypatch):
+    runs = FakeRuns(stream=FakeStream([
+        ("thread.run.created", make_run("queued")),
+        ("thread.run.requires_action", make_run("requires_action")),
+    ]))
+    waiter = waiter_with(monkeypatch, runs)
+
+    wait = asyncio.run(waiter.run("thread_1", "asst", timeout=5))
+
+    # Вызовы функций не выполняются - run отменяется, чтобы не держать thread
+    assert wait.run.status == "requires_action"
+    assert runs.calls == [("create", True), ("cancel", "run_1")]
+
+def test_stream_assistant_relays_deltas_then_full_reply(monkeypatch):
+    from src.app.services.assistant_service import CFAnatolikService
+
+    service = CFAnatolikService()
+
+    async def ask_assistant(message, thread_id=None, on_delta=None):
+        for text in ("Отв", "ет"):
+            await asyncio.sleep(0.01)
+            on_delta(text)
+        await asyncio.sleep(0.05)
+        return {"success": True, "content": "Ответ", "thread_id": thread_id}
+
+    monkeypatch.setattr(service, "ask_assistant", ask_assistant)
+
+    async def run():
+        return [event async for event in service.stream_assistant("вопрос", "main", heartbeat=0.02)]
+
+    events = [event for event in asyncio.run(run()) if event is not None]
+
+    assert events == [
+        {"event": "delta", "text": "Отв"},
+        {"event": "delta", "text": "ет"},
+        {"event": "done", "success": True, "content": "Ответ", "thread_id": "main"},
+    ]
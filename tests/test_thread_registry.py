@@ -0,0 +1,44 @@
+# tests/test_thread_registry.py
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.app.db.base import Base
+from src.app.services.thread_registry import ThreadRegistry
+
+
+def test_thread_is_created_once_and_survives_restart(tmp_path):
+    created = []
+
+    async def create():
+        await asyncio.sleep(0.01)
+        created.append(f"thread_{len(created) + 1}")
+        return created[-1]
+
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite3'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+        registry = ThreadRegistry(factory, max_size=1)
+        # Одновременные первые сообщения получают один thread
+        first = await asyncio.gather(*(registry.resolve("t1", create) for _ in range(3)))
+        other = await registry.resolve("t2", create)
+        # t1 вытеснен из кэша (max_size=1) и читается из БД
+        again = await registry.resolve("t1", create)
+        # Новый процесс: кэш пуст, соответствие берется из БД
+        restarted = await ThreadRegistry(factory).resolve("t1", create)
+        await registry.forget("t1")
+        recreated = await registry.resolve("t1", create)
+        await engine.dispose()
+        return first, other, again, restarted, recreated
+
+    first, other, again, restarted, recreated = asyncio.run(run())
+
+    assert first == ["thread_1"] * 3
+    assert other == "thread_2"
+    assert again == restarted == "thread_1"
+    assert recreated == "thread_3"
+    assert created == ["thread_1", "thread_2", "thread_3"]
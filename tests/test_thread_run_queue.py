@@ -0,0 +1,113 @@
+# tests/test_thread_run_queue.py
+import asyncio
+
+import pytest
+
+from src.app.services.assistant_service import ThreadBusy, ThreadRunQueue
+
+
+def make_execute(batches, delay=0.05):
+    async def execute(messages, on_delta):
+        batches.append(messages)
+        on_delta(messages[-1])
+        await asyncio.sleep(delay)
+        return {"success": True, "content": " + ".join(messages)}
+    return execute
+
+
+def test_runs_are_serialized_and_waiting_messages_merged():
+    queue = ThreadRunQueue(max_pending=5)
+    batches, deltas = [], []
+    execute = make_execute(batches)
+
+    async def run():
+        first = asyncio.ensure_future(queue.submit("t1", "a", None, execute))
+        await asyncio.sleep(0.01)
+        # Пока идет run с "a", приходят еще два сообщения
+        rest = [asyncio.ensure_future(queue.submit("t1", m, deltas.append, execute)) for m in ("b", "c")]
+        return await asyncio.gather(first, *rest)
+
+    a, b, c = asyncio.run(run())
+
+    assert batches == [["a"], ["b", "c"]]
+    assert a["content"] == "a" and not a["duplicate_reply"]
+    assert b["content"] == c["content"] == "b + c"
+    assert b["duplicate_reply"] and not c["duplicate_reply"]
+    assert deltas == ["c", "c"]
+    assert queue.stats == {"runs": 2, "merged": 1, "rejected": 0}
+    assert not queue.busy("t1")
+
+
+def test_full_queue_rejects_without_blocking_other_threads():
+    queue = ThreadRunQueue(max_pending=1)
+    batches = []
+    slow = make_execute(batches, delay=0.3)
+    fast = make_execute(batches, delay=0)
+
+    async def run():
+        running = asyncio.ensure_future(queue.submit("t1", "a", None, slow))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.ensure_future(queue.submit("t1", "b", None, slow))
+        await asyncio.sleep(0)
+        with pytest.raises(ThreadBusy):
+            await queue.submit("t1", "c", None, slow)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        other = await queue.submit("t2", "x", None, fast)
+        other_seconds = loop.time() - started
+        await asyncio.gather(running, waiting)
+        return other, other_seconds
+
+    other, other_seconds = asyncio.run(run())
+
+    assert other["content"] == "x"
+    assert other_seconds < 0.1
+    assert queue.stats["rejected"] == 1
+
+
+def test_run_is_cancelled_when_nobody_waits_for_it():
+    queue = ThreadRunQueue()
+
+    async def run():
+        stopped = asyncio.Event()
+
+        async def execute(messages, on_delta):
+            try:
+                await asyncio.sleep(10)
+            finally:
+                stopped.set()
+
+        waiter = asyncio.ensure_future(queue.submit("t1", "a", None, execute))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.wait_for(stopped.wait(), 1)
+        await asyncio.sleep(0)
+        return queue.busy("t1")
+
+    assert asyncio.run(run()) is False
+
+
+def test_shared_thread_id_bypasses_queue_and_registry(monkeypatch):
+    from src.app.services.assistant_service import CFAnatolikService
+
+    service = CFAnatolikService()
+    calls = []
+
+    async def ask(messages, thread_id, on_delta):
+        calls.append((messages, thread_id))
+        await asyncio.sleep(0.01)
+        return {"success": True, "content": "ok"}
+
+    monkeypatch.setattr(service, "_ask", ask)
+
+    async def run():
+        return await asyncio.gather(*(
+            service.ask_assistant(f"вопрос {n}", "main") for n in range(3)
+        ))
+
+    results = asyncio.run(run())
+
+    # Разные клиенты с общим ID не сливаются в один run и один thread
+    assert all(result["success"] for result in results)
+    assert sorted(calls) == [([f"вопрос {n}"], None) for n in range(3)]
+    assert not service.thread_queues.busy("main")
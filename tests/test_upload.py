@@ -35,7 +35,7 @@ async def test_upload():
         print(f"✅ Успешно загружено {result['total_chunks']} чанков")
         
         # Проверяем информацию о Vector Store
-        info = vector_service.get_vector_store_info()
+        info = await vector_service.get_vector_store_info()
         print(f"Информация о Vector Store: {info}")
         
     else:
@@ -0,0 +1,63 @@
+# tests/test_upload_jobs.py
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from src.app.services.upload_jobs import DONE, FAILED, JobQueue, QueueFull
+
+
+def test_job_reports_stages_to_watchers():
+    queue = JobQueue(workers=1, max_queued=5)
+
+    async def handler(job):
+        for stage in ("parsed", "uploaded", "indexed"):
+            await asyncio.sleep(0.01)
+            job.advance(stage)
+        return {"ok": True}
+
+    async def run():
+        job = queue.submit(handler, filename="a.pdf")
+        job.advance("received")
+        events = [event async for event in job.watch()]
+        await queue.stop()
+        return job, events
+
+    job, events = asyncio.run(run())
+
+    assert job.status == DONE
+    assert job.result == {"ok": True}
+    assert [e["stage"] for e in events if e["event"] == "stage"] == ["received", "parsed", "uploaded", "indexed"]
+    assert [e["status"] for e in events if e["event"] == "status"] == ["queued", "running", "done"]
+    assert queue.get(job.id).to_dict()["info"] == {"filename": "a.pdf"}
+
+
+def test_queue_is_bounded_and_keeps_errors():
+    queue = JobQueue(workers=1, max_queued=1)
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def slow(job):
+            await gate.wait()
+
+        async def failing(job):
+            raise HTTPException(status_code=422, detail="PDF файл не содержит читаемого текста")
+
+        first = queue.submit(slow)
+        await asyncio.sleep(0)  # воркер забрал первую задачу
+        second = queue.submit(failing)
+        with pytest.raises(QueueFull):
+            queue.submit(slow)
+        gate.set()
+        await queue.wait(first)
+        await queue.wait(second)
+        await queue.stop()
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first.status == DONE
+    assert second.status == FAILED
+    assert second.error_code == 422
+    assert second.error == "PDF файл не содержит читаемого текста"
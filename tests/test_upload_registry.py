@@ -0,0 +1,52 @@
+# tests/test_upload_registry.py
+import asyncio
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.app.db.base import Base
+from src.app.db.models import UploadedFile
+from src.app.services.upload_registry import UploadRegistry
+
+
+def _result(file_id):
+    return {
+        "success": True,
+        "file_id": "local-1",
+        "processing_stats": {"total_pages": 3},
+        "vector_store_result": {"uploaded_files": [{"file_id": file_id, "vector_store_file_id": f"vs-{file_id}"}]},
+    }
+
+
+def test_registry_returns_previous_result_per_vector_store(tmp_path):
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite3'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        registry = UploadRegistry(sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False))
+
+        missing = await registry.lookup("abc", "vs_1")
+        await registry.save("abc", "vs_1", "a.pdf", 100, _result("file-1"))
+        # Повторное сохранение того же файла (гонка процессов) не падает
+        await registry.save("abc", "vs_1", "a.pdf", 100, _result("file-1"))
+        hit = await registry.lookup("abc", "vs_1")
+        # lookup только читает, повтор засчитывает record_hit
+        await registry.record_hit("abc", "vs_1")
+        async with registry.session_factory() as session:
+            entry = (await session.execute(select(UploadedFile))).scalar_one()
+        other_store = await registry.lookup("abc", "vs_2")
+        removed = await registry.forget("file-1")
+        after_delete = await registry.lookup("abc", "vs_1")
+        await engine.dispose()
+        return missing, hit, entry, other_store, removed, after_delete
+
+    missing, hit, entry, other_store, removed, after_delete = asyncio.run(run())
+
+    assert missing is None
+    assert hit == _result("file-1")
+    assert entry.upload_count == 2
+    assert entry.vector_store_file_id == "vs-file-1"
+    assert other_store is None
+    assert removed == 1
+    assert after_delete is None
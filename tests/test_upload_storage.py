@@ -0,0 +1,69 @@
+# tests/test_upload_storage.py
+import asyncio
+import io
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from src.app.core.middleware import BodySizeLimitMiddleware
+from src.app.services.upload_storage import NotPDF, UploadTooLarge, spool_upload
+
+
+class _Stream:
+    """Загрузка без известного размера: отдает данные блоками и считает чтения"""
+
+    def __init__(self, data: bytes):
+        self.buffer = io.BytesIO(data)
+        self.reads = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        self.reads += 1
+        return self.buffer.read(size)
+
+
+def test_spool_copies_in_chunks(tmp_path):
+    data = b"%PDF-1.7\n" + b"x" * 5000
+    upload = _Stream(data)
+
+    size = asyncio.run(spool_upload(upload, tmp_path / "a.pdf", max_bytes=10_000, chunk_size=1024))
+
+    assert size == len(data)
+    assert (tmp_path / "a.pdf").read_bytes() == data
+    assert upload.reads == 6  # 5 блоков данных + пустое чтение в конце
+
+
+def test_spool_rejects_early_and_removes_partial_file(tmp_path):
+    upload = _Stream(b"%PDF-1.7\n" + b"x" * 100_000)
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(spool_upload(upload, tmp_path / "big.pdf", max_bytes=4096, chunk_size=1024))
+    assert upload.reads == 5  # остаток файла не читается
+    assert not (tmp_path / "big.pdf").exists()
+
+    with pytest.raises(NotPDF):
+        asyncio.run(spool_upload(_Stream(b"MZ" + b"x" * 3000), tmp_path / "exe.pdf", max_bytes=10_000))
+    assert not (tmp_path / "exe.pdf").exists()
+
+
+def test_body_limit_middleware_returns_413(tmp_path):
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, limits={"/upload": 2048})
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    client = TestClient(app)
+    ok = client.post("/upload", files={"file": ("a.pdf", b"%PDF-" + b"x" * 100)})
+    assert ok.status_code == 200
+
+    too_large = client.post("/upload", files={"file": ("a.pdf", b"%PDF-" + b"x" * 10_000)})
+    assert too_large.status_code == 413
+
+    # Без Content-Length тело считается по мере поступления
+    def chunks():
+        for _ in range(10):
+            yield b"x" * 1024
+
+    chunked = client.post("/upload", content=chunks(), headers={"content-type": "multipart/form-data; boundary=b"})
+    assert chunked.status_code == 413